@@ -18,19 +18,84 @@ CREATE TABLE IF NOT EXISTS users (
     INDEX idx_role (role)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- Providers Table (dentists and chairs that appointments are booked against)
+CREATE TABLE IF NOT EXISTS providers (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    name VARCHAR(255) NOT NULL,
+    kind ENUM('dentist', 'chair') DEFAULT 'dentist',
+    user_id INT NULL,
+    capacity INT NOT NULL DEFAULT 1,
+    active TINYINT(1) NOT NULL DEFAULT 1,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL,
+    INDEX idx_active (active)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- Appointments Table
 CREATE TABLE IF NOT EXISTS appointments (
     id INT PRIMARY KEY AUTO_INCREMENT,
     user_id INT NOT NULL,
+    provider_id INT NULL,
+    slot_seat TINYINT UNSIGNED NOT NULL DEFAULT 0,
     appointment_date DATETIME NOT NULL,
     status ENUM('scheduled', 'completed', 'cancelled') DEFAULT 'scheduled',
     notes TEXT,
+    -- One live booking per provider seat and slot; cancelled rows release the key
+    slot_key VARCHAR(64) AS (
+        IF(status = 'cancelled', NULL,
+           CONCAT(IFNULL(provider_id, 0), '@', DATE_FORMAT(appointment_date, '%Y-%m-%d %H:%i'), '#', slot_seat))
+    ) STORED,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    UNIQUE KEY uniq_slot_key (slot_key),
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (provider_id) REFERENCES providers(id) ON DELETE SET NULL,
     INDEX idx_user_date (user_id, appointment_date),
     INDEX idx_status (status),
-    INDEX idx_appointment_date (appointment_date)
+    INDEX idx_appointment_date (appointment_date),
+    INDEX idx_provider_date (provider_id, appointment_date)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Sent appointment reminders (one row per appointment and reminder kind)
+CREATE TABLE IF NOT EXISTS appointment_reminders (
+    appointment_id INT NOT NULL,
+    kind ENUM('24h', '2h') NOT NULL,
+    sent_at DATETIME NOT NULL,
+    PRIMARY KEY (appointment_id, kind),
+    FOREIGN KEY (appointment_id) REFERENCES appointments(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Bulk email campaign journal (lets an interrupted campaign resume)
+CREATE TABLE IF NOT EXISTS email_campaign_log (
+    campaign_id VARCHAR(64) NOT NULL,
+    recipient VARCHAR(255) NOT NULL,
+    status ENUM('sent', 'failed') NOT NULL,
+    error VARCHAR(255),
+    updated_at DATETIME NOT NULL,
+    PRIMARY KEY (campaign_id, recipient),
+    INDEX idx_campaign_status (campaign_id, status)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Live booking count per slot and provider (provider_key 0 = unassigned), kept in step with
+-- appointments by the Python service and repaired by slot_reconciler.py
+CREATE TABLE IF NOT EXISTS appointment_slots (
+    slot_start DATETIME NOT NULL,
+    provider_key INT NOT NULL,
+    booked SMALLINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (slot_start, provider_key)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Hourly appointment summary (kept up to date on booking/reschedule; rebuilt by analytics.py backfill)
+CREATE TABLE IF NOT EXISTS appointment_stats_hourly (
+    stat_date DATE NOT NULL,
+    stat_hour TINYINT UNSIGNED NOT NULL,
+    booked INT NOT NULL DEFAULT 0,
+    created INT NOT NULL DEFAULT 0,
+    rescheduled_in INT NOT NULL DEFAULT 0,
+    rescheduled_out INT NOT NULL DEFAULT 0,
+    cancelled INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (stat_date, stat_hour)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Chat Sessions Table
@@ -40,11 +105,13 @@ CREATE TABLE IF NOT EXISTS chat_sessions (
     started_at DATETIME NOT NULL,
     ended_at DATETIME,
     status ENUM('active', 'ended') DEFAULT 'active',
+    archived_at DATETIME NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
     INDEX idx_user_sessions (user_id, started_at),
-    INDEX idx_status (status)
+    INDEX idx_status (status),
+    INDEX idx_status_ended (status, ended_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Chat Messages Table
@@ -57,14 +124,34 @@ CREATE TABLE IF NOT EXISTS chat_messages (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (session_id) REFERENCES chat_sessions(id) ON DELETE CASCADE,
     INDEX idx_session_messages (session_id, timestamp),
+    INDEX idx_session_id (session_id, id),
     INDEX idx_sender (sender)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- Archived chat messages: one zlib-compressed JSON payload per ended session
+CREATE TABLE IF NOT EXISTS chat_message_archives (
+    session_id INT PRIMARY KEY,
+    user_id INT NOT NULL,
+    message_count INT NOT NULL DEFAULT 0,
+    first_message_at DATETIME,
+    last_message_at DATETIME,
+    codec VARCHAR(16) NOT NULL DEFAULT 'zlib-json',
+    payload MEDIUMBLOB NOT NULL,
+    archived_at DATETIME NOT NULL,
+    FOREIGN KEY (session_id) REFERENCES chat_sessions(id) ON DELETE CASCADE,
+    INDEX idx_user_archives (user_id, archived_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- Insert Sample User (for testing)
 INSERT INTO users (name, email, password_hash, role) 
 VALUES ('Test User', 'test@dental.com', 'password123', 'patient')
 ON DUPLICATE KEY UPDATE name=name;
 
+-- Insert Sample Provider (one dentist, one patient per slot)
+INSERT INTO providers (id, name, kind, capacity)
+VALUES (1, 'Dr. Default', 'dentist', 1)
+ON DUPLICATE KEY UPDATE name=name;
+
 -- Verify tables
 SELECT 'Tables created successfully!' as Status;
 SHOW TABLES;
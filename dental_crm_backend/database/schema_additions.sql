@@ -8,11 +8,13 @@ CREATE TABLE IF NOT EXISTS chat_sessions (
     started_at DATETIME NOT NULL,
     ended_at DATETIME,
     status ENUM('active', 'ended') DEFAULT 'active',
+    archived_at DATETIME NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
     INDEX idx_user_sessions (user_id, started_at),
-    INDEX idx_status (status)
+    INDEX idx_status (status),
+    INDEX idx_status_ended (status, ended_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Chat Messages Table
@@ -25,6 +27,7 @@ CREATE TABLE IF NOT EXISTS chat_messages (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (session_id) REFERENCES chat_sessions(id) ON DELETE CASCADE,
     INDEX idx_session_messages (session_id, timestamp),
+    INDEX idx_session_id (session_id, id),
     INDEX idx_sender (sender)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
@@ -36,6 +39,99 @@ ALTER TABLE appointments ADD INDEX IF NOT EXISTS idx_user_date (user_id, appoint
 ALTER TABLE appointments ADD INDEX IF NOT EXISTS idx_status (status);
 ALTER TABLE appointments ADD INDEX IF NOT EXISTS idx_appointment_date (appointment_date);
 
+-- Keyset pagination of chat history on (session_id, id)
+ALTER TABLE chat_messages ADD INDEX IF NOT EXISTS idx_session_id (session_id, id);
+
+-- Session lifecycle / archival
+ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS archived_at DATETIME NULL AFTER status;
+ALTER TABLE chat_sessions ADD INDEX IF NOT EXISTS idx_status_ended (status, ended_at);
+
+-- Archived chat messages: one zlib-compressed JSON payload per ended session
+CREATE TABLE IF NOT EXISTS chat_message_archives (
+    session_id INT PRIMARY KEY,
+    user_id INT NOT NULL,
+    message_count INT NOT NULL DEFAULT 0,
+    first_message_at DATETIME,
+    last_message_at DATETIME,
+    codec VARCHAR(16) NOT NULL DEFAULT 'zlib-json',
+    payload MEDIUMBLOB NOT NULL,
+    archived_at DATETIME NOT NULL,
+    FOREIGN KEY (session_id) REFERENCES chat_sessions(id) ON DELETE CASCADE,
+    INDEX idx_user_archives (user_id, archived_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Providers (dentists/chairs) for capacity-aware scheduling
+CREATE TABLE IF NOT EXISTS providers (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    name VARCHAR(255) NOT NULL,
+    kind ENUM('dentist', 'chair') DEFAULT 'dentist',
+    user_id INT NULL,
+    capacity INT NOT NULL DEFAULT 1,
+    active TINYINT(1) NOT NULL DEFAULT 1,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL,
+    INDEX idx_active (active)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS provider_id INT NULL AFTER user_id;
+ALTER TABLE appointments ADD INDEX IF NOT EXISTS idx_provider_date (provider_id, appointment_date);
+ALTER TABLE appointments ADD CONSTRAINT fk_appointments_provider
+    FOREIGN KEY (provider_id) REFERENCES providers(id) ON DELETE SET NULL;
+
+-- Atomic booking: one live booking per provider seat and slot.
+-- Resolve any existing double bookings before adding the unique key.
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS slot_seat TINYINT UNSIGNED NOT NULL DEFAULT 0 AFTER provider_id;
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS slot_key VARCHAR(64) AS (
+    IF(status = 'cancelled', NULL,
+       CONCAT(IFNULL(provider_id, 0), '@', DATE_FORMAT(appointment_date, '%Y-%m-%d %H:%i'), '#', slot_seat))
+) STORED;
+ALTER TABLE appointments ADD UNIQUE INDEX IF NOT EXISTS uniq_slot_key (slot_key);
+
+-- Sent appointment reminders (one row per appointment and reminder kind)
+CREATE TABLE IF NOT EXISTS appointment_reminders (
+    appointment_id INT NOT NULL,
+    kind ENUM('24h', '2h') NOT NULL,
+    sent_at DATETIME NOT NULL,
+    PRIMARY KEY (appointment_id, kind),
+    FOREIGN KEY (appointment_id) REFERENCES appointments(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Bulk email campaign journal (lets an interrupted campaign resume)
+CREATE TABLE IF NOT EXISTS email_campaign_log (
+    campaign_id VARCHAR(64) NOT NULL,
+    recipient VARCHAR(255) NOT NULL,
+    status ENUM('sent', 'failed') NOT NULL,
+    error VARCHAR(255),
+    updated_at DATETIME NOT NULL,
+    PRIMARY KEY (campaign_id, recipient),
+    INDEX idx_campaign_status (campaign_id, status)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Live booking count per slot and provider (provider_key 0 = unassigned), kept in step with
+-- appointments by the Python service and repaired by slot_reconciler.py
+CREATE TABLE IF NOT EXISTS appointment_slots (
+    slot_start DATETIME NOT NULL,
+    provider_key INT NOT NULL,
+    booked SMALLINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (slot_start, provider_key)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Hourly appointment summary (kept up to date on booking/reschedule; rebuilt by analytics.py backfill)
+CREATE TABLE IF NOT EXISTS appointment_stats_hourly (
+    stat_date DATE NOT NULL,
+    stat_hour TINYINT UNSIGNED NOT NULL,
+    booked INT NOT NULL DEFAULT 0,
+    created INT NOT NULL DEFAULT 0,
+    rescheduled_in INT NOT NULL DEFAULT 0,
+    rescheduled_out INT NOT NULL DEFAULT 0,
+    cancelled INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (stat_date, stat_hour)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Add your dentists/chairs, e.g.:
+-- INSERT INTO providers (name, kind, capacity) VALUES ('Dr. Khan', 'dentist', 1), ('Chair 2', 'chair', 1);
+
 -- Sample data for testing (optional)
 -- Note: Make sure you have users table with at least one user before inserting test data
 
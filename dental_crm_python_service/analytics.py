@@ -0,0 +1,123 @@
+"""Appointment utilisation analytics from the hourly summary table.
+
+appointment_stats_hourly holds one row per (date, hour) with bookings,
+reschedules in/out and cancellations. The Python service updates it in
+the same transaction as each booking and reschedule. A report therefore
+reads at most 24 rows per requested day instead of scanning the
+appointments table.
+
+Appointments changed outside the Python service (e.g. by the Node
+backend) only reach the summary through a backfill, which recomputes
+booked/created/cancelled from appointments for a date range, a month per
+transaction:
+
+    python analytics.py backfill --start 2024-01-01 --end 2026-01-01
+    python analytics.py report --start 2025-10-01 --end 2025-11-01
+"""
+import argparse
+import json
+from datetime import date, timedelta
+
+from scheduling import DEFAULT_PROVIDER, day_slots, parse_appointment_date
+
+BACKFILL_CHUNK_DAYS = 31
+
+
+def hourly_capacity(day, providers):
+    """{hour: bookable seats} for a day: slots in that hour x total provider capacity"""
+    seats = sum(max(int(p.get('capacity') or 1), 1) for p in (providers or [DEFAULT_PROVIDER]))
+    capacity = {}
+    for start in day_slots(day):
+        capacity[start.hour] = capacity.get(start.hour, 0) + seats
+    return capacity
+
+
+def _rate(part, whole):
+    return round(part / whole, 4) if whole else None
+
+
+def utilisation_report(db, start, end):
+    """Bookings, fill rate and reschedule rate per day and hour for [start, end)"""
+    start, end = parse_appointment_date(start), parse_appointment_date(end)
+    providers = db.get_providers()
+    rows = {}
+    for row in db.get_hourly_stats(start, end):
+        rows.setdefault(row['stat_date'], {})[row['stat_hour']] = row
+
+    days = []
+    totals = dict.fromkeys(('booked', 'capacity', 'created', 'rescheduled_in', 'rescheduled_out', 'cancelled'), 0)
+    day = start
+    while day < end:
+        capacity = hourly_capacity(day, providers)
+        stats = rows.get(day, {})
+        hours = []
+        for hour in sorted(set(capacity) | set(stats)):
+            row = stats.get(hour, {})
+            hours.append({
+                'hour': hour,
+                'booked': row.get('booked', 0),
+                'capacity': capacity.get(hour, 0),
+                'fill_rate': _rate(row.get('booked', 0), capacity.get(hour, 0)),
+                'created': row.get('created', 0),
+                'rescheduled_in': row.get('rescheduled_in', 0),
+                'rescheduled_out': row.get('rescheduled_out', 0),
+                'cancelled': row.get('cancelled', 0)
+            })
+        day_totals = {key: sum(h[key] for h in hours) for key in totals}
+        for key in totals:
+            totals[key] += day_totals[key]
+        days.append({
+            'date': day.isoformat(),
+            **day_totals,
+            'fill_rate': _rate(day_totals['booked'], day_totals['capacity']),
+            'hours': hours
+        })
+        day += timedelta(days=1)
+
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        **totals,
+        'fill_rate': _rate(totals['booked'], totals['capacity']),
+        'reschedule_rate': _rate(totals['rescheduled_out'], totals['created']),
+        'cancellation_rate': _rate(totals['cancelled'], totals['created']),
+        'days': days
+    }
+
+
+def backfill(db, start, end, chunk_days=BACKFILL_CHUNK_DAYS):
+    """Rebuild the summary for [start, end) a chunk at a time; yields (chunk_start, chunk_end, rows)"""
+    start, end = parse_appointment_date(start), parse_appointment_date(end)
+    while start < end:
+        chunk_end = min(start + timedelta(days=chunk_days), end)
+        yield start, chunk_end, db.backfill_hourly_stats(start, chunk_end)
+        start = chunk_end
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Appointment utilisation analytics")
+    parser.add_argument('command', choices=('backfill', 'report'))
+    parser.add_argument('--start', required=True, help="YYYY-MM-DD (inclusive)")
+    parser.add_argument('--end', default=(date.today() + timedelta(days=1)).isoformat(), help="YYYY-MM-DD (exclusive)")
+    args = parser.parse_args()
+
+    from database import Database
+    db = Database()
+    try:
+        if args.command == 'backfill':
+            for chunk_start, chunk_end, written in backfill(db, args.start, args.end):
+                status = f"{written} hourly rows" if written is not None else "failed"
+                print(f"{'✅' if written is not None else '❌'} {chunk_start} .. {chunk_end}: {status}")
+        else:
+            report = utilisation_report(db, args.start, args.end)
+            for day in report.pop('days'):
+                fill = f"{day['fill_rate']:.0%}" if day['fill_rate'] is not None else "closed"
+                print(f"{day['date']}  booked {day['booked']:>4}/{day['capacity']:<4} {fill:>7}  "
+                      f"rescheduled out {day['rescheduled_out']:>3}  cancelled {day['cancelled']:>3}")
+            print(json.dumps(report, indent=2))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
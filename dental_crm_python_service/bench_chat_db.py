@@ -0,0 +1,105 @@
+"""Database cost of a chat turn, with and without prepared statements.
+
+Replays the queries one /api/chat turn makes - user lookup, history,
+two message inserts and the pre-booking slot check - against a real
+MySQL, first with plain text-protocol cursors and then with the cached
+server-side prepared statements, and reports turns per second.
+
+    python bench_chat_db.py --user-id 1 --turns 2000
+    python bench_chat_db.py --user-id 1 --check    # correctness only
+
+Before timing anything it runs one turn in each mode and checks that the
+prepared path returns the same user and history as the plain one (also
+through the history-with-session-state read a turn uses), and that it
+sees the messages it just saved.
+
+A throwaway chat session is created for the run and deleted afterwards.
+"""
+import argparse
+import statistics
+import time
+from datetime import date, timedelta
+
+from config import config
+from database import Database
+
+
+def chat_turn(db, user_id, session_id, day):
+    db.get_user_info(user_id)
+    db.get_session_history_and_state(session_id, limit=10)
+    db.save_message(session_id, 'user', "Can I book a cleaning tomorrow at 10am?")
+    db.get_slot_index(day, primary=True)
+    db.save_message(session_id, 'bot', "Sure - 10:00 AM tomorrow is available.")
+
+
+def check(db, user_id, session_id, day):
+    """One turn per mode; the prepared path must return what the plain one does"""
+    seen = {}
+    for prepared in (False, True):
+        config.DB_PREPARED_STATEMENTS = prepared
+        chat_turn(db, user_id, session_id, day)
+        seen[prepared] = (db.get_user_info(user_id), db.get_session_history(session_id, limit=10))
+    user, history = seen[True]
+    problems = []
+    if user is None or user != seen[False][0]:
+        problems.append(f"user lookup differs: {seen[False][0]} vs {user}")
+    # The session is new: the plain turn saved two messages, the prepared turn two more
+    if len(history) != 4:
+        problems.append(f"expected the 4 saved messages in history, got {len(history)}")
+    elif history[:2] != seen[False][1]:
+        problems.append(f"history differs: {seen[False][1]} vs {history[:2]}")
+    combined, state = db.get_session_history_and_state(session_id, limit=10)
+    if combined != history or not state or state[0] != 'active':
+        problems.append(f"history with session state differs: {combined} {state} vs {history}")
+    if problems:
+        raise SystemExit("❌ Prepared statement check failed:\n  " + "\n  ".join(problems))
+    print("✅ Prepared statements return the same rows as plain cursors")
+
+
+def run(db, prepared, user_id, session_id, turns, day):
+    config.DB_PREPARED_STATEMENTS = prepared
+    chat_turn(db, user_id, session_id, day)  # warm up (and prepare, when enabled)
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(turns):
+        turn_started = time.perf_counter()
+        chat_turn(db, user_id, session_id, day)
+        latencies.append(time.perf_counter() - turn_started)
+    elapsed = time.perf_counter() - started
+    return turns / elapsed, statistics.median(latencies), sorted(latencies)[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat-path database benchmark")
+    parser.add_argument('--user-id', type=int, required=True, help="An existing user to chat as")
+    parser.add_argument('--turns', type=int, default=1000)
+    parser.add_argument('--check', action='store_true', help="Only check the prepared path returns the right rows")
+    args = parser.parse_args()
+
+    db = Database()
+    if not db.get_user_info(args.user_id):
+        raise SystemExit(f"User {args.user_id} not found")
+    session_id = db.create_chat_session(args.user_id)
+    day = date.today() + timedelta(days=1)
+
+    try:
+        check(db, args.user_id, session_id, day)
+        if args.check:
+            return
+        results = {}
+        for label, prepared in (("text protocol", False), ("prepared", True)):
+            rate, p50, p99 = run(db, prepared, args.user_id, session_id, args.turns, day)
+            results[label] = rate
+            print(f"{label:<14} {rate:>8,.0f} turns/s   p50 {p50 * 1000:6.2f} ms   p99 {p99 * 1000:6.2f} ms")
+        print(f"Speed-up: {results['prepared'] / results['text protocol']:.2f}x")
+    finally:
+        cursor = db.connection.cursor()
+        cursor.execute("DELETE FROM chat_messages WHERE session_id = %s", (session_id,))
+        cursor.execute("DELETE FROM chat_sessions WHERE id = %s", (session_id,))
+        db.connection.commit()
+        cursor.close()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Email send-path throughput and error handling against the local SMTP sink.
+
+Modes:
+    direct    EmailService.send_appointment_confirmation, one at a time
+              (fresh SMTP session per message, as the chat flow does)
+    threaded  the same calls from a thread pool (how ReminderScheduler sends)
+    pooled    CampaignSender over reused SMTP sessions
+
+    python bench_email.py --count 500
+    python bench_email.py --count 500 --latency 0.02 --fail-rate 0.05 --disconnect-rate 0.02
+    python bench_email.py --count 200 --tls    # STARTTLS with a throwaway self-signed cert
+
+Each run checks that every message is accounted for: sent + failed must
+equal the count, and the sink must have accepted exactly `sent` messages.
+"""
+import argparse
+import contextlib
+import io
+import os
+import ssl
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from email_campaigns import CampaignSender, TokenBucket
+from email_service import EmailService
+from smtp_sink import SMTPSink
+
+SENDER = "clinic@example.com"  # EmailService logs in as the sender address
+PASSWORD = "sink-password"
+
+
+class MemoryJournal:
+    """Stands in for the campaign journal tables so pooled runs need no database"""
+
+    def __init__(self):
+        self.rows = []
+
+    def get_campaign_sent_recipients(self, campaign_id):
+        return set()
+
+    def record_campaign_results(self, results):
+        self.rows.extend(results)
+        return len(results)
+
+
+def make_certificate(directory):
+    """Self-signed localhost certificate via the openssl CLI"""
+    certfile = os.path.join(directory, 'sink.crt')
+    keyfile = os.path.join(directory, 'sink.key')
+    subprocess.run([
+        'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+        '-subj', '/CN=localhost', '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1',
+        '-keyout', keyfile, '-out', certfile
+    ], check=True, capture_output=True)
+    return certfile, keyfile
+
+
+def make_service(sink, certfile=None, password=PASSWORD):
+    service = EmailService()
+    service.smtp_settings = ('localhost', sink.port)
+    service.sender_email, service.sender_password = SENDER, password
+    service.use_starttls = certfile is not None
+    if certfile:
+        service.tls_context = ssl.create_default_context(cafile=certfile)
+    return service
+
+
+def send_confirmation(service, i):
+    return service.send_appointment_confirmation(
+        f"patient{i}@example.com", f"Patient {i}", "2026-10-20", "02:00 PM", "Teeth Cleaning"
+    )
+
+
+def run_direct(service, count, workers):
+    results = []
+    if workers <= 1:
+        for i in range(count):
+            results.append(send_confirmation(service, i))
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda i: send_confirmation(service, i), range(count)))
+    sent = sum(1 for r in results if r)
+    return sent, count - sent
+
+
+def run_pooled(service, count, connections):
+    recipients = (
+        {'email': f"patient{i}@example.com", 'name': f"Patient {i}", 'clinic_name': service.clinic_name}
+        for i in range(count)
+    )
+    sender = CampaignSender(service, MemoryJournal(), connections, bucket=TokenBucket(1e9, 1e9))
+    summary = None
+    for event in sender.send('bench', recipients, 'recall_notice'):
+        if event.get('done'):
+            summary = event
+    return summary['sent'], summary['failed']
+
+
+def measure(label, sink, fn, count):
+    sink.reset_stats()
+    started = time.perf_counter()
+    # EmailService logs every send; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        sent, failed = fn()
+    elapsed = time.perf_counter() - started
+    accounted = sent + failed == count and sink.stats['messages'] == sent
+    print(f"{label:<22} {sent / elapsed:>8,.1f} msg/s  sent={sent:<5} failed={failed:<5} "
+          f"sessions={sink.stats['connections']:<5} {'✅' if accounted else '❌ MISMATCH'}")
+    return accounted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Email send-path benchmark against a local SMTP sink")
+    parser.add_argument('--count', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=8, help="Threads for the threaded mode")
+    parser.add_argument('--connections', type=int, default=4, help="SMTP sessions for the pooled mode")
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--disconnect-rate', type=float, default=0.0)
+    parser.add_argument('--tls', action='store_true', help="Exercise STARTTLS")
+    parser.add_argument('--modes', default='direct,threaded,pooled')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        certfile, keyfile = make_certificate(tmp) if args.tls else (None, None)
+        with SMTPSink(username=SENDER, password=PASSWORD, certfile=certfile, keyfile=keyfile,
+                      latency=args.latency, fail_rate=args.fail_rate,
+                      disconnect_rate=args.disconnect_rate, seed=42) as sink:
+            service = make_service(sink, certfile)
+            print(f"📭 Sink on port {sink.port}: latency={args.latency}s fail={args.fail_rate} "
+                  f"disconnect={args.disconnect_rate} tls={args.tls}")
+
+            ok = True
+            modes = args.modes.split(',')
+            if 'direct' in modes:
+                ok &= measure("direct", sink, lambda: run_direct(service, args.count, 1), args.count)
+            if 'threaded' in modes:
+                ok &= measure(f"threaded x{args.workers}", sink,
+                              lambda: run_direct(service, args.count, args.workers), args.count)
+            if 'pooled' in modes:
+                ok &= measure(f"pooled x{args.connections}", sink,
+                              lambda: run_pooled(service, args.count, args.connections), args.count)
+
+            # Wrong credentials must fail cleanly, not hang or raise
+            bad = make_service(sink, certfile, password="wrong")
+            with contextlib.redirect_stdout(io.StringIO()):
+                rejected = not send_confirmation(bad, 0)
+            print(f"{'bad credentials':<22} {'rejected ✅' if rejected else 'accepted ❌'}")
+            ok &= rejected
+
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Render throughput: precompiled templates vs building MIMEMultipart per message.
+
+    python bench_email_templates.py --count 20000
+"""
+import argparse
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from email_templates import template_engine
+
+CONTEXT = {
+    'user_name': "Ayesha Khan",
+    'appointment_date': "2026-10-20",
+    'appointment_time': "02:00 PM",
+    'appointment_type': "Teeth Cleaning",
+}
+
+
+def legacy_render(recipient):
+    """What EmailService used to do for every confirmation"""
+    msg = MIMEMultipart()
+    msg['From'] = "clinic@example.com"
+    msg['To'] = recipient
+    msg['Subject'] = "Appointment Confirmation - Dental Care Clinic"
+    body = f"""
+Dear {CONTEXT['user_name']},
+
+Thank you for scheduling your appointment with Dental Care Clinic!
+
+📅 Appointment Details:
+• Date: {CONTEXT['appointment_date']}
+• Time: {CONTEXT['appointment_time']}
+• Service: {CONTEXT['appointment_type']}
+
+📍 Location:
+Dental Care Clinic
+123 Main Street, City, State 12345
+
+📞 Contact: (555) 123-4567
+
+Please arrive 15 minutes early for your appointment. If you need to reschedule or cancel, please contact us at least 24 hours in advance.
+
+We look forward to seeing you!
+
+Best regards,
+Dental Care Clinic Team
+
+---
+This is an automated message. Please do not reply to this email.
+    """
+    msg.attach(MIMEText(body, 'plain'))
+    return msg.as_string()
+
+
+def bench(label, fn, count):
+    started = time.perf_counter()
+    for i in range(count):
+        fn(f"patient{i}@example.com")
+    elapsed = time.perf_counter() - started
+    print(f"{label:<32} {count / elapsed:>10,.0f} msg/s  ({elapsed * 1e6 / count:.1f} µs/msg)")
+    return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Email render benchmark")
+    parser.add_argument('--count', type=int, default=20000)
+    args = parser.parse_args()
+
+    legacy = bench("MIMEMultipart + as_string", legacy_render, args.count)
+    for language in ('en', 'ur'):
+        bench(f"templates text-only ({language})", lambda to: template_engine.build_message(
+            "clinic@example.com", to, 'appointment_confirmation', CONTEXT, language, include_html=False
+        ), args.count)
+        fast = bench(f"templates text+html ({language})", lambda to: template_engine.build_message(
+            "clinic@example.com", to, 'appointment_confirmation', CONTEXT, language
+        ), args.count)
+    print(f"Speed-up (text+html vs legacy text-only): {fast / legacy:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
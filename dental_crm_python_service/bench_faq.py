@@ -0,0 +1,134 @@
+"""FAQ retrieval latency and how many LLM calls it saves.
+
+Latency: embeds and searches every query against the FAQ index
+(optionally padded with --pad-rows random rows to see how the scan
+scales) and reports per-query percentiles.
+
+LLM calls: runs each query through the chatbot's FAQ check and counts
+the messages answered straight from the FAQ (no LLM call), grounded with
+FAQ entries, or sent to the LLM with nothing. Queries are the patient
+messages of an /api/chat/export NDJSON file, where only the first one of
+each session can be answered directly, or by default lightly reworded
+corpus questions (each treated as an opening message) mixed with booking
+and small-talk messages.
+
+    python bench_faq.py
+    python bench_faq.py --ndjson export.ndjson
+    python bench_faq.py --pad-rows 100000 --repeat 5
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from config import config
+from faq_index import FaqIndex
+from records import Message
+
+OTHER_MESSAGES = [
+    "hi", "hello", "thanks", "yes please", "ok",
+    "I want to book a cleaning tomorrow at 10am",
+    "Can I come on Monday at 11am for a checkup?",
+    "Please move my appointment from Tuesday 2pm to Thursday 3pm",
+    "مجھے کل صبح 11 بجے اپائنٹمنٹ چاہیے",
+    "شکریہ",
+]
+REWORDINGS = [
+    lambda q: q.lower().rstrip('?'),
+    lambda q: f"hi, {q.lower()}",
+    lambda q: f"{q} thanks",
+    lambda q: " ".join(q.split()[:-1]) or q,
+]
+
+
+def sample_queries(index, seed=7):
+    """Reworded corpus questions plus messages the FAQ shouldn't answer"""
+    rng = random.Random(seed)
+    queries = []
+    for entry in index.entries:
+        for question in entry['questions']:
+            queries.append(rng.choice(REWORDINGS)(question) if entry['lang'] == 'en' else question)
+    return [(query, True) for query in queries + OTHER_MESSAGES]
+
+
+def ndjson_queries(path):
+    """(message, opens the session) for each patient message of an export"""
+    queries, seen = [], set()
+    with open(path, encoding='utf-8') as f:
+        for row in map(json.loads, filter(str.strip, f)):
+            if row.get('sender') == 'user':
+                queries.append((row['message'], row.get('session_id') not in seen))
+                seen.add(row.get('session_id'))
+    return queries
+
+
+def padded_index(index, pad_rows, directory):
+    """The index plus `pad_rows` random unit rows, saved and memory-mapped like the real one"""
+    rng = np.random.default_rng(0)
+    padding = rng.standard_normal((pad_rows, index.embedder.dim), dtype=np.float32)
+    padding /= np.linalg.norm(padding, axis=1, keepdims=True)
+    path = os.path.join(directory, 'padded.npy')
+    np.save(path, np.vstack([np.asarray(index.embeddings), padding]))
+    # Padding rows point at the first entry; their scores are near zero so they never win
+    rows = np.concatenate([index.row_entries, np.zeros(pad_rows, dtype=np.int32)])
+    padded = FaqIndex(np.load(path, mmap_mode='r'), rows, index.entries, index.embedder)
+    return padded
+
+
+def bench_latency(index, queries, repeat):
+    timings = []
+    for _ in range(repeat):
+        for query, _ in queries:
+            started = time.perf_counter()
+            index.search(query)
+            timings.append(time.perf_counter() - started)
+    ordered = sorted(timings)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1e6
+    print(f"search over {len(index.embeddings):,} rows x {index.embedder.dim} dims, {len(timings):,} lookups")
+    print(f"  mean {statistics.fmean(timings) * 1e6:8.1f} µs   p50 {pick(0.5):8.1f} µs   "
+          f"p95 {pick(0.95):8.1f} µs   p99 {pick(0.99):8.1f} µs   {len(timings) / sum(timings):,.0f} lookups/s")
+
+
+def bench_llm_calls(index, queries):
+    from chatbot import DentalChatbot
+    bot = DentalChatbot()
+    bot._faq = index
+    later_turn = [Message(None, 'user', '', None)]  # any history rules out a direct answer
+    outcomes = {'answered': 0, 'grounded': 0, 'llm': 0}
+    with contextlib.redirect_stdout(io.StringIO()):  # extract_appointment_data logs every step
+        for query, opening in queries:
+            reply, grounding = bot._consult_faq(query, None if opening else later_turn)
+            outcomes['answered' if reply else 'grounded' if grounding else 'llm'] += 1
+    total = len(queries)
+    print(f"{total:,} patient messages (answer threshold {config.FAQ_ANSWER_THRESHOLD}, "
+          f"margin {config.FAQ_ANSWER_MARGIN}, grounding threshold {config.FAQ_GROUNDING_THRESHOLD})")
+    print(f"  answered from FAQ  {outcomes['answered']:>7,} ({outcomes['answered'] / total:.0%})  <- LLM calls saved")
+    print(f"  LLM + FAQ context  {outcomes['grounded']:>7,} ({outcomes['grounded'] / total:.0%})")
+    print(f"  LLM only           {outcomes['llm']:>7,} ({outcomes['llm'] / total:.0%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAQ retrieval benchmark")
+    parser.add_argument('--ndjson', help="Chat export; its patient messages are the queries")
+    parser.add_argument('--pad-rows', type=int, default=0, help="Extra random rows for the latency run")
+    parser.add_argument('--repeat', type=int, default=20, help="Passes over the queries for latency")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = FaqIndex.build(index_dir=directory)
+        queries = ndjson_queries(args.ndjson) if args.ndjson else sample_queries(index)
+        if not queries:
+            parser.error("no patient messages to query with")
+        bench_latency(padded_index(index, args.pad_rows, directory) if args.pad_rows else index, queries, args.repeat)
+        bench_llm_calls(index, queries)
+
+
+if __name__ == "__main__":
+    main()
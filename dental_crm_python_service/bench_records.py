@@ -0,0 +1,103 @@
+"""Memory and build cost of row records versus dicts.
+
+Builds the same chat-message rows both ways - dict(zip(columns, row)),
+which is what cursor(dictionary=True) does per row, and Message._make -
+and reports bytes per row (tracemalloc) and rows built per second.
+With --session-id it also times fetching that session's messages from
+MySQL with a dictionary cursor against a plain cursor + records.
+
+    python bench_records.py --rows 200000
+    python bench_records.py --session-id 42 --repeat 200
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from records import Message, fetch_records
+
+COLUMNS = Message._fields
+
+
+def sample_rows(count):
+    """Raw cursor-style tuples, with distinct strings so nothing is shared between rows"""
+    started = datetime(2025, 1, 1, 9, 0)
+    return [
+        (i, 'user' if i % 2 else 'bot', f"Can I book a cleaning on day {i % 28 + 1} at {i % 8 + 9}am? #{i}",
+         started + timedelta(seconds=i))
+        for i in range(count)
+    ]
+
+
+def as_dicts(rows):
+    return [dict(zip(COLUMNS, row)) for row in rows]
+
+
+def as_records(rows):
+    return list(map(Message._make, rows))
+
+
+def measure(build, rows):
+    """(bytes per row for the containers alone, rows per second)"""
+    gc.collect()
+    tracemalloc.start()
+    built = build(rows)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del built
+
+    # Best of a few runs with the collector off, so one build's garbage doesn't bill the next
+    gc.disable()
+    try:
+        timings = []
+        for _ in range(5):
+            started = time.perf_counter()
+            build(rows)
+            timings.append(time.perf_counter() - started)
+    finally:
+        gc.enable()
+    return size / len(rows), len(rows) / min(timings)
+
+
+def bench_fetch(session_id, repeat):
+    from database import Database
+    db = Database()
+    db.ensure_connection()
+    query = "SELECT id, sender, message, timestamp FROM chat_messages WHERE session_id = %s ORDER BY id"
+    results = {}
+    for label, dictionary in (("dict cursor", True), ("records", False)):
+        rows = 0
+        started = time.perf_counter()
+        for _ in range(repeat):
+            cursor = db.connection.cursor(dictionary=dictionary)
+            cursor.execute(query, (session_id,))
+            rows += len(cursor.fetchall() if dictionary else fetch_records(cursor, Message))
+            cursor.close()
+        results[label] = rows / (time.perf_counter() - started)
+        print(f"fetch  {label:<12} {results[label]:>12,.0f} rows/s")
+    print(f"fetch speed-up: {results['records'] / results['dict cursor']:.2f}x")
+    db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record vs dict row benchmark")
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--session-id', type=int, help="Also time fetching this session from MySQL")
+    parser.add_argument('--repeat', type=int, default=100, help="Fetches per cursor type with --session-id")
+    args = parser.parse_args()
+
+    rows = sample_rows(args.rows)
+    dict_size, dict_rate = measure(as_dicts, rows)
+    record_size, record_rate = measure(as_records, rows)
+    print(f"{args.rows:,} message rows (row values shared, containers only)")
+    print(f"build  dict         {dict_size:>8.0f} B/row {dict_rate:>12,.0f} rows/s")
+    print(f"build  Message      {record_size:>8.0f} B/row {record_rate:>12,.0f} rows/s")
+    print(f"memory: {dict_size / record_size:.2f}x smaller, build: {record_rate / dict_rate:.2f}x faster")
+
+    if args.session_id:
+        bench_fetch(args.session_id, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Startup benchmark: import time of main.py and time to first request.
+
+    python bench_startup.py                 # 5 import runs + 3 server starts
+    python bench_startup.py --top 15        # also list the slowest imports
+
+Each measurement runs in a fresh interpreter so nothing is cached
+between runs. Time to first request is measured from spawning uvicorn
+to the first successful GET /, followed by the latency of the first
+/health (which needs the database).
+"""
+import argparse
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+
+def measure_import():
+    out = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(top):
+    """Parse `python -X importtime` for the modules with the largest cumulative time"""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'],
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        # import time: <self us> | <cumulative us> | <module>
+        _, cumulative_us, name = line.split('|')
+        rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def get(url, timeout=5):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        response.read()
+        return response.status
+
+
+def measure_first_request(timeout):
+    """Seconds from spawning the server to the first 200 on /, plus first /health latency"""
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:create_app', '--factory', '--port', str(port), '--log-level', 'warning'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError("server exited during startup")
+            if time.perf_counter() - started > timeout:
+                raise TimeoutError(f"server not ready after {timeout}s")
+            try:
+                if get(base + '/') == 200:
+                    break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.02)
+        ready = time.perf_counter() - started
+
+        health_started = time.perf_counter()
+        try:
+            health = get(base + '/health')
+        except urllib.error.HTTPError as e:
+            health = e.code
+        return ready, time.perf_counter() - health_started, health
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and time to first request")
+    parser.add_argument('--imports', type=int, default=5, help="Fresh-interpreter import runs")
+    parser.add_argument('--starts', type=int, default=3, help="Server start runs")
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--top', type=int, default=0, help="Show the N slowest imports")
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.imports)]
+    print(f"import main           median {statistics.median(imports) * 1000:8.1f} ms  "
+          f"(min {min(imports) * 1000:.1f}, max {max(imports) * 1000:.1f})")
+
+    if args.top:
+        for cumulative_us, name in slowest_imports(args.top):
+            print(f"    {cumulative_us / 1000:8.1f} ms  {name}")
+
+    starts = [measure_first_request(args.timeout) for _ in range(args.starts)]
+    print(f"spawn -> first 200    median {statistics.median(s[0] for s in starts) * 1000:8.1f} ms")
+    print(f"first /health         median {statistics.median(s[1] for s in starts) * 1000:8.1f} ms  "
+          f"(status {starts[-1][2]})")
+
+
+if __name__ == "__main__":
+    main()
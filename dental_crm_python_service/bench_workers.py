@@ -0,0 +1,114 @@
+"""Throughput scaling across worker processes.
+
+Starts serve.py with 1, 2, 4, ... workers, drives it from several client
+processes over keep-alive connections for a fixed time and reports
+requests per second against the single-worker baseline.
+
+    python bench_workers.py                              # GET / (no database)
+    python bench_workers.py --workers 1,2,4,8 --duration 10
+    python bench_workers.py --path "/api/availability/2026-10-20?time=10:00"
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port, server, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"server not ready after {timeout}s")
+
+
+def client(port, path, duration, connections, results):
+    """One load-generating process: round-robin over keep-alive connections"""
+    pool = [http.client.HTTPConnection('127.0.0.1', port, timeout=10) for _ in range(connections)]
+    done = errors = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        for i, conn in enumerate(pool):
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status < 400:
+                    done += 1
+                else:
+                    errors += 1
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                conn.close()
+                pool[i] = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    results.put((done, errors))
+
+
+def run(workers, args):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, 'serve.py', '--workers', str(workers), '--port', str(port),
+         '--host', '127.0.0.1', '--log-level', 'warning'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    try:
+        wait_ready(port, server, args.timeout)
+        results = multiprocessing.Queue()
+        clients = [
+            multiprocessing.Process(target=client, args=(port, args.path, args.duration, args.connections, results))
+            for _ in range(args.clients)
+        ]
+        for c in clients:
+            c.start()
+        totals = [results.get() for _ in clients]
+        for c in clients:
+            c.join()
+        done = sum(t[0] for t in totals)
+        errors = sum(t[1] for t in totals)
+        return done / args.duration, errors
+    finally:
+        server.terminate()
+        server.wait(timeout=15)
+
+
+def main():
+    cores = os.cpu_count() or 1
+    default_workers = ','.join(str(n) for n in (1, 2, 4, 8, 16) if n <= cores) or '1'
+    parser = argparse.ArgumentParser(description="Worker scaling benchmark")
+    parser.add_argument('--workers', default=default_workers, help="Comma-separated worker counts")
+    parser.add_argument('--path', default='/')
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--clients', type=int, default=max(2, cores), help="Load-generating processes")
+    parser.add_argument('--connections', type=int, default=4, help="Keep-alive connections per client")
+    parser.add_argument('--timeout', type=float, default=60.0)
+    args = parser.parse_args()
+
+    print(f"GET {args.path} for {args.duration}s, {args.clients} clients x {args.connections} connections, {cores} cores")
+    baseline = None
+    for workers in [int(n) for n in args.workers.split(',')]:
+        rate, errors = run(workers, args)
+        baseline = baseline or rate
+        print(f"workers={workers:<3} {rate:>10,.0f} req/s  x{rate / baseline:4.2f}  errors={errors}")
+
+
+if __name__ == "__main__":
+    main()
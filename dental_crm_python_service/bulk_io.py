@@ -0,0 +1,346 @@
+"""Streaming bulk import/export of appointments (CSV / NDJSON).
+
+Rows are parsed one logical record at a time, validated against the
+working-hours and slot rules, and inserted in batched multi-row
+transactions, so memory stays flat regardless of file size.
+
+CLI:
+    python bulk_io.py import appointments.csv
+    python bulk_io.py import appointments.ndjson --batch-size 1000
+    python bulk_io.py export appointments.ndjson --start 2025-01-01 --end 2026-01-01
+"""
+import argparse
+import asyncio
+import codecs
+import csv
+import io
+import json
+import sys
+from collections import OrderedDict
+from datetime import datetime
+
+from mysql.connector import Error
+
+from config import config
+from scheduling import slot_start, parse_appointment_datetime
+
+FORMATS = ('csv', 'ndjson')
+EXPORT_FIELDS = ['id', 'user_id', 'provider_id', 'appointment_date', 'status', 'notes', 'created_at']
+VALID_STATUSES = ('scheduled', 'completed', 'cancelled')
+INDEX_CACHE_DAYS = 8  # days of slot indexes/seats kept while importing; files are usually in date order
+
+
+class RowParser:
+    """Turn physical lines into row dicts, one logical record at a time"""
+
+    def __init__(self, fmt='csv'):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported format '{fmt}', expected one of {FORMATS}")
+        self.fmt = fmt
+        self.header = None
+        self._pending = ''
+
+    def feed(self, line):
+        """Feed one line; returns a row dict, or None for headers/blank/incomplete lines"""
+        if self.fmt == 'ndjson':
+            line = line.strip()
+            if not line:
+                return None
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError("Each NDJSON line must be an object")
+            return row
+
+        # CSV: quoted fields may contain newlines, so keep reading until quotes balance
+        self._pending += line
+        if self._pending.count('"') % 2:
+            return None
+        record, self._pending = self._pending, ''
+        if not record.strip():
+            return None
+        values = next(csv.reader([record]))
+        if self.header is None:
+            self.header = [name.strip().lower() for name in values]
+            return None
+        return dict(zip(self.header, values))
+
+    def close(self):
+        """End of input; raises ValueError if a quoted CSV field was never closed"""
+        if self._pending.strip():
+            self._pending = ''
+            raise ValueError("Unterminated quoted field at end of input")
+
+
+def normalize_row(row):
+    """Validate a raw row; returns insert-ready values or raises ValueError"""
+    try:
+        user_id = int(row.get('user_id') or '')
+    except ValueError:
+        raise ValueError("user_id is required and must be an integer")
+
+    if row.get('appointment_date'):
+        start = parse_appointment_datetime(str(row['appointment_date']))
+    elif row.get('date') and row.get('time'):
+        start = slot_start(row['date'], row['time'])
+    else:
+        raise ValueError("Either appointment_date or date and time are required")
+
+    provider_id = row.get('provider_id')
+    provider_id = int(provider_id) if provider_id not in (None, '') else None
+
+    status = (row.get('status') or 'scheduled').strip().lower()
+    if status not in VALID_STATUSES:
+        raise ValueError(f"Invalid status '{status}'")
+
+    notes = row.get('notes')
+    if notes is None:
+        notes = f"Reason: {row.get('reason') or 'Not specified'}"
+
+    return {
+        'user_id': user_id,
+        'provider_id': provider_id,
+        'start': start,
+        'status': status,
+        'notes': notes
+    }
+
+
+class AppointmentImporter:
+    """Validate rows and insert them in batched multi-row transactions"""
+
+    def __init__(self, database, batch_size=None, max_errors=None):
+        self.db = database
+        self.batch_size = batch_size or config.BULK_IMPORT_BATCH_SIZE
+        self.max_errors = max_errors if max_errors is not None else config.BULK_IMPORT_MAX_ERRORS
+        self.batch = []
+        self.days = OrderedDict()  # day -> (SlotIndex, {(provider_key, start): taken seats}), least recently used first
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, row_number, message):
+        """Record a rejected row; returns the error dict"""
+        self.failed += 1
+        error = {'row': row_number, 'error': message}
+        # Only the first max_errors are kept so memory stays bounded
+        if len(self.errors) < self.max_errors:
+            self.errors.append(error)
+        return error
+
+    def _day(self, day):
+        """Slot index and taken seats for a day, including rows queued in this import"""
+        cached = self.days.pop(day, None)
+        if cached is None:
+            if len(self.days) >= INDEX_CACHE_DAYS:
+                # Queued rows only live in their day's entry until committed, so commit before dropping one
+                self.flush()
+                if self.days:
+                    self.days.popitem(last=False)
+            cached = (self.db.get_slot_index(day, primary=True, cache=False), self.db.get_taken_seats(day))
+        self.days[day] = cached
+        return cached
+
+    def add(self, row_number, row):
+        """Validate one row and queue it; returns an error dict if it was rejected"""
+        try:
+            values = normalize_row(row)
+        except (ValueError, TypeError) as e:
+            return self.error(row_number, str(e))
+
+        start = values['start']
+        is_valid, message = self.db.validate_working_hours_and_days(start.date(), start.strftime('%H:%M'))
+        if not is_valid:
+            return self.error(row_number, message)
+
+        seat = 0
+        if values['status'] != 'cancelled':
+            index, seats = self._day(start.date())
+            provider_id = values['provider_id']
+            if provider_id is None:
+                free = index.free_providers(start)
+                if not free:
+                    return self.error(row_number, f"No provider available at {start}")
+                provider_id = free[0]
+            elif not index.is_free(start, provider_id):
+                return self.error(row_number, f"Provider {provider_id} is fully booked at {start}")
+            # Lowest seat nobody holds: cancellations can leave gaps below the booked count
+            capacity = index.capacity(provider_id) if provider_id in index.providers else 1
+            taken = seats.setdefault((provider_id or 0, start), set())
+            seat = next((s for s in range(capacity) if s not in taken), None)
+            if seat is None:
+                return self.error(row_number, f"Provider {provider_id} is fully booked at {start}")
+            taken.add(seat)
+            index.add(provider_id, start)
+            values['provider_id'] = provider_id
+
+        self.batch.append((row_number, (
+            values['user_id'], values['provider_id'], seat, start,
+            values['notes'], values['status'], datetime.now()
+        )))
+        if len(self.batch) >= self.batch_size:
+            return self.flush()
+        return None
+
+    def flush(self):
+        """Insert the queued batch; on conflict fall back to row-by-row to pinpoint errors"""
+        if not self.batch:
+            return None
+        batch, self.batch = self.batch, []
+        try:
+            self.imported += self.db.insert_appointments_batch([values for _, values in batch])
+            return None
+        except Error as e:
+            print(f"⚠️ Batch insert failed ({e}), retrying {len(batch)} rows individually")
+
+        # Cached slot indexes and seats now contain rows that were rolled back
+        self.days.clear()
+        self.db.invalidate_slot_indexes()
+        last_error = None
+        for row_number, values in batch:
+            try:
+                self.imported += self.db.insert_appointments_batch([values])
+            except Error as e:
+                last_error = self.error(row_number, str(e))
+        return last_error
+
+    def summary(self):
+        return {
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors)
+        }
+
+
+class LineImport:
+    """Parse and import one stream of text lines, fed a line at a time"""
+
+    def __init__(self, database, fmt='csv', batch_size=None):
+        self.parser = RowParser(fmt)
+        self.importer = AppointmentImporter(database, batch_size)
+        self.row_number = 0
+
+    def feed_lines(self, lines):
+        for line in lines:
+            self.feed(line)
+
+    def feed(self, line):
+        try:
+            row = self.parser.feed(line)
+        except (ValueError, csv.Error) as e:
+            self.row_number += 1
+            self.importer.error(self.row_number, f"Parse error: {e}")
+            return
+        if row is not None:
+            self.row_number += 1
+            self.importer.add(self.row_number, row)
+
+    def finish(self):
+        """Insert what is still queued; returns the import summary"""
+        try:
+            self.parser.close()
+        except ValueError as e:
+            self.row_number += 1
+            self.importer.error(self.row_number, f"Parse error: {e}")
+        self.importer.flush()
+        return self.importer.summary()
+
+
+def import_lines(database, lines, fmt='csv', batch_size=None):
+    """Import from any iterable of text lines (file object, generator)"""
+    job = LineImport(database, fmt, batch_size)
+    job.feed_lines(lines)
+    return job.finish()
+
+
+async def aimport_lines(database, lines, fmt='csv', batch_size=None):
+    """import_lines for an async iterable of lines (a streamed request body).
+    
+    Lines are gathered a batch at a time and parsed and inserted in a worker
+    thread, so the database calls don't block the event loop. The database
+    must therefore not be one shared with the event loop.
+    """
+    job = LineImport(database, fmt, batch_size)
+    chunk = []
+    async for line in lines:
+        chunk.append(line)
+        if len(chunk) >= job.importer.batch_size:
+            await asyncio.to_thread(job.feed_lines, chunk)
+            chunk = []
+    if chunk:
+        await asyncio.to_thread(job.feed_lines, chunk)
+    return await asyncio.to_thread(job.finish)
+
+
+async def aiter_lines(chunks):
+    """Split an async stream of byte chunks into text lines (keeping newlines)"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        lines = buffer.splitlines(keepends=True)
+        buffer = lines.pop() if lines and not lines[-1].endswith(('\n', '\r')) else ''
+        for line in lines:
+            yield line
+    buffer += decoder.decode(b'', final=True)
+    if buffer:
+        yield buffer
+
+
+def export_lines(database, fmt='ndjson', start=None, end=None):
+    """Yield export lines for appointments, streamed from a server-side cursor"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format '{fmt}', expected one of {FORMATS}")
+
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        yield buffer.getvalue()
+
+    for row in database.stream_appointments(start, end):
+        if fmt == 'ndjson':
+            yield json.dumps({k: row[k] for k in EXPORT_FIELDS}, default=str, ensure_ascii=False) + '\n'
+        else:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow([row[k] for k in EXPORT_FIELDS])
+            yield buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import/export appointments")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    imp = sub.add_parser('import', help="Import appointments from CSV or NDJSON")
+    imp.add_argument('path', help="File to import ('-' for stdin)")
+    imp.add_argument('--format', choices=FORMATS, help="Defaults to the file extension")
+    imp.add_argument('--batch-size', type=int, default=None)
+
+    exp = sub.add_parser('export', help="Export appointments to CSV or NDJSON")
+    exp.add_argument('path', help="Output file ('-' for stdout)")
+    exp.add_argument('--format', choices=FORMATS, help="Defaults to the file extension")
+    exp.add_argument('--start', help="YYYY-MM-DD (inclusive)")
+    exp.add_argument('--end', help="YYYY-MM-DD (exclusive)")
+
+    args = parser.parse_args()
+    fmt = args.format or ('csv' if args.path.endswith('.csv') else 'ndjson')
+
+    from database import db
+
+    if args.command == 'import':
+        source = sys.stdin if args.path == '-' else open(args.path, encoding='utf-8', newline='')
+        with source:
+            summary = import_lines(db, source, fmt, args.batch_size)
+        for error in summary['errors']:
+            print(f"❌ Row {error['row']}: {error['error']}")
+        print(f"📥 Imported {summary['imported']} appointments, {summary['failed']} failed")
+    else:
+        target = sys.stdout if args.path == '-' else open(args.path, 'w', encoding='utf-8', newline='')
+        with target:
+            for line in export_lines(db, fmt, args.start, args.end):
+                target.write(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Cross-worker cache invalidation through a small memory-mapped file.
+
+Every worker process maps the same file, which holds one 8-byte version
+per channel. A worker that changes data bumps the channel's version;
+other workers compare it with the version their cache was built at and
+drop the cache when it moved. Reads are a memory access, so checking on
+every cache lookup is free.
+
+It is best-effort: two bumps racing can hide one of them from the
+bumping worker itself, so caches keep their TTLs as the upper bound on
+staleness, and the database (unique keys) stays the source of truth.
+"""
+import itertools
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+from config import config
+
+CHANNELS = ('availability',)
+_SLOT = struct.Struct('<Q')
+
+
+class CacheBus:
+    """Per-channel version numbers shared by every process on the box"""
+
+    def __init__(self, path=None):
+        self.path = path or config.CACHE_BUS_PATH or os.path.join(
+            tempfile.gettempdir(), f"dental_crm_cache_bus_{config.SERVICE_PORT}"
+        )
+        self._map = None
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+
+    def _mapped(self):
+        if self._map is None:
+            with self._lock:
+                if self._map is None:
+                    size = len(CHANNELS) * _SLOT.size
+                    with open(self.path, 'a+b') as f:
+                        if os.fstat(f.fileno()).st_size < size:
+                            f.truncate(size)
+                        self._map = mmap.mmap(f.fileno(), size)
+        return self._map
+
+    def _offset(self, channel):
+        return CHANNELS.index(channel) * _SLOT.size
+
+    def version(self, channel):
+        """Current version of a channel (0 until someone publishes)"""
+        return _SLOT.unpack_from(self._mapped(), self._offset(channel))[0]
+
+    def publish(self, channel):
+        """Announce a change; returns the new version so the caller can keep its own cache"""
+        # pid + per-process counter: unique across workers without any cross-process lock
+        version = ((os.getpid() << 32) | (next(self._counter) & 0xFFFFFFFF)) & 0xFFFFFFFFFFFFFFFF
+        _SLOT.pack_into(self._mapped(), self._offset(channel), version)
+        return version
+
+    def reset(self):
+        """Zero every channel (the launcher does this before starting workers)"""
+        mapped = self._mapped()
+        mapped[:] = bytes(len(mapped))
+
+
+# Singleton instance
+cache_bus = CacheBus()
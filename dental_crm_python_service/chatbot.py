@@ -1,27 +1,34 @@
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.schema import HumanMessage, AIMessage, SystemMessage
-from langchain.chains import LLMChain
 from config import config
 from datetime import datetime, timedelta
 import re
 import json
+import threading
+from collections import OrderedDict, defaultdict
+from single_flight import SingleFlight, prompt_key
 
 class DentalChatbot:
     def __init__(self):
         """Initialize the dental assistant chatbot"""
-        self.llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
-            temperature=0.7,
-            openai_api_key=config.OPENAI_API_KEY
-        )
-        
-        current_date = datetime.now().strftime('%Y-%m-%d')
-        current_date_formatted = datetime.now().strftime('%A, %B %d, %Y')
+        # The OpenAI client (and langchain itself) is only imported when first needed
+        self._llm = None
+        self._http_async_client = None
+        # The FAQ index is loaded (or built) on first use too; False once it has failed to load
+        self._faq = None
+        self.faq_stats = defaultdict(int)
+        # Identical history-free prompts in flight at the same time share one LLM call
+        self.llm_flights = SingleFlight()
+        # LangChain message objects reused between calls: the system prompt, today's date note and,
+        # per session, the converted history turns
+        self._prefix_lock = threading.Lock()
+        self._system_message = None
+        self._date_note = (None, None)
+        self._history_messages = OrderedDict()
+        self.prompt_cache_stats = defaultdict(int)
         
+        # Static so OpenAI can cache it as a prompt prefix; the date goes in a note after the history
         self.system_prompt = """You are an intelligent multilingual dental clinic assistant. Your role is to:
 
-**CURRENT DATE**: Today is {} ({})
+**CURRENT DATE**: Given in the system note just before the patient's latest message
 
 1. **MULTILINGUAL SUPPORT**: Respond in the same language the user writes in (English/Urdu/Hindi)
 2. **UNDERSTAND CONTEXT**: Always read the user's message carefully and respond appropriately
@@ -41,8 +48,7 @@ class DentalChatbot:
 
 **Office Hours:**
 - Monday-Friday: 9:00 AM - 5:00 PM / پیر سے جمعہ: صبح 9 بجے سے شام 5 بجے
-- Saturday: 9:00 AM - 1:00 PM / ہفتہ: صبح 9 بجے سے دوپہر 1 بجے
-- Sunday: Closed / اتوار: بند
+- Saturday-Sunday: Closed / ہفتہ اور اتوار: بند
 
 **LANGUAGE RESPONSE RULES:**
 - If user writes in Urdu/Hindi: Respond in Urdu/Hindi
@@ -56,12 +62,12 @@ class DentalChatbot:
 - Always be conversational and natural
 - Ask clarifying questions when needed
 - Be empathetic and patient-focused
-- **DATE HANDLING**: When user says "tomorrow", calculate the correct date based on the current date above
+- **DATE HANDLING**: When user says "tomorrow", calculate the correct date based on the current date in that note
 - **DATE FORMAT**: Always use YYYY-MM-DD format for dates in appointment data
 
 **Appointment Extraction:**
 When you identify appointment details, respond with JSON in this format:
-APPOINTMENT_DATA: {{"date": "YYYY-MM-DD", "time": "HH:MM", "reason": "reason for visit"}}
+APPOINTMENT_DATA: {"date": "YYYY-MM-DD", "time": "HH:MM", "reason": "reason for visit"}
 
 **Examples of Good Responses:**
 
@@ -73,7 +79,74 @@ APPOINTMENT_DATA: {{"date": "YYYY-MM-DD", "time": "HH:MM", "reason": "reason for
 - User: "پیر کو صبح 11 بجے" → "بہترین! آپ پیر کو صبح 11 بجے کا وقت چاہتے ہیں۔ آپ کیا قسم کا اپائنٹمنٹ چاہتے ہیں؟"
 - User: "مجھے صفائی چاہیے" → "بہت اچھا! ہم پیشہ ورانہ دانت صاف کرنے کی سروس پیش کرتے ہیں۔ آپ کے لیے کون سا وقت مناسب ہوگا؟"
 
-Always be helpful, professional, and contextually aware while maintaining the user's language preference.""".format(current_date, current_date_formatted)
+Always be helpful, professional, and contextually aware while maintaining the user's language preference."""
+    
+    @property
+    def llm(self):
+        """ChatOpenAI client, built on first use"""
+        if self._llm is None:
+            from langchain_openai import ChatOpenAI
+            from openai import AsyncOpenAI
+            self._http_async_client = self._build_http_async_client()
+            self._llm = ChatOpenAI(
+                model="gpt-3.5-turbo",
+                temperature=0.7,
+                openai_api_key=config.OPENAI_API_KEY,
+                request_timeout=config.LLM_TIMEOUT_SECONDS,
+                max_retries=config.LLM_MAX_RETRIES,
+                # agenerate goes through this client and so reuses its pooled connections
+                async_client=AsyncOpenAI(
+                    api_key=config.OPENAI_API_KEY,
+                    http_client=self._http_async_client,
+                    timeout=self._http_async_client.timeout,
+                    max_retries=config.LLM_MAX_RETRIES
+                ).chat.completions
+            )
+        return self._llm
+    
+    @staticmethod
+    def _build_http_async_client():
+        """One pooled, keep-alive HTTP client for every async OpenAI call in this process"""
+        import httpx
+        from importlib.util import find_spec
+        # HTTP/2 multiplexes concurrent calls over a few connections, but needs the h2 package
+        http2 = config.LLM_HTTP2 and find_spec('h2') is not None
+        print(f"🔌 OpenAI HTTP client: {config.LLM_HTTP_MAX_CONNECTIONS} connections, "
+              f"{'HTTP/2' if http2 else 'HTTP/1.1'}")
+        return httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=config.LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=config.LLM_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=config.LLM_HTTP_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(config.LLM_TIMEOUT_SECONDS, connect=config.LLM_CONNECT_TIMEOUT_SECONDS)
+        )
+    
+    async def aclose(self):
+        """Close the pooled OpenAI connections (service shutdown)"""
+        if self._http_async_client is not None:
+            await self._http_async_client.aclose()
+            self._http_async_client = None
+            self._llm = None
+    
+    @property
+    def faq(self):
+        """Local FAQ index consulted before the LLM; None when disabled or unavailable"""
+        if self._faq is None and config.FAQ_ENABLED:
+            try:
+                from faq_index import FaqIndex
+                self._faq = FaqIndex.load()
+            except Exception as e:
+                # Includes numpy not being installed: every message then goes to the LLM as before
+                print(f"⚠️ FAQ index unavailable: {e}")
+                self._faq = False
+        return self._faq or None
+    
+    @property
+    def uses_llm(self):
+        """False when no real OpenAI key is set and the rule-based replies are used"""
+        return bool(config.OPENAI_API_KEY) and not config.OPENAI_API_KEY.startswith('sk-your')
     
     def extract_appointment_data(self, message):
         """Extract appointment information from user message"""
@@ -268,6 +341,18 @@ Always be helpful, professional, and contextually aware while maintaining the us
         else:
             return 'english'
     
+    def message_intents(self, message):
+        """Confirmation / booking / reschedule keywords in a single message"""
+        message_lower = message.lower()
+        return {
+            # Check if current message is a confirmation
+            'is_confirmation': any(word in message_lower for word in ['yes', 'yeah', 'yep', 'confirm', 'ok', 'okay']),
+            # Check if current message is about booking
+            'is_booking': any(word in message_lower for word in ['book', 'schedule', 'appointment']),
+            # Check if current message is about rescheduling (English and Urdu)
+            'is_reschedule': any(word in message_lower for word in ['reschedule', 'shift', 'change', 'move', 'postpone', 'تبدیل', 'شفٹ', 'منتقل', 'ملتوی'])
+        }
+    
     def analyze_conversation_context(self, conversation_history, current_message):
         """Analyze conversation history to understand context"""
         context_info = {
@@ -282,30 +367,18 @@ Always be helpful, professional, and contextually aware while maintaining the us
         if not conversation_history:
             return context_info
         
-        current_lower = current_message.lower()
-        
-        # Check if current message is a confirmation
-        if any(word in current_lower for word in ['yes', 'yeah', 'yep', 'confirm', 'ok', 'okay']):
-            context_info['is_confirmation'] = True
-        
-        # Check if current message is about booking
-        if any(word in current_lower for word in ['book', 'schedule', 'appointment']):
-            context_info['is_booking'] = True
-        
-        # Check if current message is about rescheduling (English and Urdu)
-        if any(word in current_lower for word in ['reschedule', 'shift', 'change', 'move', 'postpone', 'تبدیل', 'شفٹ', 'منتقل', 'ملتوی']):
-            context_info['is_reschedule'] = True
+        context_info.update(self.message_intents(current_message))
         
         # Analyze conversation history for appointment details
         appointment_details = []
         reschedule_details = []
         
         for msg in conversation_history:
-            if msg['sender'] == 'user':
-                msg_text = msg['message'].lower()
+            if msg.sender == 'user':
+                msg_text = msg.message.lower()
                 
                 # Extract appointment data
-                extracted_date, extracted_time = self.extract_appointment_data(msg['message'])
+                extracted_date, extracted_time = self.extract_appointment_data(msg.message)
                 if extracted_date and extracted_time:
                     # Determine service type
                     reason = "General Checkup"
@@ -343,11 +416,166 @@ Always be helpful, professional, and contextually aware while maintaining the us
         
         return context_info
     
-    def generate_response(self, user_message, conversation_history=None, user_name=None):
+    def _date_message(self):
+        """Dynamic suffix: today's date as a short system note, rebuilt once a day"""
+        from langchain.schema import SystemMessage
+        today = datetime.now().date()
+        day, message = self._date_note
+        if day != today:
+            message = SystemMessage(content=f"Today is {today.strftime('%Y-%m-%d')} ({today.strftime('%A, %B %d, %Y')}).")
+            self._date_note = (today, message)
+        return message
+    
+    def _history_as_messages(self, conversation_history, session_id):
+        """History turns as LangChain messages, reusing the ones already built for this session"""
+        from langchain.schema import HumanMessage, AIMessage
+        with self._prefix_lock:
+            cached = self._history_messages.pop(session_id, None) if session_id is not None else None
+            cached = cached or {}
+            converted = []
+            for msg in conversation_history or ():
+                if msg.sender not in ('user', 'bot'):
+                    continue
+                message = cached.get(msg)
+                if message is None:
+                    message = (HumanMessage if msg.sender == 'user' else AIMessage)(content=msg.message)
+                    self.prompt_cache_stats['history_built'] += 1
+                else:
+                    self.prompt_cache_stats['history_reused'] += 1
+                converted.append((msg, message))
+            if session_id is not None:
+                # Only the turns still in the window are kept; least recently used sessions go first
+                self._history_messages[session_id] = dict(converted)
+                while len(self._history_messages) > config.LLM_HISTORY_CACHE_SESSIONS:
+                    self._history_messages.popitem(last=False)
+        return [message for _, message in converted]
+    
+    def _consult_faq(self, user_message, conversation_history=None):
+        """(reply, grounding): a direct FAQ reply if one matches confidently, else FAQ text for the LLM"""
+        faq = self.faq
+        if faq is None:
+            return None, None
+        from faq_index import message_language
+        hits = faq.search(user_message)
+        language = message_language(user_message)
+        best = next((hit for hit in hits if hit.lang == language), None)
+        runner_up = next((hit.score for hit in hits if hit is not best), 0.0)
+        if best and self._faq_can_answer(user_message, conversation_history, best.score, runner_up):
+            self.faq_stats['answered'] += 1
+            print(f"📚 Answered from FAQ '{best.id}' ({best.score:.2f})")
+            return {"response": best.answer, "appointment_data": None}, None
+        relevant = [hit for hit in hits if hit.score >= config.FAQ_GROUNDING_THRESHOLD]
+        if not relevant:
+            self.faq_stats['no_match'] += 1
+            return None, None
+        self.faq_stats['grounded'] += 1
+        return None, "\n".join(f"- Q: {hit.question}\n  A: {hit.answer}" for hit in relevant)
+    
+    def _faq_can_answer(self, user_message, conversation_history, score, runner_up):
+        """A canned answer only opens a conversation, is clearly the best match and
+        never stands in for the booking, reschedule or confirmation flows"""
+        if conversation_history:
+            return False
+        if score < config.FAQ_ANSWER_THRESHOLD or score - runner_up < config.FAQ_ANSWER_MARGIN:
+            return False
+        if any(self.message_intents(user_message).values()) or \
+                any(word in user_message for word in ('اپائنٹمنٹ', 'منسوخ')):
+            return False
+        # A message naming a time is a booking step, which the FAQ can't complete
+        return self.extract_appointment_data(user_message)[1] is None
+    
+    def faq_status(self):
+        """How many messages the FAQ answered, grounded or had nothing for"""
+        return {'loaded': bool(self._faq), **self.faq_stats}
+    
+    def _llm_messages(self, user_message, conversation_history=None, session_id=None, grounding=None):
+        """Static system prompt, prior turns, then the dynamic date note (plus any FAQ
+        grounding) and the new message.
+        
+        Everything before the date note is identical from one turn of a session to the
+        next, so OpenAI can bill it as cached prompt tokens.
+        """
+        from langchain.schema import HumanMessage, SystemMessage
+        if self._system_message is None:
+            self._system_message = SystemMessage(content=self.system_prompt)
+        messages = [self._system_message]
+        messages.extend(self._history_as_messages(conversation_history, session_id))
+        messages.append(self._date_message())
+        if grounding:
+            messages.append(SystemMessage(
+                content=f"Clinic FAQ entries that may help with the patient's next message; "
+                        f"use them where relevant and keep to their facts:\n{grounding}"
+            ))
+        messages.append(HumanMessage(content=user_message))
+        return messages
+    
+    def _coalescing_key(self, user_message, conversation_history):
+        """Single-flight key for history-free prompts (the date is part of the prompt too)"""
+        if conversation_history:
+            return None
+        return prompt_key(f"{self.system_prompt}\x00{self._date_message().content}", user_message)
+    
+    def _record_usage(self, result):
+        """Count prompt tokens OpenAI billed as cached vs uncached for one call"""
+        usage = (result.llm_output or {}).get('token_usage') or {}
+        prompt_tokens = usage.get('prompt_tokens') or 0
+        cached_tokens = (usage.get('prompt_tokens_details') or {}).get('cached_tokens') or 0
+        with self._prefix_lock:
+            self.prompt_cache_stats['calls'] += 1
+            self.prompt_cache_stats['prompt_tokens'] += prompt_tokens
+            self.prompt_cache_stats['cached_prompt_tokens'] += cached_tokens
+            self.prompt_cache_stats['uncached_prompt_tokens'] += prompt_tokens - cached_tokens
+            self.prompt_cache_stats['completion_tokens'] += usage.get('completion_tokens') or 0
+    
+    def prompt_cache_status(self):
+        """Cached-token counters plus the share of prompt tokens OpenAI served from its cache"""
+        with self._prefix_lock:
+            stats = dict(self.prompt_cache_stats)
+            sessions = len(self._history_messages)
+        prompt_tokens = stats.get('prompt_tokens', 0)
+        return {
+            'sessions_cached': sessions,
+            **stats,
+            'cached_ratio': round(stats.get('cached_prompt_tokens', 0) / prompt_tokens, 4) if prompt_tokens else None
+        }
+    
+    def _llm_result(self, bot_response, user_message):
+        """Split the LLM reply into the text shown to the patient and any appointment data"""
+        # Check if appointment data is present in response
+        appointment_data = None
+        if "APPOINTMENT_DATA:" in bot_response:
+            try:
+                # Extract JSON from response
+                json_start = bot_response.index("{")
+                json_end = bot_response.rindex("}") + 1
+                json_str = bot_response[json_start:json_end]
+                appointment_data = json.loads(json_str)
+                
+                # Clean response to remove JSON
+                bot_response = bot_response[:bot_response.index("APPOINTMENT_DATA:")].strip()
+            except Exception as e:
+                print(f"Error parsing appointment data: {e}")
+        
+        # Alternatively, try to extract from user message
+        if not appointment_data:
+            extracted_date, extracted_time = self.extract_appointment_data(user_message)
+            if extracted_date and extracted_time:
+                appointment_data = {
+                    "date": extracted_date,
+                    "time": extracted_time,
+                    "reason": "General Checkup"  # Default
+                }
+        
+        return {
+            "response": bot_response,
+            "appointment_data": appointment_data
+        }
+    
+    def generate_response(self, user_message, conversation_history=None, user_name=None, session_id=None):
         """Generate chatbot response using LangChain"""
         try:
             # Check if OpenAI API key is properly set
-            if not config.OPENAI_API_KEY or config.OPENAI_API_KEY.startswith('sk-your'):
+            if not self.uses_llm:
                 # Intelligent mock responses for testing without OpenAI key
                 message_lower = user_message.lower()
                 
@@ -440,7 +668,7 @@ Always be helpful, professional, and contextually aware while maintaining the us
                 # Service requests
                 if any(service in message_lower for service in ['cleaning', 'clean', 'checkup', 'check', 'filling', 'cavity', 'pain', 'hurt']):
                     return {
-                        "response": f"Great! I can help you with that. For {user_message}, when would be convenient for you? Our available hours are Monday-Friday 9AM-5PM and Saturday 9AM-1PM.",
+                        "response": f"Great! I can help you with that. For {user_message}, when would be convenient for you? Our available hours are Monday-Friday 9AM-5PM.",
                         "appointment_data": None
                     }
                 
@@ -479,54 +707,45 @@ Always be helpful, professional, and contextually aware while maintaining the us
                     "appointment_data": None
                 }
             
-            # Build conversation context
-            messages = [SystemMessage(content=self.system_prompt)]
-            
-            # Add conversation history if available
-            if conversation_history:
-                for msg in conversation_history:
-                    if msg['sender'] == 'user':
-                        messages.append(HumanMessage(content=msg['message']))
-                    elif msg['sender'] == 'bot':
-                        messages.append(AIMessage(content=msg['message']))
-            
-            # Add current user message
-            messages.append(HumanMessage(content=user_message))
+            # Curated FAQ answers skip the LLM; weaker matches ground it
+            faq_reply, grounding = self._consult_faq(user_message, conversation_history)
+            if faq_reply:
+                return faq_reply
             
-            # Get response from LLM
-            response = self.llm.invoke(messages)
-            bot_response = response.content
-            
-            # Check if appointment data is present in response
-            appointment_data = None
-            if "APPOINTMENT_DATA:" in bot_response:
-                try:
-                    # Extract JSON from response
-                    json_start = bot_response.index("{")
-                    json_end = bot_response.rindex("}") + 1
-                    json_str = bot_response[json_start:json_end]
-                    appointment_data = json.loads(json_str)
-                    
-                    # Clean response to remove JSON
-                    bot_response = bot_response[:bot_response.index("APPOINTMENT_DATA:")].strip()
-                except Exception as e:
-                    print(f"Error parsing appointment data: {e}")
-            
-            # Alternatively, try to extract from user message
-            if not appointment_data:
-                extracted_date, extracted_time = self.extract_appointment_data(user_message)
-                if extracted_date and extracted_time:
-                    appointment_data = {
-                        "date": extracted_date,
-                        "time": extracted_time,
-                        "reason": "General Checkup"  # Default
-                    }
+            # Get response from LLM; only history-free prompts may share a call with others
+            messages = self._llm_messages(user_message, conversation_history, session_id, grounding)
+            key = self._coalescing_key(user_message, conversation_history)
+            # generate() rather than invoke(): its llm_output carries the token usage
+            result, shared = self.llm_flights.do(key, lambda: self.llm.generate([messages]))
+            if shared:
+                print("🔗 Reused an identical in-flight LLM call")
+            else:
+                self._record_usage(result)
+            return self._llm_result(result.generations[0][0].text, user_message)
             
+        except Exception as e:
+            print(f"Error generating response: {e}")
             return {
-                "response": bot_response,
-                "appointment_data": appointment_data
+                "response": "I apologize, but I'm having trouble processing your request right now. Please try again.",
+                "appointment_data": None
             }
-            
+    
+    async def agenerate_response(self, user_message, conversation_history=None, user_name=None, session_id=None):
+        """generate_response on the async OpenAI client: waiting for OpenAI holds a coroutine, not a thread"""
+        if not self.uses_llm:
+            return self.generate_response(user_message, conversation_history, user_name, session_id)
+        try:
+            faq_reply, grounding = self._consult_faq(user_message, conversation_history)
+            if faq_reply:
+                return faq_reply
+            messages = self._llm_messages(user_message, conversation_history, session_id, grounding)
+            key = self._coalescing_key(user_message, conversation_history)
+            result, shared = await self.llm_flights.do_async(key, lambda: self.llm.agenerate([messages]))
+            if shared:
+                print("🔗 Reused an identical in-flight LLM call")
+            else:
+                self._record_usage(result)
+            return self._llm_result(result.generations[0][0].text, user_message)
         except Exception as e:
             print(f"Error generating response: {e}")
             return {
@@ -551,13 +770,15 @@ Always be helpful, professional, and contextually aware while maintaining the us
         except:
             formatted_date = date
         
+        provider_line = f"\n👨‍⚕️ With: {appointment_data['provider']}" if appointment_data.get('provider') else ""
+        
         confirmation = f"""
 Perfect! I've scheduled your appointment:
 
 👤 Patient: {user_name}
 📅 Date: {formatted_date}
 🕐 Time: {time}
-🦷 Reason: {reason}
+🦷 Reason: {reason}{provider_line}
 
 Your appointment has been confirmed! You'll receive a confirmation email shortly.
 Is there anything else I can help you with?
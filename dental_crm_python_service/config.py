@@ -12,17 +12,127 @@ class Config:
     DB_USER = os.getenv("DB_USER", "root")
     DB_PASSWORD = os.getenv("DB_PASSWORD", "")
     DB_NAME = os.getenv("DB_NAME", "dental_crm")
+    DB_PORT = int(os.getenv("DB_PORT", 3306))
+    DB_PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "true").lower() == "true"
+    
+    # Read Replica Configuration (same user/password/database as the primary)
+    DB_REPLICAS = os.getenv("DB_REPLICAS", "")  # comma-separated host[:port]; empty = primary only
+    DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", 5))
+    DB_REPLICA_CHECK_SECONDS = float(os.getenv("DB_REPLICA_CHECK_SECONDS", 5))
     
     # Service Configuration
     SERVICE_PORT = int(os.getenv("SERVICE_PORT", 8000))
     SERVICE_HOST = os.getenv("SERVICE_HOST", "0.0.0.0")
+    SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", 0))  # 0 = one per CPU core (serve.py)
+    CACHE_BUS_PATH = os.getenv("CACHE_BUS_PATH")  # shared cache-invalidation file; defaults to a temp file per port
     
     # Backend URL
     BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:5000")
     
+    # Rate Limiting / Admission Control (in-memory, per worker)
+    RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+    RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 50000))
+    # endpoint -> {'user'|'ip': (requests per minute, burst)}
+    RATE_LIMITS = {
+        'chat': {'user': (20, 5), 'ip': (60, 15)},
+        'chat_batch': {'ip': (6, 2)},
+        'appointments': {'user': (10, 3), 'ip': (30, 10)},
+        'appointments_import': {'ip': (5, 2)},
+        'email': {'ip': (10, 3)},
+        'default': {'ip': (120, 30)},
+    }
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 64))
+    LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", 32))
+    LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", 10))
+    
+    # OpenAI HTTP Client Configuration (async chat path)
+    LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", 100))
+    LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", 20))
+    LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", 30))  # seconds an idle connection is kept
+    LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true"  # used only if the h2 package is installed
+    LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 30))
+    LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", 5))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+    LLM_HISTORY_CACHE_SESSIONS = int(os.getenv("LLM_HISTORY_CACHE_SESSIONS", 5000))  # sessions whose prompt turns are kept built
+    
+    # FAQ Retrieval Configuration (local index consulted before the LLM)
+    FAQ_ENABLED = os.getenv("FAQ_ENABLED", "true").lower() == "true"
+    FAQ_CORPUS_PATH = os.getenv("FAQ_CORPUS_PATH", os.path.join(os.path.dirname(__file__), "faq_corpus.json"))
+    FAQ_INDEX_DIR = os.getenv("FAQ_INDEX_DIR", os.path.join(os.path.dirname(__file__), "faq_index"))
+    FAQ_EMBEDDING_DIM = int(os.getenv("FAQ_EMBEDDING_DIM", 2048))
+    FAQ_TOP_K = int(os.getenv("FAQ_TOP_K", 3))
+    FAQ_ANSWER_THRESHOLD = float(os.getenv("FAQ_ANSWER_THRESHOLD", 0.8))  # answer from the FAQ without the LLM
+    FAQ_ANSWER_MARGIN = float(os.getenv("FAQ_ANSWER_MARGIN", 0.15))  # ...and only this far ahead of the next answer
+    FAQ_GROUNDING_THRESHOLD = float(os.getenv("FAQ_GROUNDING_THRESHOLD", 0.35))  # pass hits to the LLM as context
+    
+    # Batch Chat Configuration (POST /api/chat/batch)
+    CHAT_BATCH_MAX_MESSAGES = int(os.getenv("CHAT_BATCH_MAX_MESSAGES", 500))
+    CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", 4))  # sessions processed at once
+    
+    # Analytics Configuration
+    ANALYTICS_MAX_DAYS = int(os.getenv("ANALYTICS_MAX_DAYS", 366))
+    
+    # WebSocket Chat Configuration
+    WS_IDLE_TIMEOUT_SECONDS = float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", 300))
+    WS_MAX_PENDING_MESSAGES = int(os.getenv("WS_MAX_PENDING_MESSAGES", 4))  # per socket; more are refused as busy
+    WS_PERSIST_QUEUE_SIZE = int(os.getenv("WS_PERSIST_QUEUE_SIZE", 1000))  # unsaved messages before replies wait
+    
+    # Idempotency-Key Configuration (in-memory, per worker)
+    IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 3600))
+    IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", 10000))  # finished ones; in-flight keys are never evicted
+    
+    # Scheduling Configuration
+    AVAILABILITY_CACHE_SECONDS = int(os.getenv("AVAILABILITY_CACHE_SECONDS", 30))
+    AVAILABILITY_HORIZON_DAYS = int(os.getenv("AVAILABILITY_HORIZON_DAYS", 14))
+    AVAILABILITY_FROM_SLOT_TABLE = os.getenv("AVAILABILITY_FROM_SLOT_TABLE", "true").lower() == "true"
+    # Repairs appointment_slots after appointments written by the Node backend; 0 = disabled
+    SLOT_RECONCILE_INTERVAL_MINUTES = int(os.getenv("SLOT_RECONCILE_INTERVAL_MINUTES", 5))
+    BOOKING_MAX_ATTEMPTS = int(os.getenv("BOOKING_MAX_ATTEMPTS", 5))
+    
+    # Bulk Import/Export Configuration
+    BULK_IMPORT_BATCH_SIZE = int(os.getenv("BULK_IMPORT_BATCH_SIZE", 500))
+    BULK_IMPORT_MAX_ERRORS = int(os.getenv("BULK_IMPORT_MAX_ERRORS", 1000))
+    STREAM_FETCH_SIZE = int(os.getenv("STREAM_FETCH_SIZE", 500))
+    HISTORY_PAGE_MAX = int(os.getenv("HISTORY_PAGE_MAX", 200))
+    
+    # Session Lifecycle / Archival Configuration
+    SESSION_IDLE_MINUTES = int(os.getenv("SESSION_IDLE_MINUTES", 30))
+    ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 30))
+    ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 100))
+    ARCHIVE_PAUSE_SECONDS = float(os.getenv("ARCHIVE_PAUSE_SECONDS", 0.5))
+    SESSION_MAINTENANCE_INTERVAL_MINUTES = int(os.getenv("SESSION_MAINTENANCE_INTERVAL_MINUTES", 0))  # 0 = disabled
+    
+    # Reminder Configuration
+    REMINDER_INTERVAL_MINUTES = int(os.getenv("REMINDER_INTERVAL_MINUTES", 0))  # 0 = disabled
+    REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", 200))
+    REMINDER_CONCURRENCY = int(os.getenv("REMINDER_CONCURRENCY", 8))
+    
     # Email Configuration
     EMAIL_SENDER = os.getenv("EMAIL_SENDER", "your-email@gmail.com")
     EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD", "your-app-password")
+    SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", 30))
+    # Leave SMTP_SERVER unset to auto-detect from EMAIL_SENDER (set it to point at smtp_sink.py)
+    SMTP_SERVER = os.getenv("SMTP_SERVER")
+    SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+    SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+    SMTP_CA_FILE = os.getenv("SMTP_CA_FILE")  # extra CA to trust, e.g. a local sink's self-signed cert
+    
+    # Bulk / Campaign Email Configuration
+    CAMPAIGN_SMTP_CONNECTIONS = int(os.getenv("CAMPAIGN_SMTP_CONNECTIONS", 4))
+    CAMPAIGN_JOURNAL_BATCH = int(os.getenv("CAMPAIGN_JOURNAL_BATCH", 20))
+    # Messages per minute per SMTP provider; EMAIL_RATE_PER_MINUTE overrides them all
+    EMAIL_RATE_LIMITS = {
+        'smtp.gmail.com': 20,
+        'smtp-mail.outlook.com': 30,
+        'smtp.mail.yahoo.com': 20,
+        'smtp.zoho.com': 30,
+        'smtp.mail.me.com': 20,
+        'smtp.protonmail.com': 20,
+    }
+    EMAIL_RATE_PER_MINUTE = int(os.getenv("EMAIL_RATE_PER_MINUTE", 0))
+    EMAIL_RATE_DEFAULT_PER_MINUTE = 60
+    EMAIL_RATE_BURST = int(os.getenv("EMAIL_RATE_BURST", 5))
     
     @classmethod
     def validate(cls):
@@ -1,18 +1,30 @@
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, IntegrityError, InterfaceError, OperationalError, errorcode
 from config import config
-from datetime import datetime
+from datetime import datetime, timedelta
+from time import monotonic
+from cache_bus import cache_bus
+from replicas import ReplicaSet
+from records import Message, User, Appointment, fetch_records
+from scheduling import (
+    SlotIndex, slot_start, parse_appointment_date, parse_appointment_time, parse_appointment_datetime
+)
 
 class Database:
     def __init__(self):
+        # Connects on first use (ensure_connection), so importing never touches MySQL
         self.connection = None
-        self.connect()
+        self._slot_indexes = {}
+        self._slot_index_version = 0  # cache_bus 'availability' version the indexes reflect
+        self._slot_table_missing = False
+        self.replicas = ReplicaSet()
     
     def connect(self):
         """Establish database connection"""
         try:
             self.connection = mysql.connector.connect(
                 host=config.DB_HOST,
+                port=config.DB_PORT,
                 user=config.DB_USER,
                 password=config.DB_PASSWORD,
                 database=config.DB_NAME
@@ -24,13 +36,66 @@ class Database:
             raise e
     
     def ensure_connection(self):
-        """Ensure database connection is alive"""
+        """Ensure database connection is alive (opens it on first use)"""
         try:
-            if not self.connection.is_connected():
+            if self.connection is None or not self.connection.is_connected():
                 self.connect()
         except:
             self.connect()
     
+    def _run_prepared(self, connection, query, params=(), fetch=True, record=None):
+        """Run a hot statement as a server-side prepared statement.
+        
+        One prepared cursor per (connection, SQL) is kept on the connection and
+        reused, so the server parses each statement once per connection and
+        results come back in the binary protocol. Returns the rows (fetch=True) -
+        as `record` tuples when a records.py type is given, else dicts - or the
+        cursor's lastrowid. Set DB_PREPARED_STATEMENTS=false to compare.
+        """
+        as_dicts = record is None
+        if not config.DB_PREPARED_STATEMENTS:
+            cursor = connection.cursor(dictionary=as_dicts)
+            try:
+                cursor.execute(query, params)
+                if not fetch:
+                    return cursor.lastrowid
+                return cursor.fetchall() if as_dicts else fetch_records(cursor, record)
+            finally:
+                cursor.close()
+        
+        # Lives and dies with the connection, so a reconnect re-prepares everything. Not
+        # '_prepared_statements': mysql-connector sets that attribute to None itself
+        statements = connection.__dict__.get('_crm_prepared')
+        if statements is None:
+            statements = connection.__dict__['_crm_prepared'] = {}
+        key = (query, as_dicts)
+        cursor = statements.get(key)
+        if cursor is None:
+            cursor = connection.cursor(prepared=True, dictionary=as_dicts)
+            statements[key] = cursor
+        try:
+            cursor.execute(query, params)
+            # Always drain: a prepared cursor with unread rows blocks the connection
+            if not fetch:
+                return cursor.lastrowid
+            return cursor.fetchall() if as_dicts else fetch_records(cursor, record)
+        except (OperationalError, InterfaceError):
+            # The statement handle died with the session; prepare afresh next time
+            statements.pop(key, None)
+            raise
+    
+    def _read_connection(self):
+        """Connection for reads that tolerate a little replication lag.
+        
+        A replica within DB_REPLICA_MAX_LAG_SECONDS if one is configured and healthy,
+        otherwise the primary. Writes and read-your-own-write checks use self.connection.
+        """
+        connection = self.replicas.connection()
+        if connection is None:
+            self.ensure_connection()
+            connection = self.connection
+        return connection
+    
     def create_chat_session(self, user_id):
         """Create a new chat session"""
         try:
@@ -54,86 +119,886 @@ class Database:
             if 'cursor' in locals():
                 cursor.close()
     
+    def get_chat_session_states(self, session_ids):
+        """{session_id: (status, archived_at)}, read from the primary"""
+        if not session_ids:
+            return {}
+        self.ensure_connection()
+        cursor = self.connection.cursor()
+        try:
+            placeholders = ', '.join(['%s'] * len(session_ids))
+            cursor.execute(
+                f"SELECT id, status, archived_at FROM chat_sessions WHERE id IN ({placeholders})",
+                tuple(session_ids)
+            )
+            return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        except Error as e:
+            print(f"❌ Error reading chat sessions: {e}")
+            return {}
+        finally:
+            cursor.close()
+    
+    def reopen_chat_sessions(self, session_ids):
+        """Mark ended sessions active again in one statement (see SessionArchiver.reopen)"""
+        if not session_ids:
+            return 0
+        self.ensure_connection()
+        cursor = self.connection.cursor()
+        try:
+            placeholders = ', '.join(['%s'] * len(session_ids))
+            query = f"""
+                UPDATE chat_sessions
+                SET status = 'active', ended_at = NULL
+                WHERE id IN ({placeholders}) AND status = 'ended'
+            """
+            cursor.execute(query, tuple(session_ids))
+            self.connection.commit()
+            return cursor.rowcount
+        except Error as e:
+            print(f"❌ Error reopening chat sessions: {e}")
+            return 0
+        finally:
+            cursor.close()
+    
+    def end_chat_session(self, session_id):
+        """End a chat session explicitly"""
+        self.ensure_connection()
+        cursor = self.connection.cursor()
+        try:
+            query = """
+                UPDATE chat_sessions
+                SET status = 'ended', ended_at = %s
+                WHERE id = %s AND status = 'active'
+            """
+            cursor.execute(query, (datetime.now(), session_id))
+            self.connection.commit()
+            return cursor.rowcount > 0
+        except Error as e:
+            print(f"❌ Error ending chat session: {e}")
+            return False
+        finally:
+            cursor.close()
+    
+    def close_idle_sessions(self, idle_minutes, limit=500):
+        """End up to `limit` active sessions with no message in the last `idle_minutes`"""
+        self.ensure_connection()
+        cursor = self.connection.cursor()
+        try:
+            cutoff = datetime.now() - timedelta(minutes=idle_minutes)
+            # ended_at is the last message time (or the start time for empty sessions)
+            query = """
+                UPDATE chat_sessions s
+                SET s.status = 'ended',
+                    s.ended_at = COALESCE(
+                        (SELECT MAX(m.timestamp) FROM chat_messages m WHERE m.session_id = s.id),
+                        s.started_at
+                    )
+                WHERE s.status = 'active'
+                AND s.started_at < %s
+                AND NOT EXISTS (
+                    SELECT 1 FROM chat_messages m
+                    WHERE m.session_id = s.id AND m.timestamp >= %s
+                )
+                ORDER BY s.id
+                LIMIT %s
+            """
+            cursor.execute(query, (cutoff, cutoff, limit))
+            self.connection.commit()
+            return cursor.rowcount
+        except Error as e:
+            print(f"❌ Error closing idle sessions: {e}")
+            return 0
+        finally:
+            cursor.close()
+    
+    def get_sessions_to_archive(self, ended_before, limit=100):
+        """Ended, not yet archived sessions (oldest first)"""
+        self.ensure_connection()
+        cursor = self.connection.cursor(dictionary=True)
+        try:
+            query = """
+                SELECT id, user_id
+                FROM chat_sessions
+                WHERE status = 'ended'
+                AND ended_at < %s
+                AND archived_at IS NULL
+                ORDER BY ended_at, id
+                LIMIT %s
+            """
+            cursor.execute(query, (ended_before, limit))
+            return cursor.fetchall()
+        except Error as e:
+            print(f"❌ Error fetching sessions to archive: {e}")
+            return []
+        finally:
+            cursor.close()
+    
+    def get_messages_for_sessions(self, session_ids):
+        """All messages of several sessions in one query as (session_id, Message), ordered by (session_id, id)"""
+        if not session_ids:
+            return []
+        self.ensure_connection()
+        cursor = self.connection.cursor()
+        try:
+            placeholders = ', '.join(['%s'] * len(session_ids))
+            query = f"""
+                SELECT session_id, id, sender, message, timestamp
+                FROM chat_messages
+                WHERE session_id IN ({placeholders})
+                ORDER BY session_id, id
+            """
+            cursor.execute(query, tuple(session_ids))
+            return [(row[0], Message._make(row[1:])) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    
+    def get_session_archives(self, session_ids):
+        """Archive rows for the given sessions, keyed by session id"""
+        if not session_ids:
+            return {}
+        self.ensure_connection()
+        cursor = self.connection.cursor(dictionary=True)
+        try:
+            placeholders = ', '.join(['%s'] * len(session_ids))
+            query = f"""
+                SELECT session_id, user_id, message_count, first_message_at, last_message_at,
+                       codec, payload, archived_at
+                FROM chat_message_archives
+                WHERE session_id IN ({placeholders})
+            """
+            cursor.execute(query, tuple(session_ids))
+            return {row['session_id']: row for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+    
+    def store_session_archives(self, archives, last_message_ids):
+        """Write archive rows and drop the archived messages in one transaction.
+        
+        archives: (session_id, user_id, message_count, first_at, last_at, codec, payload) tuples.
+        last_message_ids: {session_id: highest chat_messages id that went into its archive}.
+        Only messages up to that id are deleted, so one sent while the archiver ran stays.
+        """
+        if not archives:
+            return 0
+        self.ensure_connection()
+        cursor = self.connection.cursor()
+        try:
+            now = datetime.now()
+            session_ids = [archive[0] for archive in archives]
+            placeholders = ', '.join(['%s'] * len(session_ids))
+            cursor.executemany("""
+                INSERT INTO chat_message_archives
+                    (session_id, user_id, message_count, first_message_at, last_message_at, codec, payload, archived_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    message_count = VALUES(message_count),
+                    first_message_at = VALUES(first_message_at),
+                    last_message_at = VALUES(last_message_at),
+                    codec = VALUES(codec),
+                    payload = VALUES(payload),
+                    archived_at = VALUES(archived_at)
+            """, [(*archive, now) for archive in archives])
+            if last_message_ids:
+                cursor.executemany(
+                    "DELETE FROM chat_messages WHERE session_id = %s AND id <= %s",
+                    list(last_message_ids.items())
+                )
+            cursor.execute(
+                f"UPDATE chat_sessions SET archived_at = %s WHERE id IN ({placeholders})",
+                (now, *session_ids)
+            )
+            self.connection.commit()
+            return len(archives)
+        except Error:
+            self.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+    
+    def restore_session_messages(self, session_id, messages):
+        """Put archived messages back into chat_messages (keeping their ids) and drop the archive"""
+        self.ensure_connection()
+        cursor = self.connection.cursor()
+        try:
+            cursor.executemany("""
+                INSERT IGNORE INTO chat_messages (id, session_id, sender, message, timestamp)
+                VALUES (%s, %s, %s, %s, %s)
+            """, [(m.id, session_id, m.sender, m.message, m.timestamp) for m in messages])
+            cursor.execute("DELETE FROM chat_message_archives WHERE session_id = %s", (session_id,))
+            cursor.execute("UPDATE chat_sessions SET archived_at = NULL WHERE id = %s", (session_id,))
+            self.connection.commit()
+            return True
+        except Error as e:
+            self.connection.rollback()
+            print(f"❌ Error restoring session {session_id}: {e}")
+            return False
+        finally:
+            cursor.close()
+    
     def save_message(self, session_id, sender, message):
         """Save a chat message"""
         self.ensure_connection()
-        cursor = self.connection.cursor()
         try:
             query = """
                 INSERT INTO chat_messages (session_id, sender, message, timestamp)
                 VALUES (%s, %s, %s, %s)
             """
-            cursor.execute(query, (session_id, sender, message, datetime.now()))
+            self._run_prepared(self.connection, query, (session_id, sender, message, datetime.now()), fetch=False)
             self.connection.commit()
             return True
         except Error as e:
             print(f"Error saving message: {e}")
             return False
+    
+    def save_messages(self, messages):
+        """Save (session_id, sender, message) rows in one round trip"""
+        if not messages:
+            return True
+        self.ensure_connection()
+        cursor = self.connection.cursor()
+        try:
+            now = datetime.now()
+            cursor.executemany("""
+                INSERT INTO chat_messages (session_id, sender, message, timestamp)
+                VALUES (%s, %s, %s, %s)
+            """, [(*message, now) for message in messages])
+            self.connection.commit()
+            return True
+        except Error as e:
+            print(f"Error saving messages: {e}")
+            return False
         finally:
             cursor.close()
     
-    def get_session_history(self, session_id, limit=10):
-        """Get chat history for a session"""
-        self.ensure_connection()
-        cursor = self.connection.cursor(dictionary=True)
+    def get_sessions_history(self, session_ids, limit=10):
+        """Last `limit` messages of each session in one query; returns {session_id: [messages]}"""
+        if not session_ids:
+            return {}
+        try:
+            placeholders = ', '.join(['%s'] * len(session_ids))
+            query = f"""
+                SELECT id, session_id, sender, message, timestamp
+                FROM (
+                    SELECT id, session_id, sender, message, timestamp,
+                           ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY id DESC) AS recent
+                    FROM chat_messages
+                    WHERE session_id IN ({placeholders})
+                ) ranked
+                WHERE recent <= %s
+                ORDER BY session_id, id
+            """
+            connection = self._read_connection()
+            cursor = connection.cursor()
+            try:
+                cursor.execute(query, (*session_ids, limit))
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+            history = {session_id: [] for session_id in session_ids}
+            for message_id, session_id, sender, message, timestamp in rows:
+                history[session_id].append(Message(message_id, sender, message, timestamp))
+            return history
+        except Error as e:
+            print(f"Error fetching histories: {e}")
+            return {session_id: [] for session_id in session_ids}
+    
+    def get_session_history(self, session_id, limit=10, primary=False):
+        """Get chat history for a session (primary=True to see messages just written)"""
         try:
             query = """
-                SELECT sender, message, timestamp
+                SELECT id, sender, message, timestamp
                 FROM chat_messages
                 WHERE session_id = %s
-                ORDER BY timestamp DESC
+                ORDER BY id DESC
                 LIMIT %s
             """
-            cursor.execute(query, (session_id, limit))
-            results = cursor.fetchall()
+            if primary:
+                self.ensure_connection()
+            connection = self.connection if primary else self._read_connection()
+            results = self._run_prepared(connection, query, (session_id, limit), record=Message)
             return list(reversed(results))  # Return in chronological order
         except Error as e:
             print(f"Error fetching history: {e}")
             return []
+    
+    def get_session_history_and_state(self, session_id, limit=10):
+        """Chat history plus the session's (status, archived_at) in one read.
+        
+        Lets a chat turn spot an ended or archived session without a separate
+        query; the state is None when the session doesn't exist.
+        """
+        try:
+            query = """
+                SELECT s.status, s.archived_at, m.id, m.sender, m.message, m.timestamp
+                FROM chat_sessions s
+                LEFT JOIN chat_messages m ON m.session_id = s.id
+                WHERE s.id = %s
+                ORDER BY m.id DESC
+                LIMIT %s
+            """
+            rows = self._run_prepared(self._read_connection(), query, (session_id, limit))
+            if not rows:
+                return [], None
+            history = [
+                Message(row['id'], row['sender'], row['message'], row['timestamp'])
+                for row in reversed(rows) if row['id'] is not None
+            ]
+            return history, (rows[0]['status'], rows[0]['archived_at'])
+        except Error as e:
+            print(f"Error fetching history: {e}")
+            return [], None
+    
+    def get_session_history_page(self, session_id, before_id=None, limit=20):
+        """Keyset-paginated history on (session_id, id), newest page first.
+        
+        Returns (messages in chronological order, cursor for the next older page or None).
+        """
+        cursor = self._read_connection().cursor()
+        try:
+            if before_id:
+                query = """
+                    SELECT id, sender, message, timestamp
+                    FROM chat_messages
+                    WHERE session_id = %s AND id < %s
+                    ORDER BY id DESC
+                    LIMIT %s
+                """
+                cursor.execute(query, (session_id, before_id, limit + 1))
+            else:
+                query = """
+                    SELECT id, sender, message, timestamp
+                    FROM chat_messages
+                    WHERE session_id = %s
+                    ORDER BY id DESC
+                    LIMIT %s
+                """
+                cursor.execute(query, (session_id, limit + 1))
+            results = fetch_records(cursor, Message)
+            # The extra row only tells us whether an older page exists
+            has_more = len(results) > limit
+            results = results[:limit]
+            next_cursor = results[-1].id if has_more else None
+            return list(reversed(results)), next_cursor
+        except Error as e:
+            print(f"Error fetching history page: {e}")
+            return [], None
+        finally:
+            cursor.close()
+    
+    def stream_session_messages(self, session_id):
+        """Stream every message of a session in order via a server-side cursor"""
+        query = """
+            SELECT session_id, id, sender, message, timestamp
+            FROM chat_messages
+            WHERE session_id = %s
+            ORDER BY id
+        """
+        return self._stream_query(query, (session_id,))
+    
+    def stream_user_messages(self, user_id):
+        """Stream every message of all of a user's sessions, session by session"""
+        query = """
+            SELECT m.session_id, m.id, m.sender, m.message, m.timestamp
+            FROM chat_sessions s
+            JOIN chat_messages m ON m.session_id = s.id
+            WHERE s.user_id = %s
+            ORDER BY m.session_id, m.id
+        """
+        return self._stream_query(query, (user_id,))
+    
+    def stream_chat_messages(self, start=None, end=None):
+        """Stream every message (optionally of sessions started in [start, end)), session by session"""
+        conditions = []
+        params = []
+        if start:
+            conditions.append("s.started_at >= %s")
+            params.append(start)
+        if end:
+            conditions.append("s.started_at < %s")
+            params.append(end)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"""
+            SELECT m.session_id, m.id, m.sender, m.message, m.timestamp
+            FROM chat_sessions s
+            JOIN chat_messages m ON m.session_id = s.id
+            {where}
+            ORDER BY m.session_id, m.id
+        """
+        return self._stream_query(query, tuple(params))
+    
+    def _bump_slot_counts(self, cursor, changes):
+        """Add (provider_id, slot start, delta) changes to appointment_slots in the caller's transaction.
+        
+        Only a missing table is tolerated (logged; reconcile_slot_counts repairs
+        the counts once it exists). Anything else, notably a deadlock or lock
+        wait timeout that has already rolled the transaction back, is raised
+        so the caller rolls back and reports the booking as failed.
+        """
+        totals = {}
+        for provider_id, start, delta in changes:
+            key = (start, provider_id or 0)
+            totals[key] = totals.get(key, 0) + delta
+        rows = [(*key, delta) for key, delta in totals.items() if delta]
+        if not rows:
+            return
+        try:
+            cursor.executemany("""
+                INSERT INTO appointment_slots (slot_start, provider_key, booked)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE booked = booked + VALUES(booked)
+            """, rows)
+        except Error as e:
+            if e.errno != errorcode.ER_NO_SUCH_TABLE:
+                raise
+            print(f"⚠️ Could not update slot counts: {e}")
+    
+    def reconcile_slot_counts(self, start, end, dry_run=False):
+        """Make appointment_slots match appointments for slots in [start, end).
+        
+        Returns the drift found as [{'slot_start', 'provider_id', 'recorded', 'actual'}]
+        (fixed unless dry_run), or None on error.
+        """
+        self.ensure_connection()
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute("""
+                SELECT slot_start, provider_key, booked
+                FROM appointment_slots
+                WHERE slot_start >= %s AND slot_start < %s
+                FOR UPDATE
+            """, (start, end))
+            recorded = {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+            cursor.execute("""
+                SELECT appointment_date, IFNULL(provider_id, 0), COUNT(*)
+                FROM appointments
+                WHERE appointment_date >= %s AND appointment_date < %s
+                AND status != 'cancelled'
+                GROUP BY appointment_date, IFNULL(provider_id, 0)
+                LOCK IN SHARE MODE
+            """, (start, end))
+            actual = {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+            
+            drift = [
+                {'slot_start': key[0], 'provider_id': key[1] or None,
+                 'recorded': recorded.get(key, 0), 'actual': actual.get(key, 0)}
+                for key in sorted(recorded.keys() | actual.keys())
+                if recorded.get(key, 0) != actual.get(key, 0)
+            ]
+            stale = [key for key in recorded if key not in actual]
+            if dry_run or not (drift or stale):
+                self.connection.rollback()
+                return drift
+            
+            if stale:
+                cursor.executemany(
+                    "DELETE FROM appointment_slots WHERE slot_start = %s AND provider_key = %s", stale
+                )
+            fixes = [(row['slot_start'], row['provider_id'] or 0, row['actual']) for row in drift if row['actual']]
+            if fixes:
+                cursor.executemany("""
+                    INSERT INTO appointment_slots (slot_start, provider_key, booked)
+                    VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE booked = VALUES(booked)
+                """, fixes)
+            self.connection.commit()
+            if drift:
+                self.invalidate_slot_indexes()
+            return drift
+        except Error as e:
+            self.connection.rollback()
+            print(f"❌ Error reconciling slot counts: {e}")
+            return None
+        finally:
+            cursor.close()
+    
+    HOURLY_STAT_COLUMNS = ('booked', 'created', 'rescheduled_in', 'rescheduled_out', 'cancelled')
+    
+    def _bump_hourly_stats(self, cursor, changes):
+        """Add {appointment datetime: {'booked': 1, ...}} to appointment_stats_hourly.
+        
+        Runs inside the caller's transaction. A missing table is logged rather
+        than failing the booking (backfill_hourly_stats fills the range in
+        later); any other error is raised, since a deadlock or lock wait
+        timeout has already rolled the booking back with it.
+        """
+        rows = {}
+        for when, deltas in changes:
+            key = (when.date(), when.hour)
+            totals = rows.setdefault(key, dict.fromkeys(self.HOURLY_STAT_COLUMNS, 0))
+            for column, delta in deltas.items():
+                totals[column] += delta
+        if not rows:
+            return
+        columns = ', '.join(self.HOURLY_STAT_COLUMNS)
+        updates = ', '.join(f"{c} = {c} + VALUES({c})" for c in self.HOURLY_STAT_COLUMNS)
+        try:
+            cursor.executemany(f"""
+                INSERT INTO appointment_stats_hourly (stat_date, stat_hour, {columns})
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE {updates}
+            """, [(*key, *totals.values()) for key, totals in rows.items()])
+        except Error as e:
+            if e.errno != errorcode.ER_NO_SUCH_TABLE:
+                raise
+            print(f"⚠️ Could not update hourly appointment stats: {e}")
+    
+    def backfill_hourly_stats(self, start, end):
+        """Rebuild booked/created/cancelled for appointments in [start, end) from the appointments table.
+        
+        Reschedule counts aren't recoverable from appointments, so existing ones are kept.
+        Returns the number of (date, hour) rows written, or None on error.
+        """
+        self.ensure_connection()
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute("""
+                UPDATE appointment_stats_hourly
+                SET booked = 0, created = 0, cancelled = 0
+                WHERE stat_date >= %s AND stat_date < %s
+            """, (start, end))
+            cursor.execute("""
+                INSERT INTO appointment_stats_hourly (stat_date, stat_hour, booked, created, cancelled)
+                SELECT DATE(appointment_date), HOUR(appointment_date),
+                       SUM(status != 'cancelled'), COUNT(*), SUM(status = 'cancelled')
+                FROM appointments
+                WHERE appointment_date >= %s AND appointment_date < %s
+                GROUP BY DATE(appointment_date), HOUR(appointment_date)
+                ON DUPLICATE KEY UPDATE
+                    booked = VALUES(booked),
+                    created = VALUES(created),
+                    cancelled = VALUES(cancelled)
+            """, (start, end))
+            written = cursor.rowcount
+            self.connection.commit()
+            return written
+        except Error as e:
+            self.connection.rollback()
+            print(f"❌ Error backfilling hourly stats: {e}")
+            return None
+        finally:
+            cursor.close()
+    
+    def get_hourly_stats(self, start, end):
+        """Summary rows for stat_date in [start, end), ordered by date and hour"""
+        try:
+            connection = self._read_connection()
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute("""
+                    SELECT stat_date, stat_hour, booked, created, rescheduled_in, rescheduled_out, cancelled
+                    FROM appointment_stats_hourly
+                    WHERE stat_date >= %s AND stat_date < %s
+                    ORDER BY stat_date, stat_hour
+                """, (start, end))
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+        except Error as e:
+            print(f"Error fetching hourly stats: {e}")
+            return []
+    
+    def book_slot(self, user_id, appointment_date, appointment_time, notes, provider_id=None):
+        """Atomically book a slot with a single INSERT guarded by the unique slot key.
+        
+        Returns {'status': 'booked', 'appointment_id', 'provider_id', 'provider_name', ...},
+        {'status': 'taken'} when no provider has capacity, {'status': 'invalid'} for a
+        bad date/time or an unknown provider or user, or {'status': 'error'}.
+        """
+        try:
+            start = slot_start(appointment_date, appointment_time)
+        except ValueError as e:
+            print(f"❌ Error parsing time format: {e}")
+            return {'status': 'invalid', 'error': str(e)}
+        
+        self.ensure_connection()
+        refreshed = False
+        tried = set()
+        try:
+            index = self.get_slot_index(start.date())
+            if provider_id is not None and provider_id not in index.providers:
+                print(f"❌ Unknown provider {provider_id}")
+                return {'status': 'invalid', 'error': f"Unknown provider {provider_id}"}
+            # Every seat may need one attempt when many clients race on a stale index
+            attempts = config.BOOKING_MAX_ATTEMPTS + index.total_capacity
+            for _ in range(attempts):
+                index = self.get_slot_index(start.date(), primary=refreshed)
+                if provider_id is not None:
+                    free = [provider_id] if index.is_free(start, provider_id) else []
+                else:
+                    free = index.free_providers(start)
+                
+                if not free:
+                    if refreshed:
+                        break
+                    # The cache may be missing a cancellation: re-read once before giving up
+                    self._slot_indexes.pop((start.date(), 1), None)
+                    refreshed = True
+                    continue
+                
+                candidate = free[0]
+                capacity = index.capacity(candidate) if candidate in index.providers else 1
+                base = index.booked_count(candidate, start)
+                seat = next(
+                    (s % capacity for s in range(base, base + capacity) if (candidate, s % capacity) not in tried),
+                    base % capacity
+                )
+                tried.add((candidate, seat))
+                query = """
+                    INSERT INTO appointments (user_id, provider_id, slot_seat, appointment_date, notes, status, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """
+                try:
+                    appointment_id = self._run_prepared(
+                        self.connection, query,
+                        (user_id, candidate, seat, start, notes, 'scheduled', datetime.now()),
+                        fetch=False
+                    )
+                    stats_cursor = self.connection.cursor()
+                    try:
+                        self._bump_slot_counts(stats_cursor, [(candidate, start, 1)])
+                        self._bump_hourly_stats(stats_cursor, [(start, {'booked': 1, 'created': 1})])
+                    finally:
+                        stats_cursor.close()
+                    self.connection.commit()
+                except IntegrityError as e:
+                    self.connection.rollback()
+                    if e.errno == errorcode.ER_NO_REFERENCED_ROW_2:
+                        # The user (or a provider removed since the index was built) doesn't exist
+                        print(f"❌ Unknown user or provider: {e}")
+                        return {'status': 'invalid', 'error': "Unknown user or provider"}
+                    if e.errno != errorcode.ER_DUP_ENTRY:
+                        raise
+                    # Someone else holds this seat; record it and try the next one
+                    self._update_slot_indexes(candidate, start, publish=False)
+                    continue
+                
+                self._update_slot_indexes(candidate, start)
+                print(f"✅ Booked {start} with provider {candidate} (seat {seat})")
+                return {
+                    'status': 'booked',
+                    'appointment_id': appointment_id,
+                    'provider_id': candidate,
+                    'provider_name': index.providers.get(candidate, {}).get('name'),
+                    'appointment_date': start
+                }
+            
+            print(f"🔒 Slot taken: {start}")
+            return {'status': 'taken'}
+        except Error as e:
+            self.connection.rollback()
+            print(f"❌ Error booking slot: {e}")
+            return {'status': 'error', 'error': str(e)}
+    
+    def insert_appointments_batch(self, rows):
+        """Insert many appointments in one multi-row INSERT and one transaction.
+        
+        Rows are (user_id, provider_id, slot_seat, appointment_date, notes, status, created_at).
+        Raises mysql Error after rolling back, so callers can report per-row failures.
+        """
+        self.ensure_connection()
+        cursor = self.connection.cursor()
+        try:
+            query = """
+                INSERT INTO appointments (user_id, provider_id, slot_seat, appointment_date, notes, status, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """
+            # executemany rewrites this into a single multi-row INSERT
+            cursor.executemany(query, rows)
+            self._bump_slot_counts(cursor, [(row[1], row[3], 1) for row in rows if row[5] != 'cancelled'])
+            self._bump_hourly_stats(cursor, [
+                (row[3], {'created': 1, 'cancelled': 1} if row[5] == 'cancelled' else {'created': 1, 'booked': 1})
+                for row in rows
+            ])
+            self.connection.commit()
+            self.invalidate_slot_indexes()
+            return len(rows)
+        except Error:
+            self.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+    
+    def _stream_query(self, query, params=()):
+        """Yield rows from a server-side (unbuffered) cursor on a dedicated connection"""
+        connection = mysql.connector.connect(
+            host=config.DB_HOST,
+            port=config.DB_PORT,
+            user=config.DB_USER,
+            password=config.DB_PASSWORD,
+            database=config.DB_NAME
+        )
+        cursor = connection.cursor(dictionary=True, buffered=False)
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(config.STREAM_FETCH_SIZE)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            try:
+                cursor.close()
+            except Error:
+                # Closing mid-stream: the unread rows are discarded with the connection
+                pass
+            connection.close()
+    
+    def stream_appointments(self, start=None, end=None):
+        """Stream appointments in id order without loading them all into memory"""
+        conditions = []
+        params = []
+        if start:
+            conditions.append("appointment_date >= %s")
+            params.append(start)
+        if end:
+            conditions.append("appointment_date < %s")
+            params.append(end)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"""
+            SELECT id, user_id, provider_id, appointment_date, status, notes, created_at
+            FROM appointments
+            {where}
+            ORDER BY id
+        """
+        return self._stream_query(query, tuple(params))
+    
+    def get_reminder_candidates(self, window_start, window_end):
+        """Scheduled appointments in [window_start, window_end) with their sent reminders.
+        
+        One range scan on idx_appointment_date; reminder flags come from LEFT JOINs
+        instead of per-row lookups.
+        """
+        self.ensure_connection()
+        cursor = self.connection.cursor(dictionary=True)
+        try:
+            query = """
+                SELECT a.id, a.appointment_date, a.notes, u.name, u.email,
+                       r24.appointment_id IS NOT NULL AS sent_24h,
+                       r2.appointment_id IS NOT NULL AS sent_2h
+                FROM appointments a
+                JOIN users u ON u.id = a.user_id
+                LEFT JOIN appointment_reminders r24 ON r24.appointment_id = a.id AND r24.kind = '24h'
+                LEFT JOIN appointment_reminders r2 ON r2.appointment_id = a.id AND r2.kind = '2h'
+                WHERE a.appointment_date >= %s
+                AND a.appointment_date < %s
+                AND a.status = 'scheduled'
+                ORDER BY a.appointment_date
+            """
+            cursor.execute(query, (window_start, window_end))
+            return cursor.fetchall()
+        except Error as e:
+            print(f"❌ Error fetching reminder candidates: {e}")
+            return []
         finally:
             cursor.close()
     
-    def create_appointment_from_chat(self, user_id, appointment_date, notes):
-        """Create an appointment from chatbot conversation"""
+    def record_reminders_sent(self, reminders):
+        """Record (appointment_id, kind) reminders as sent, ignoring duplicates"""
+        if not reminders:
+            return 0
+        self.ensure_connection()
+        cursor = self.connection.cursor()
+        try:
+            now = datetime.now()
+            cursor.executemany("""
+                INSERT IGNORE INTO appointment_reminders (appointment_id, kind, sent_at)
+                VALUES (%s, %s, %s)
+            """, [(appointment_id, kind, now) for appointment_id, kind in reminders])
+            self.connection.commit()
+            return len(reminders)
+        except Error as e:
+            print(f"❌ Error recording reminders: {e}")
+            return 0
+        finally:
+            cursor.close()
+    
+    def stream_users(self, role='patient'):
+        """Stream users of a role (id, name, email) via a server-side cursor"""
+        query = """
+            SELECT id, name, email
+            FROM users
+            WHERE role = %s
+            ORDER BY id
+        """
+        return self._stream_query(query, (role,))
+    
+    def get_campaign_sent_recipients(self, campaign_id):
+        """Recipients already sent in a campaign, so a resumed run skips them"""
         self.ensure_connection()
         cursor = self.connection.cursor()
         try:
             query = """
-                INSERT INTO appointments (user_id, appointment_date, notes, status, created_at)
-                VALUES (%s, %s, %s, %s, %s)
+                SELECT recipient FROM email_campaign_log
+                WHERE campaign_id = %s AND status = 'sent'
             """
-            cursor.execute(query, (user_id, appointment_date, notes, 'scheduled', datetime.now()))
+            cursor.execute(query, (campaign_id,))
+            return {row[0] for row in cursor.fetchall()}
+        except Error as e:
+            print(f"❌ Error loading campaign progress: {e}")
+            return set()
+        finally:
+            cursor.close()
+    
+    def record_campaign_results(self, results):
+        """Journal (campaign_id, recipient, status, error) rows; a later 'sent' overwrites 'failed'"""
+        if not results:
+            return 0
+        self.ensure_connection()
+        cursor = self.connection.cursor()
+        try:
+            now = datetime.now()
+            cursor.executemany("""
+                INSERT INTO email_campaign_log (campaign_id, recipient, status, error, updated_at)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    status = VALUES(status),
+                    error = VALUES(error),
+                    updated_at = VALUES(updated_at)
+            """, [(*result, now) for result in results])
             self.connection.commit()
-            return cursor.lastrowid
+            return len(results)
         except Error as e:
-            print(f"Error creating appointment: {e}")
-            return None
+            print(f"❌ Error recording campaign results: {e}")
+            return 0
         finally:
             cursor.close()
     
     def get_user_info(self, user_id):
         """Get user information"""
-        self.ensure_connection()
-        cursor = self.connection.cursor(dictionary=True)
         try:
             query = "SELECT id, name, email, role FROM users WHERE id = %s"
-            cursor.execute(query, (user_id,))
-            return cursor.fetchone()
+            rows = self._run_prepared(self._read_connection(), query, (user_id,), record=User)
+            return rows[0] if rows else None
         except Error as e:
             print(f"Error fetching user: {e}")
             return None
-        finally:
-            cursor.close()
+    
+    def get_users_info(self, user_ids):
+        """get_user_info for many users in one query; returns {user_id: user}"""
+        if not user_ids:
+            return {}
+        try:
+            placeholders = ', '.join(['%s'] * len(user_ids))
+            connection = self._read_connection()
+            cursor = connection.cursor()
+            try:
+                cursor.execute(f"SELECT id, name, email, role FROM users WHERE id IN ({placeholders})", tuple(user_ids))
+                return {user.id: user for user in fetch_records(cursor, User)}
+            finally:
+                cursor.close()
+        except Error as e:
+            print(f"Error fetching users: {e}")
+            return {}
     
     def find_appointment_by_date_time(self, user_id, appointment_date, appointment_time=None):
         """Find appointment by date and optionally time"""
         self.ensure_connection()
-        cursor = self.connection.cursor(dictionary=True)
+        cursor = self.connection.cursor()
         try:
             if appointment_time:
                 # Search with specific time
                 query = """
-                    SELECT id, user_id, appointment_date, notes, status 
+                    SELECT id, user_id, provider_id, appointment_date, notes, status, created_at
                     FROM appointments 
                     WHERE user_id = %s 
                     AND DATE(appointment_date) = %s 
@@ -146,7 +1011,7 @@ class Database:
             else:
                 # Search by date only
                 query = """
-                    SELECT id, user_id, appointment_date, notes, status 
+                    SELECT id, user_id, provider_id, appointment_date, notes, status, created_at
                     FROM appointments 
                     WHERE user_id = %s 
                     AND DATE(appointment_date) = %s
@@ -156,9 +1021,10 @@ class Database:
                 """
                 cursor.execute(query, (user_id, appointment_date))
             
-            result = cursor.fetchone()
+            row = cursor.fetchone()
+            result = Appointment._make(row) if row else None
             if result:
-                print(f"✅ Found appointment: ID={result['id']}, Date={result['appointment_date']}")
+                print(f"✅ Found appointment: ID={result.id}, Date={result.appointment_date}")
             else:
                 print(f"❌ No appointment found for user {user_id} on {appointment_date}")
             return result
@@ -168,54 +1034,137 @@ class Database:
         finally:
             cursor.close()
     
-    def reschedule_appointment(self, appointment_id, new_appointment_date, notes=None):
-        """Reschedule an existing appointment"""
+    def reschedule_appointment(self, appointment_id, new_appointment_date, notes=None, provider_id=None):
+        """Reschedule an existing appointment (optionally onto another provider).
+        
+        The appointment takes a free seat at the new slot, like book_slot;
+        returns False when it's missing, the new slot is full or on error.
+        """
+        try:
+            new_start = parse_appointment_datetime(new_appointment_date)
+        except ValueError as e:
+            print(f"❌ Error parsing time format: {e}")
+            return False
+        
         self.ensure_connection()
         cursor = self.connection.cursor(dictionary=True)
         try:
+            # Old slot, for moving the slot and hourly summary counts along with the appointment
+            cursor.execute("SELECT provider_id, slot_seat, appointment_date, status FROM appointments WHERE id = %s FOR UPDATE",
+                           (appointment_id,))
+            current = cursor.fetchone()
+            if not current:
+                self.connection.rollback()
+                print(f"❌ Failed to reschedule appointment {appointment_id}")
+                return False
+            
+            assignments = ["appointment_date = %s", "updated_at = %s"]
+            params = [new_start, datetime.now()]
             if notes:
-                query = """
-                    UPDATE appointments 
-                    SET appointment_date = %s, notes = %s, updated_at = %s
-                    WHERE id = %s
-                """
-                cursor.execute(query, (new_appointment_date, notes, datetime.now(), appointment_id))
-            else:
-                query = """
-                    UPDATE appointments 
-                    SET appointment_date = %s, updated_at = %s
-                    WHERE id = %s
-                """
-                cursor.execute(query, (new_appointment_date, datetime.now(), appointment_id))
+                assignments.append("notes = %s")
+                params.append(notes)
+            if provider_id is not None:
+                assignments.append("provider_id = %s")
+                params.append(provider_id)
+            assignments.append("slot_seat = %s")
+            query = f"""
+                UPDATE appointments 
+                SET {', '.join(assignments)}
+                WHERE id = %s
+            """
             
-            self.connection.commit()
+            new_provider = current['provider_id'] if provider_id is None else provider_id
+            moved = (new_start, new_provider) != (current['appointment_date'], current['provider_id'])
+            if moved and current['status'] != 'cancelled':
+                # Seats other bookings may hold at the new slot, least likely taken first
+                index = self.get_slot_index(new_start.date(), primary=True, cache=False)
+                capacity = index.capacity(new_provider) if new_provider in index.providers else 1
+                base = index.booked_count(new_provider, new_start)
+                seats = [s % capacity for s in range(base, base + capacity)]
+            else:
+                seats = [current['slot_seat']]
             
-            if cursor.rowcount > 0:
-                print(f"✅ Appointment {appointment_id} rescheduled to {new_appointment_date}")
-                return True
+            for seat in seats:
+                try:
+                    cursor.execute(query, (*params, seat, appointment_id))
+                    break
+                except IntegrityError as e:
+                    if e.errno != errorcode.ER_DUP_ENTRY:
+                        raise
+                    # Only the failed statement is undone; the row lock is kept for the next seat
+                    continue
             else:
-                print(f"❌ Failed to reschedule appointment {appointment_id}")
+                self.connection.rollback()
+                print(f"🔒 Slot taken, not rescheduling appointment {appointment_id}: {new_start}")
                 return False
+            
+            if current['status'] != 'cancelled':
+                if moved:
+                    self._bump_slot_counts(cursor, [
+                        (current['provider_id'], current['appointment_date'], -1),
+                        (new_provider, new_start, 1)
+                    ])
+                if new_start != current['appointment_date']:
+                    self._bump_hourly_stats(cursor, [
+                        (current['appointment_date'], {'booked': -1, 'rescheduled_out': 1}),
+                        (new_start, {'booked': 1, 'rescheduled_in': 1})
+                    ])
+            
+            self.connection.commit()
+            
+            # The old slot isn't known here, so rebuild cached indexes on next use
+            self.invalidate_slot_indexes()
+            print(f"✅ Appointment {appointment_id} rescheduled to {new_start} (seat {seat})")
+            return True
         except Error as e:
+            self.connection.rollback()
             print(f"❌ Error rescheduling appointment: {e}")
             return False
         finally:
             cursor.close()
     
-    def get_user_appointments(self, user_id, limit=10):
-        """Get all appointments for a user"""
+    def cancel_appointment(self, appointment_id):
+        """Cancel an appointment, releasing its slot; False if missing or already cancelled"""
         self.ensure_connection()
         cursor = self.connection.cursor(dictionary=True)
+        try:
+            cursor.execute("SELECT provider_id, appointment_date, status FROM appointments WHERE id = %s FOR UPDATE",
+                           (appointment_id,))
+            current = cursor.fetchone()
+            if not current or current['status'] == 'cancelled':
+                self.connection.rollback()
+                return False
+            cursor.execute("""
+                UPDATE appointments
+                SET status = 'cancelled', updated_at = %s
+                WHERE id = %s
+            """, (datetime.now(), appointment_id))
+            self._bump_slot_counts(cursor, [(current['provider_id'], current['appointment_date'], -1)])
+            self._bump_hourly_stats(cursor, [(current['appointment_date'], {'booked': -1, 'cancelled': 1})])
+            self.connection.commit()
+            self._update_slot_indexes(current['provider_id'], current['appointment_date'], booked=False)
+            print(f"✅ Appointment {appointment_id} cancelled")
+            return True
+        except Error as e:
+            self.connection.rollback()
+            print(f"❌ Error cancelling appointment: {e}")
+            return False
+        finally:
+            cursor.close()
+    
+    def get_user_appointments(self, user_id, limit=10):
+        """Get all appointments for a user"""
+        cursor = self._read_connection().cursor()
         try:
             query = """
-                SELECT id, user_id, appointment_date, notes, status, created_at 
+                SELECT id, user_id, provider_id, appointment_date, notes, status, created_at 
                 FROM appointments 
                 WHERE user_id = %s 
                 ORDER BY appointment_date DESC
                 LIMIT %s
             """
             cursor.execute(query, (user_id, limit))
-            return cursor.fetchall()
+            return fetch_records(cursor, Appointment)
         except Error as e:
             print(f"❌ Error fetching user appointments: {e}")
             return []
@@ -276,157 +1225,161 @@ class Database:
             print(f"❌ Error validating working hours/days: {e}")
             return False, f"Invalid date or time format."
     
-    def check_time_slot_availability(self, appointment_date, appointment_time):
-        """Check if a specific time slot is available"""
-        self.ensure_connection()
-        cursor = self.connection.cursor(dictionary=True)
+    def get_providers(self):
+        """Get active dentists/chairs that appointments can be assigned to"""
         try:
-            # Parse the appointment time to standard format
-            from datetime import datetime
-            time_obj = None
-            
-            # Handle different time formats
-            appointment_time_lower = appointment_time.lower().strip()
-            
-            if ':' in appointment_time:
-                try:
-                    # Try 24-hour format first (14:30)
-                    time_obj = datetime.strptime(appointment_time, '%H:%M').time()
-                except:
-                    try:
-                        # Try 12-hour format with space (2:30 PM)
-                        time_obj = datetime.strptime(appointment_time, '%I:%M %p').time()
-                    except:
-                        try:
-                            # Try 12-hour format without space (2:30PM)
-                            time_obj = datetime.strptime(appointment_time, '%I:%M%p').time()
-                        except:
-                            # Fallback to simple parsing
-                            hour = int(''.join(filter(str.isdigit, appointment_time)))
-                            if 'pm' in appointment_time_lower and hour != 12:
-                                hour += 12
-                            elif 'am' in appointment_time_lower and hour == 12:
-                                hour = 0
-                            time_obj = datetime.strptime(f"{hour:02d}:00", '%H:%M').time()
-            else:
-                # Handle simple hour format (2pm, 11am, etc.)
-                try:
-                    # Extract hour number
-                    hour = int(''.join(filter(str.isdigit, appointment_time)))
-                    
-                    # Handle AM/PM
-                    if 'pm' in appointment_time_lower:
-                        if hour != 12:  # 1pm = 13:00, 2pm = 14:00, etc.
-                            hour += 12
-                        # 12pm stays 12 (noon)
-                    elif 'am' in appointment_time_lower:
-                        if hour == 12:  # 12am = 00:00 (midnight)
-                            hour = 0
-                        # Other AM hours stay the same
-                    
-                    time_obj = datetime.strptime(f"{hour:02d}:00", '%H:%M').time()
-                except Exception as e:
-                    print(f"❌ Error parsing time '{appointment_time}': {e}")
-                    # Default fallback
-                    time_obj = datetime.strptime("09:00", '%H:%M').time()
-            
-            # Check for existing appointments at the same date and time
             query = """
-                SELECT COUNT(*) as count 
-                FROM appointments 
-                WHERE DATE(appointment_date) = %s 
-                AND TIME(appointment_date) = %s
-                AND status != 'cancelled'
+                SELECT id, name, kind, capacity
+                FROM providers
+                WHERE active = 1
+                ORDER BY id
             """
-            cursor.execute(query, (appointment_date, time_obj))
-            result = cursor.fetchone()
-            
-            is_available = result['count'] == 0
-            print(f"🔍 Time slot availability check: {appointment_date} {time_obj} - {'Available' if is_available else 'Booked'}")
-            return is_available
-            
+            return self._run_prepared(self._read_connection(), query)
         except Error as e:
-            print(f"❌ Error checking time slot availability: {e}")
-            return False
-        except Exception as e:
-            print(f"❌ Error parsing time format: {e}")
-            return False
-        finally:
-            cursor.close()
+            # No providers table yet: fall back to a single clinic-wide resource
+            print(f"⚠️ Could not load providers, using single clinic resource: {e}")
+            return []
     
-    def get_available_time_slots(self, appointment_date, preferred_time=None):
-        """Get available time slots for a specific date"""
+    def get_slot_index(self, start_day, days=1, primary=False, cache=True):
+        """Get the slot index for [start_day, start_day + days), cached briefly.
+        
+        Built from a replica unless primary=True (used right before booking,
+        where a replica could still be missing a booking that just happened).
+        cache=False builds a private index that is not kept, for callers that
+        add their own uncommitted bookings to it (bulk import).
+        """
+        key = (start_day, days)
+        now = monotonic()
+        self._sync_slot_indexes()
+        cached = self._slot_indexes.get(key)
+        if not primary and cached and now - cached[0] < config.AVAILABILITY_CACHE_SECONDS:
+            return cached[1]
+        
+        if primary:
+            self.ensure_connection()
+            connection = self.connection
+        else:
+            connection = self._read_connection()
+        index = SlotIndex(self.get_providers())
+        window_start = datetime.combine(start_day, datetime.min.time())
+        self._load_slot_counts(connection, index, window_start, window_start + timedelta(days=days))
+        if not cache:
+            return index
+        
+        # Drop expired windows so the cache stays small
+        self._slot_indexes = {
+            k: v for k, v in self._slot_indexes.items()
+            if now - v[0] < config.AVAILABILITY_CACHE_SECONDS
+        }
+        self._slot_indexes[key] = (now, index)
+        return index
+    
+    def get_taken_seats(self, start_day):
+        """{(provider_key, slot start): {slot_seat, ...}} held by live appointments on a day, from the primary"""
         self.ensure_connection()
-        cursor = self.connection.cursor(dictionary=True)
-        try:
-            # Get all appointments for the date
+        day_start = datetime.combine(start_day, datetime.min.time())
+        query = """
+            SELECT IFNULL(provider_id, 0) AS provider_key, appointment_date, slot_seat
+            FROM appointments
+            WHERE appointment_date >= %s
+            AND appointment_date < %s
+            AND status != 'cancelled'
+        """
+        seats = {}
+        for row in self._run_prepared(self.connection, query, (day_start, day_start + timedelta(days=1))):
+            seats.setdefault((row['provider_key'], row['appointment_date']), set()).add(row['slot_seat'])
+        return seats
+    
+    def _load_slot_counts(self, connection, index, window_start, window_end):
+        """Add the bookings in [window_start, window_end) to a SlotIndex.
+        
+        Reads the per-slot counts in appointment_slots (a primary-key range),
+        or scans appointments when that table is disabled or not created yet.
+        """
+        if config.AVAILABILITY_FROM_SLOT_TABLE and not self._slot_table_missing:
             query = """
-                SELECT TIME(appointment_date) as time_slot 
-                FROM appointments 
-                WHERE DATE(appointment_date) = %s 
-                AND status != 'cancelled'
-                ORDER BY TIME(appointment_date)
+                SELECT provider_key, slot_start, booked
+                FROM appointment_slots
+                WHERE slot_start >= %s
+                AND slot_start < %s
+                AND booked > 0
             """
-            cursor.execute(query, (appointment_date,))
-            booked_slots = [row['time_slot'] for row in cursor.fetchall()]
-            
-            # Define clinic hours (9 AM to 5 PM)
-            from datetime import time, timedelta
-            clinic_hours = []
-            current_time = time(9, 0)  # 9:00 AM
-            end_time = time(17, 0)    # 5:00 PM
-            
-            # Generate hourly slots
-            while current_time < end_time:
-                clinic_hours.append(current_time)
-                # Add 1 hour
-                hour = current_time.hour + 1
-                if hour >= 24:
-                    break
-                current_time = time(hour, 0)
-            
-            # Filter out booked slots
-            available_slots = []
-            for slot in clinic_hours:
-                if slot not in booked_slots:
-                    available_slots.append(slot)
+            try:
+                for row in self._run_prepared(connection, query, (window_start, window_end)):
+                    for _ in range(row['booked']):
+                        index.add(row['provider_key'] or None, row['slot_start'])
+                return
+            except Error as e:
+                if e.errno != errorcode.ER_NO_SUCH_TABLE:
+                    raise
+                print("⚠️ appointment_slots table missing; reading availability from appointments")
+                self._slot_table_missing = True
+        
+        query = """
+            SELECT provider_id, appointment_date
+            FROM appointments
+            WHERE appointment_date >= %s
+            AND appointment_date < %s
+            AND status != 'cancelled'
+        """
+        for row in self._run_prepared(connection, query, (window_start, window_end)):
+            index.add(row['provider_id'], row['appointment_date'])
+    
+    def _sync_slot_indexes(self):
+        """Drop cached indexes if another worker (or Database) changed bookings"""
+        version = cache_bus.version('availability')
+        if version != self._slot_index_version:
+            self._slot_indexes.clear()
+            self._slot_index_version = version
+    
+    def _update_slot_indexes(self, provider_id, start, booked=True, publish=True):
+        """Apply a booking/release to cached indexes covering that slot"""
+        self._sync_slot_indexes()
+        for (first_day, days), (_, index) in self._slot_indexes.items():
+            if first_day <= start.date() < first_day + timedelta(days=days):
+                if booked:
+                    index.add(provider_id, start)
+                else:
+                    index.remove(provider_id, start)
+        if publish:
+            # Our own indexes are current; everyone else's are now stale
+            self._slot_index_version = cache_bus.publish('availability')
+    
+    def invalidate_slot_indexes(self):
+        """Forget cached availability here and in every other worker"""
+        self._slot_indexes.clear()
+        self._slot_index_version = cache_bus.publish('availability')
+    
+    def find_available_provider(self, appointment_date, appointment_time):
+        """Pick a provider with spare capacity at a slot, or None if the slot is full"""
+        try:
+            start = slot_start(appointment_date, appointment_time)
+            index = self.get_slot_index(start.date())
+            free = index.free_providers(start)
+            if not free:
+                return None
+            return index.providers[free[0]]
+        except Error as e:
+            print(f"❌ Error finding available provider: {e}")
+            return None
+        except ValueError as e:
+            print(f"❌ Error parsing time format: {e}")
+            return None
+    
+    def get_available_time_slots(self, appointment_date, preferred_time=None):
+        """Get time slots on a date where at least one provider is free"""
+        try:
+            day = parse_appointment_date(appointment_date)
+            available_slots = [start.time() for start in self.get_slot_index(day).free_slots(day)]
             
             # If preferred time is provided, prioritize it
             if preferred_time:
                 try:
-                    # Parse preferred time using same logic as above
-                    preferred_time_lower = preferred_time.lower().strip()
-                    
-                    if ':' in preferred_time:
-                        try:
-                            pref_time = datetime.strptime(preferred_time, '%H:%M').time()
-                        except:
-                            try:
-                                pref_time = datetime.strptime(preferred_time, '%I:%M %p').time()
-                            except:
-                                pref_time = datetime.strptime(preferred_time, '%I:%M%p').time()
-                    else:
-                        # Handle simple hour format (2pm, 11am, etc.)
-                        hour = int(''.join(filter(str.isdigit, preferred_time)))
-                        
-                        # Handle AM/PM
-                        if 'pm' in preferred_time_lower:
-                            if hour != 12:  # 1pm = 13:00, 2pm = 14:00, etc.
-                                hour += 12
-                            # 12pm stays 12 (noon)
-                        elif 'am' in preferred_time_lower:
-                            if hour == 12:  # 12am = 00:00 (midnight)
-                                hour = 0
-                            # Other AM hours stay the same
-                        
-                        pref_time = time(hour, 0)
-                    
-                    # If preferred time is available, put it first
+                    pref_time = parse_appointment_time(preferred_time)
                     if pref_time in available_slots:
                         available_slots.remove(pref_time)
                         available_slots.insert(0, pref_time)
-                    
-                except Exception as e:
+                except ValueError as e:
                     print(f"❌ Error parsing preferred time: {e}")
             
             print(f"📅 Available slots for {appointment_date}: {len(available_slots)} slots")
@@ -435,6 +1388,41 @@ class Database:
         except Error as e:
             print(f"❌ Error getting available time slots: {e}")
             return []
+        except ValueError as e:
+            print(f"❌ Error parsing date: {e}")
+            return []
+    
+    def get_next_available_slot(self, after=None):
+        """Find the next (slot_start, provider) with spare capacity for any provider"""
+        after = after or datetime.now()
+        try:
+            index = self.get_slot_index(after.date(), config.AVAILABILITY_HORIZON_DAYS)
+            found = index.next_free_slot(after, config.AVAILABILITY_HORIZON_DAYS - 1)
+            if not found:
+                return None
+            start, provider_id = found
+            return start, index.providers[provider_id]
+        except Error as e:
+            print(f"❌ Error finding next available slot: {e}")
+            return None
+    
+    def hold_advisory_lock(self, name):
+        """Take (or confirm we still hold) a MySQL named lock on this connection.
+        
+        Background jobs use this so only one worker - on this box or any other -
+        runs them; the lock is released automatically if the connection drops.
+        """
+        self.ensure_connection()
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(
+                "SELECT COALESCE(IS_USED_LOCK(%s) = CONNECTION_ID(), 0) OR GET_LOCK(%s, 0)",
+                (name, name)
+            )
+            return bool(cursor.fetchone()[0])
+        except Error as e:
+            print(f"❌ Error taking lock {name}: {e}")
+            return False
         finally:
             cursor.close()
     
@@ -443,6 +1431,7 @@ class Database:
         if self.connection and self.connection.is_connected():
             self.connection.close()
             print("Database connection closed")
+        self.replicas.close()
 
 # Singleton instance
 db = Database()
@@ -0,0 +1,227 @@
+"""Bulk / campaign email sending.
+
+Recipients are consumed lazily from any iterable and sent over a small
+pool of reused SMTP connections, behind a token bucket per SMTP
+provider so Gmail/Outlook sending limits are respected. Every result is
+journalled in email_campaign_log, so re-running a campaign with the
+same id after a crash skips recipients that were already sent.
+
+CLI:
+    python email_campaigns.py recall-2026-10 --template recall_notice           # all patients
+    python email_campaigns.py recall-2026-10 --template recall_notice --file list.ndjson
+"""
+import argparse
+import json
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from config import config
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, up to `capacity` banked"""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available; returns seconds to wait otherwise (0.0 on success)"""
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        """Block until tokens are available; returns how long we waited"""
+        waited = 0.0
+        while True:
+            delay = self.try_acquire(tokens)
+            if delay <= 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+
+_provider_buckets = {}
+_provider_buckets_lock = threading.Lock()
+
+
+def provider_bucket(smtp_server):
+    """Shared token bucket for an SMTP provider (one per host, across campaigns)"""
+    with _provider_buckets_lock:
+        if smtp_server not in _provider_buckets:
+            per_minute = (
+                config.EMAIL_RATE_PER_MINUTE
+                or config.EMAIL_RATE_LIMITS.get(smtp_server)
+                or config.EMAIL_RATE_DEFAULT_PER_MINUTE
+            )
+            _provider_buckets[smtp_server] = TokenBucket(per_minute / 60.0, config.EMAIL_RATE_BURST)
+        return _provider_buckets[smtp_server]
+
+
+class SMTPConnectionPool:
+    """A fixed number of authenticated SMTP sessions, reconnected on failure"""
+
+    def __init__(self, email_service, size=None):
+        self.email_service = email_service
+        self.size = size or config.CAMPAIGN_SMTP_CONNECTIONS
+        self._idle = queue.LifoQueue()
+        for _ in range(self.size):
+            self._idle.put(None)  # opened lazily on first use
+
+    def send(self, recipient, message):
+        """Send one message on a pooled connection, retrying once on a dropped session"""
+        server = self._idle.get()
+        try:
+            for attempt in range(2):
+                if server is None:
+                    server = self.email_service.open_smtp_connection()
+                try:
+                    server.sendmail(self.email_service.sender_email, recipient, message)
+                    return
+                except smtplib.SMTPServerDisconnected:
+                    server = None
+                    if attempt:
+                        raise
+        except Exception:
+            # Don't hand a session in an unknown state to the next sender
+            if server is not None:
+                try:
+                    server.close()
+                except Exception:
+                    pass
+                server = None
+            raise
+        finally:
+            self._idle.put(server)
+
+    def close(self):
+        while not self._idle.empty():
+            server = self._idle.get_nowait()
+            if server is not None:
+                try:
+                    server.quit()
+                except Exception:
+                    server.close()
+
+
+class CampaignSender:
+    """Send a template to many recipients with bounded concurrency"""
+
+    def __init__(self, email_service, database, connections=None, bucket=None):
+        self.email_service = email_service
+        self.db = database
+        self.connections = connections or config.CAMPAIGN_SMTP_CONNECTIONS
+        self.bucket = bucket or provider_bucket(email_service.smtp_server)
+
+    def _send_one(self, pool, recipient, template, language):
+        email = recipient['email']
+        context = dict(recipient)
+        context.setdefault('user_name', recipient.get('name') or 'Patient')
+        message = self.email_service.templates.build_message(
+            self.email_service.sender_email, email, template, context,
+            recipient.get('language') or language
+        )
+        self.bucket.acquire()
+        pool.send(email, message)
+
+    def send(self, campaign_id, recipients, template, language='en'):
+        """Send to every recipient not already sent in this campaign; yields progress events.
+
+        recipients: iterable of dicts with at least 'email' (plus 'name', 'language' and
+        any template fields). Consumed lazily, so it can be a database stream.
+        """
+        already_sent = self.db.get_campaign_sent_recipients(campaign_id)
+        pool = SMTPConnectionPool(self.email_service, self.connections)
+        executor = ThreadPoolExecutor(max_workers=self.connections)
+        in_flight = {}
+        journal = []
+        counts = {'sent': 0, 'failed': 0, 'skipped': 0}
+        started = time.perf_counter()
+
+        def finished(done):
+            for future in done:
+                email = in_flight.pop(future)
+                error = future.exception()
+                status = 'failed' if error else 'sent'
+                counts[status] += 1
+                journal.append((campaign_id, email, status, str(error)[:255] if error else None))
+                yield {'recipient': email, 'status': status, 'error': str(error) if error else None}
+            if len(journal) >= config.CAMPAIGN_JOURNAL_BATCH:
+                self.db.record_campaign_results(journal)
+                journal.clear()
+
+        try:
+            for recipient in recipients:
+                email = (recipient.get('email') or '').strip()
+                if not email or email in already_sent:
+                    counts['skipped'] += 1
+                    continue
+                already_sent.add(email)
+                # Keep a bounded number of sends queued so huge lists don't pile up in memory
+                while len(in_flight) >= self.connections * 2:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    yield from finished(done)
+                future = executor.submit(self._send_one, pool, dict(recipient, email=email), template, language)
+                in_flight[future] = email
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                yield from finished(done)
+        finally:
+            executor.shutdown(wait=True)
+            if journal:
+                self.db.record_campaign_results(journal)
+            pool.close()
+
+        elapsed = time.perf_counter() - started
+        yield {
+            'campaign_id': campaign_id,
+            'done': True,
+            **counts,
+            'seconds': round(elapsed, 3),
+            'per_second': round(counts['sent'] / elapsed, 2) if elapsed > 0 else 0.0
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a bulk email campaign")
+    parser.add_argument('campaign_id', help="Re-use the same id to resume after a crash")
+    parser.add_argument('--template', default='recall_notice')
+    parser.add_argument('--language', default='en')
+    parser.add_argument('--file', help="NDJSON recipients (default: all patients)")
+    args = parser.parse_args()
+
+    from database import db
+    from email_service import email_service
+
+    source = open(args.file, encoding='utf-8') if args.file else None
+    if source:
+        recipients = (json.loads(line) for line in source if line.strip())
+    else:
+        recipients = db.stream_users('patient')
+
+    try:
+        sender = CampaignSender(email_service, db)
+        for event in sender.send(args.campaign_id, recipients, args.template, args.language):
+            print(json.dumps(event, ensure_ascii=False))
+    finally:
+        if source:
+            source.close()
+
+
+if __name__ == "__main__":
+    main()
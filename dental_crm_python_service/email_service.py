@@ -1,19 +1,38 @@
 import smtplib
 import ssl
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from datetime import datetime
+from functools import cached_property
 from config import config
+from email_templates import template_engine, normalize_language
 
 class EmailService:
     def __init__(self):
         # Email configuration - you can update these in your .env file
         self.sender_email = getattr(config, 'EMAIL_SENDER', None) or "your-email@gmail.com"
         self.sender_password = getattr(config, 'EMAIL_PASSWORD', None) or "your-app-password"
-        self.clinic_name = "Dental Care Clinic"
-        
-        # Auto-detect SMTP settings based on email provider
-        self.smtp_server, self.smtp_port = self._get_smtp_settings(self.sender_email)
+        self.templates = template_engine
+        self.clinic_name = self.templates.clinic['clinic_name']
+        self.use_starttls = config.SMTP_STARTTLS
+    
+    @cached_property
+    def smtp_settings(self):
+        """(server, port): explicit SMTP_SERVER wins, otherwise auto-detected on first send"""
+        if config.SMTP_SERVER:
+            return config.SMTP_SERVER, config.SMTP_PORT
+        return self._get_smtp_settings(self.sender_email)
+    
+    @property
+    def smtp_server(self):
+        return self.smtp_settings[0]
+    
+    @property
+    def smtp_port(self):
+        return self.smtp_settings[1]
+    
+    @cached_property
+    def tls_context(self):
+        """Loading the CA store is slow, so it's done once, on first use"""
+        return ssl.create_default_context(cafile=config.SMTP_CA_FILE)
     
     def _get_smtp_settings(self, email):
         """Auto-detect SMTP settings based on email provider"""
@@ -51,13 +70,8 @@ class EmailService:
         print(f"📧 No SMTP settings found for {email_domain}, using Gmail as default")
         return 'smtp.gmail.com', 587
         
-    def send_appointment_confirmation(self, user_email, user_name, appointment_date, appointment_time, appointment_type="General Checkup"):
-        """Send appointment confirmation email"""
-        print(f"📧 Attempting to send email to {user_email}")
-        print(f"📧 Sender: {self.sender_email}")
-        print(f"📧 SMTP: {self.smtp_server}:{self.smtp_port}")
-        
-        # Check if email is configured
+    def _is_configured(self):
+        """Check that real credentials have been set in .env"""
         if self.sender_email == "your-email@gmail.com" or self.sender_password == "your-app-password":
             print(f"⚠️ EMAIL NOT CONFIGURED!")
             print(f"⚠️ Please create a .env file in dental_crm_python_service/ with:")
@@ -65,52 +79,43 @@ class EmailService:
             print(f"⚠️ EMAIL_PASSWORD=your-gmail-app-password")
             print(f"⚠️ See EMAIL_SETUP.md for detailed instructions")
             return False
-            
+        return True
+    
+    def open_smtp_connection(self):
+        """Open an authenticated SMTP session (caller closes it)"""
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=config.SMTP_TIMEOUT_SECONDS)
         try:
-            # Create message
-            msg = MIMEMultipart()
-            msg['From'] = self.sender_email
-            msg['To'] = user_email
-            msg['Subject'] = f"Appointment Confirmation - {self.clinic_name}"
-            
-            # Email body
-            body = f"""
-Dear {user_name},
-
-Thank you for scheduling your appointment with {self.clinic_name}!
-
-📅 Appointment Details:
-• Date: {appointment_date}
-• Time: {appointment_time}
-• Service: {appointment_type}
-
-📍 Location:
-{self.clinic_name}
-123 Main Street, City, State 12345
-
-📞 Contact: (555) 123-4567
-
-Please arrive 15 minutes early for your appointment. If you need to reschedule or cancel, please contact us at least 24 hours in advance.
-
-We look forward to seeing you!
-
-Best regards,
-{self.clinic_name} Team
-
----
-This is an automated message. Please do not reply to this email.
-            """
-            
-            msg.attach(MIMEText(body, 'plain'))
+            if self.use_starttls:
+                server.starttls(context=self.tls_context)
+            server.login(self.sender_email, self.sender_password)
+        except Exception:
+            server.close()
+            raise
+        return server
+    
+    def _deliver(self, user_email, template, context, language='en'):
+        """Render a template and send it over a fresh SMTP session"""
+        message = self.templates.build_message(self.sender_email, user_email, template, context, language)
+        with self.open_smtp_connection() as server:
+            server.sendmail(self.sender_email, user_email, message)
+    
+    def send_appointment_confirmation(self, user_email, user_name, appointment_date, appointment_time, appointment_type="General Checkup", language='en'):
+        """Send appointment confirmation email"""
+        print(f"📧 Attempting to send email to {user_email}")
+        print(f"📧 Sender: {self.sender_email}")
+        print(f"📧 SMTP: {self.smtp_server}:{self.smtp_port}")
+        
+        # Check if email is configured
+        if not self._is_configured():
+            return False
             
-            # Create SMTP session
-            context = ssl.create_default_context()
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls(context=context)
-                server.login(self.sender_email, self.sender_password)
-                text = msg.as_string()
-                server.sendmail(self.sender_email, user_email, text)
-                
+        try:
+            self._deliver(user_email, 'appointment_confirmation', {
+                'user_name': user_name,
+                'appointment_date': appointment_date,
+                'appointment_time': appointment_time,
+                'appointment_type': appointment_type
+            }, language)
             print(f"✅ Confirmation email sent to {user_email}")
             return True
             
@@ -118,50 +123,17 @@ This is an automated message. Please do not reply to this email.
             print(f"❌ Failed to send email to {user_email}: {e}")
             return False
     
-    def send_reschedule_confirmation(self, user_email, user_name, old_date, old_time, new_date, new_time, appointment_type="General Checkup"):
+    def send_reschedule_confirmation(self, user_email, user_name, old_date, old_time, new_date, new_time, appointment_type="General Checkup", language='en'):
         """Send reschedule confirmation email"""
         try:
-            msg = MIMEMultipart()
-            msg['From'] = self.sender_email
-            msg['To'] = user_email
-            msg['Subject'] = f"Appointment Rescheduled - {self.clinic_name}"
-            
-            body = f"""
-Dear {user_name},
-
-Your appointment with {self.clinic_name} has been successfully rescheduled!
-
-🔄 Reschedule Details:
-• Previous: {old_date} at {old_time}
-• New: {new_date} at {new_time}
-• Service: {appointment_type}
-
-📍 Location:
-{self.clinic_name}
-123 Main Street, City, State 12345
-
-📞 Contact: (555) 123-4567
-
-Please arrive 15 minutes early for your appointment. If you need any further changes, please contact us at least 24 hours in advance.
-
-Thank you for your patience!
-
-Best regards,
-{self.clinic_name} Team
-
----
-This is an automated message. Please do not reply to this email.
-            """
-            
-            msg.attach(MIMEText(body, 'plain'))
-            
-            context = ssl.create_default_context()
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls(context=context)
-                server.login(self.sender_email, self.sender_password)
-                text = msg.as_string()
-                server.sendmail(self.sender_email, user_email, text)
-                
+            self._deliver(user_email, 'reschedule_confirmation', {
+                'user_name': user_name,
+                'old_date': old_date,
+                'old_time': old_time,
+                'new_date': new_date,
+                'new_time': new_time,
+                'appointment_type': appointment_type
+            }, language)
             print(f"✅ Reschedule confirmation email sent to {user_email}")
             return True
             
@@ -169,67 +141,48 @@ This is an automated message. Please do not reply to this email.
             print(f"❌ Failed to send reschedule email to {user_email}: {e}")
             return False
     
-    def send_password_reset_email(self, user_email, user_name, reset_token):
+    def send_appointment_reminder(self, user_email, user_name, appointment_date, appointment_time, appointment_type="General Checkup", hours_ahead=24, language='en'):
+        """Send appointment reminder email"""
+        if not self._is_configured():
+            print(f"⚠️ Skipping reminder to {user_email}")
+            return False
+        
+        try:
+            if normalize_language(language) == 'ur':
+                when = "کل" if hours_ahead >= 24 else "جلد"
+            else:
+                when = "tomorrow" if hours_ahead >= 24 else "soon"
+            self._deliver(user_email, 'appointment_reminder', {
+                'user_name': user_name,
+                'appointment_date': appointment_date,
+                'appointment_time': appointment_time,
+                'appointment_type': appointment_type,
+                'when': when
+            }, language)
+            print(f"✅ Reminder email sent to {user_email}")
+            return True
+            
+        except Exception as e:
+            print(f"❌ Failed to send reminder email to {user_email}: {e}")
+            return False
+    
+    def send_password_reset_email(self, user_email, user_name, reset_token, language='en'):
         """Send password reset email"""
         print(f"📧 Attempting to send password reset email to {user_email}")
         print(f"📧 Sender: {self.sender_email}")
         print(f"📧 SMTP: {self.smtp_server}:{self.smtp_port}")
         
         # Check if email is configured
-        if self.sender_email == "your-email@gmail.com" or self.sender_password == "your-app-password":
-            print(f"⚠️ EMAIL NOT CONFIGURED!")
-            print(f"⚠️ Please create a .env file in dental_crm_python_service/ with:")
-            print(f"⚠️ EMAIL_SENDER=your-email@gmail.com")
-            print(f"⚠️ EMAIL_PASSWORD=your-gmail-app-password")
-            print(f"⚠️ See EMAIL_SETUP.md for detailed instructions")
+        if not self._is_configured():
             return False
             
         try:
-            # Create message
-            msg = MIMEMultipart()
-            msg['From'] = self.sender_email
-            msg['To'] = user_email
-            msg['Subject'] = f"Password Reset Request - {self.clinic_name}"
-            
             # Create reset link (you'll need to update this with your frontend URL)
             reset_link = f"http://localhost:3000/reset-password?token={reset_token}"
-            
-            # Email body
-            body = f"""
-Dear {user_name},
-
-We received a request to reset your password for your {self.clinic_name} account.
-
-🔐 To reset your password, please click the link below:
-{reset_link}
-
-⚠️ Important Security Information:
-• This link will expire in 1 hour for security reasons
-• If you didn't request this password reset, please ignore this email
-• Your password will remain unchanged until you create a new one
-
-📞 Need Help?
-If you're having trouble with the link above, please contact us:
-• Phone: (555) 123-4567
-• Email: support@{self.clinic_name.lower().replace(' ', '')}.com
-
-Best regards,
-{self.clinic_name} Team
-
----
-This is an automated message. Please do not reply to this email.
-            """
-            
-            msg.attach(MIMEText(body, 'plain'))
-            
-            # Create SMTP session
-            context = ssl.create_default_context()
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls(context=context)
-                server.login(self.sender_email, self.sender_password)
-                text = msg.as_string()
-                server.sendmail(self.sender_email, user_email, text)
-                
+            self._deliver(user_email, 'password_reset', {
+                'user_name': user_name,
+                'reset_link': reset_link
+            }, language)
             print(f"✅ Password reset email sent to {user_email}")
             return True
             
@@ -240,31 +193,7 @@ This is an automated message. Please do not reply to this email.
     def send_test_email(self, user_email):
         """Send test email to verify email configuration"""
         try:
-            msg = MIMEMultipart()
-            msg['From'] = self.sender_email
-            msg['To'] = user_email
-            msg['Subject'] = f"Test Email - {self.clinic_name}"
-            
-            body = f"""
-Hello!
-
-This is a test email from {self.clinic_name} chatbot service.
-
-If you receive this email, the email configuration is working correctly!
-
-Best regards,
-{self.clinic_name} Team
-            """
-            
-            msg.attach(MIMEText(body, 'plain'))
-            
-            context = ssl.create_default_context()
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls(context=context)
-                server.login(self.sender_email, self.sender_password)
-                text = msg.as_string()
-                server.sendmail(self.sender_email, user_email, text)
-                
+            self._deliver(user_email, 'test', {})
             print(f"✅ Test email sent to {user_email}")
             return True
             
@@ -0,0 +1,452 @@
+"""Precompiled email templates shared by every EmailService message.
+
+Templates are compiled once into literal/placeholder segments (with the
+clinic name, address and phone already substituted), cached per
+language, and rendered straight into a pre-built MIME skeleton, so a
+send costs a few string joins instead of building and serialising a
+MIMEMultipart tree.
+"""
+import base64
+import html
+from functools import lru_cache
+from email.header import Header
+from email.utils import formataddr, formatdate, make_msgid, parseaddr
+from string import Template
+from uuid import uuid4
+
+CLINIC = {
+    'clinic_name': "Dental Care Clinic",
+    'clinic_address': "123 Main Street, City, State 12345",
+    'clinic_phone': "(555) 123-4567",
+    'clinic_support_email': "support@dentalcareclinic.com",
+}
+
+DEFAULT_LANGUAGE = 'en'
+
+# Shared blocks, substituted at compile time
+PARTIALS = {
+    'en': {
+        'location_block': "📍 Location:\n${clinic_name}\n${clinic_address}\n\n📞 Contact: ${clinic_phone}",
+        'signature': "Best regards,\n${clinic_name} Team",
+        'footer': "---\nThis is an automated message. Please do not reply to this email.",
+    },
+    'ur': {
+        'location_block': "📍 پتہ:\n${clinic_name}\n${clinic_address}\n\n📞 رابطہ: ${clinic_phone}",
+        'signature': "نیک تمنائیں،\n${clinic_name} ٹیم",
+        'footer': "---\nیہ ایک خودکار پیغام ہے۔ براہ کرم اس ای میل کا جواب نہ دیں۔",
+    },
+}
+
+TEMPLATES = {
+    'appointment_confirmation': {
+        'en': {
+            'subject': "Appointment Confirmation - ${clinic_name}",
+            'text': """Dear ${user_name},
+
+Thank you for scheduling your appointment with ${clinic_name}!
+
+📅 Appointment Details:
+• Date: ${appointment_date}
+• Time: ${appointment_time}
+• Service: ${appointment_type}
+
+${location_block}
+
+Please arrive 15 minutes early for your appointment. If you need to reschedule or cancel, please contact us at least 24 hours in advance.
+
+We look forward to seeing you!
+
+${signature}
+
+${footer}
+""",
+            'html': """<html><body style="font-family: Arial, sans-serif">
+<p>Dear ${user_name},</p>
+<p>Thank you for scheduling your appointment with <strong>${clinic_name}</strong>!</p>
+<table cellpadding="4">
+<tr><td>📅 Date</td><td><strong>${appointment_date}</strong></td></tr>
+<tr><td>🕐 Time</td><td><strong>${appointment_time}</strong></td></tr>
+<tr><td>🦷 Service</td><td>${appointment_type}</td></tr>
+</table>
+<p>📍 ${clinic_name}<br>${clinic_address}<br>📞 ${clinic_phone}</p>
+<p>Please arrive 15 minutes early for your appointment. If you need to reschedule or cancel, please contact us at least 24 hours in advance.</p>
+<p>Best regards,<br>${clinic_name} Team</p>
+</body></html>
+""",
+        },
+        'ur': {
+            'subject': "اپائنٹمنٹ کی تصدیق - ${clinic_name}",
+            'text': """محترم ${user_name}،
+
+${clinic_name} کے ساتھ اپائنٹمنٹ بک کرنے کا شکریہ!
+
+📅 اپائنٹمنٹ کی تفصیلات:
+• تاریخ: ${appointment_date}
+• وقت: ${appointment_time}
+• سروس: ${appointment_type}
+
+${location_block}
+
+براہ کرم اپنے وقت سے 15 منٹ پہلے تشریف لائیں۔ اگر آپ کو وقت تبدیل یا منسوخ کرنا ہو تو کم از کم 24 گھنٹے پہلے ہم سے رابطہ کریں۔
+
+${signature}
+
+${footer}
+""",
+            'html': """<html><body dir="rtl" style="font-family: Arial, sans-serif">
+<p>محترم ${user_name}،</p>
+<p><strong>${clinic_name}</strong> کے ساتھ اپائنٹمنٹ بک کرنے کا شکریہ!</p>
+<table cellpadding="4">
+<tr><td>📅 تاریخ</td><td><strong>${appointment_date}</strong></td></tr>
+<tr><td>🕐 وقت</td><td><strong>${appointment_time}</strong></td></tr>
+<tr><td>🦷 سروس</td><td>${appointment_type}</td></tr>
+</table>
+<p>📍 ${clinic_name}<br>${clinic_address}<br>📞 ${clinic_phone}</p>
+<p>نیک تمنائیں،<br>${clinic_name} ٹیم</p>
+</body></html>
+""",
+        },
+    },
+    'reschedule_confirmation': {
+        'en': {
+            'subject': "Appointment Rescheduled - ${clinic_name}",
+            'text': """Dear ${user_name},
+
+Your appointment with ${clinic_name} has been successfully rescheduled!
+
+🔄 Reschedule Details:
+• Previous: ${old_date} at ${old_time}
+• New: ${new_date} at ${new_time}
+• Service: ${appointment_type}
+
+${location_block}
+
+Please arrive 15 minutes early for your appointment. If you need any further changes, please contact us at least 24 hours in advance.
+
+Thank you for your patience!
+
+${signature}
+
+${footer}
+""",
+        },
+        'ur': {
+            'subject': "اپائنٹمنٹ تبدیل کر دی گئی - ${clinic_name}",
+            'text': """محترم ${user_name}،
+
+${clinic_name} کے ساتھ آپ کی اپائنٹمنٹ کامیابی سے تبدیل کر دی گئی ہے!
+
+🔄 تفصیلات:
+• پہلے: ${old_date} کو ${old_time}
+• اب: ${new_date} کو ${new_time}
+• سروس: ${appointment_type}
+
+${location_block}
+
+براہ کرم اپنے وقت سے 15 منٹ پہلے تشریف لائیں۔
+
+${signature}
+
+${footer}
+""",
+        },
+    },
+    'appointment_reminder': {
+        'en': {
+            'subject': "Appointment Reminder - ${clinic_name}",
+            'text': """Dear ${user_name},
+
+This is a friendly reminder that your appointment with ${clinic_name} is ${when}.
+
+📅 Appointment Details:
+• Date: ${appointment_date}
+• Time: ${appointment_time}
+• Service: ${appointment_type}
+
+${location_block}
+
+Please arrive 15 minutes early. If you need to reschedule or cancel, please contact us as soon as possible.
+
+${signature}
+
+${footer}
+""",
+        },
+        'ur': {
+            'subject': "اپائنٹمنٹ کی یاد دہانی - ${clinic_name}",
+            'text': """محترم ${user_name}،
+
+یاد دہانی: ${clinic_name} کے ساتھ آپ کی اپائنٹمنٹ ${when} ہے۔
+
+📅 اپائنٹمنٹ کی تفصیلات:
+• تاریخ: ${appointment_date}
+• وقت: ${appointment_time}
+• سروس: ${appointment_type}
+
+${location_block}
+
+براہ کرم 15 منٹ پہلے تشریف لائیں۔
+
+${signature}
+
+${footer}
+""",
+        },
+    },
+    'password_reset': {
+        'en': {
+            'subject': "Password Reset Request - ${clinic_name}",
+            'text': """Dear ${user_name},
+
+We received a request to reset your password for your ${clinic_name} account.
+
+🔐 To reset your password, please click the link below:
+${reset_link}
+
+⚠️ Important Security Information:
+• This link will expire in 1 hour for security reasons
+• If you didn't request this password reset, please ignore this email
+• Your password will remain unchanged until you create a new one
+
+📞 Need Help?
+If you're having trouble with the link above, please contact us:
+• Phone: ${clinic_phone}
+• Email: ${clinic_support_email}
+
+${signature}
+
+${footer}
+""",
+            'html': """<html><body style="font-family: Arial, sans-serif">
+<p>Dear ${user_name},</p>
+<p>We received a request to reset your password for your ${clinic_name} account.</p>
+<p><a href="${reset_link}">🔐 Reset your password</a></p>
+<ul>
+<li>This link will expire in 1 hour for security reasons</li>
+<li>If you didn't request this password reset, please ignore this email</li>
+<li>Your password will remain unchanged until you create a new one</li>
+</ul>
+<p>Need help? Call ${clinic_phone} or email ${clinic_support_email}.</p>
+<p>Best regards,<br>${clinic_name} Team</p>
+</body></html>
+""",
+        },
+        'ur': {
+            'subject': "پاس ورڈ ری سیٹ کی درخواست - ${clinic_name}",
+            'text': """محترم ${user_name}،
+
+ہمیں آپ کے ${clinic_name} اکاؤنٹ کا پاس ورڈ ری سیٹ کرنے کی درخواست موصول ہوئی ہے۔
+
+🔐 پاس ورڈ ری سیٹ کرنے کے لیے نیچے دیے گئے لنک پر کلک کریں:
+${reset_link}
+
+⚠️ یہ لنک 1 گھنٹے میں ختم ہو جائے گا۔ اگر آپ نے یہ درخواست نہیں کی تو اس ای میل کو نظر انداز کریں۔
+
+📞 مدد: ${clinic_phone} • ${clinic_support_email}
+
+${signature}
+
+${footer}
+""",
+        },
+    },
+    'recall_notice': {
+        'en': {
+            'subject': "Time for your dental check-up - ${clinic_name}",
+            'text': """Dear ${user_name},
+
+It's been a while since your last visit to ${clinic_name}. Regular check-ups help catch problems early and keep your smile healthy.
+
+Reply to our chatbot or call us to book a convenient time.
+
+${location_block}
+
+${signature}
+
+${footer}
+""",
+        },
+        'ur': {
+            'subject': "دانتوں کے معائنے کا وقت - ${clinic_name}",
+            'text': """محترم ${user_name}،
+
+${clinic_name} میں آپ کے پچھلے معائنے کو کافی وقت گزر چکا ہے۔ باقاعدہ چیک اپ سے مسائل جلد پکڑے جاتے ہیں اور آپ کی مسکراہٹ صحت مند رہتی ہے۔
+
+مناسب وقت بک کرنے کے لیے ہمارے چیٹ بوٹ سے بات کریں یا ہمیں کال کریں۔
+
+${location_block}
+
+${signature}
+
+${footer}
+""",
+        },
+    },
+    'test': {
+        'en': {
+            'subject': "Test Email - ${clinic_name}",
+            'text': """Hello!
+
+This is a test email from ${clinic_name} chatbot service.
+
+If you receive this email, the email configuration is working correctly!
+
+${signature}
+""",
+        },
+    },
+}
+
+
+def normalize_language(language):
+    """Map chatbot language names ('urdu', 'english', ...) to template codes"""
+    language = (language or DEFAULT_LANGUAGE).lower()
+    return 'ur' if language in ('ur', 'urdu') else 'en'
+
+
+class CompiledTemplate:
+    """A template pre-split into literal text and placeholder names"""
+
+    __slots__ = ('literals', 'fields', 'escape')
+
+    def __init__(self, source, escape=None):
+        self.literals = []
+        self.fields = []
+        self.escape = escape
+        position = 0
+        pending = ''
+        for match in Template.pattern.finditer(source):
+            pending += source[position:match.start()]
+            position = match.end()
+            if match.group('escaped') is not None:
+                pending += '$'
+                continue
+            name = match.group('named') or match.group('braced')
+            if name is None:
+                raise ValueError(f"Invalid placeholder in template at {match.start()}")
+            self.literals.append(pending)
+            self.fields.append(name)
+            pending = ''
+        self.literals.append(pending + source[position:])
+
+    def render(self, context):
+        escape = self.escape
+        parts = [self.literals[0]]
+        for name, literal in zip(self.fields, self.literals[1:]):
+            value = str(context[name])
+            parts.append(escape(value) if escape else value)
+            parts.append(literal)
+        return ''.join(parts)
+
+
+def _encode_body(body, subtype):
+    """MIME headers + body for one text part (7bit when possible, else base64)"""
+    body = body.replace('\r\n', '\n').replace('\n', '\r\n')
+    if body.isascii() and all(len(line) < 998 for line in body.split('\r\n')):
+        return (
+            f'Content-Type: text/{subtype}; charset="us-ascii"\r\n'
+            'Content-Transfer-Encoding: 7bit\r\n\r\n' + body
+        )
+    encoded = base64.encodebytes(body.encode('utf-8')).decode('ascii').replace('\n', '\r\n')
+    return (
+        f'Content-Type: text/{subtype}; charset="utf-8"\r\n'
+        'Content-Transfer-Encoding: base64\r\n\r\n' + encoded
+    )
+
+
+@lru_cache(maxsize=256)
+def _encode_header(value):
+    return value if value.isascii() else Header(value, 'utf-8').encode(linesep='\r\n')
+
+
+def _header_text(field, value):
+    """A header value, refusing CR/LF: they would start another header (or the body)"""
+    value = str(value)
+    if '\r' in value or '\n' in value:
+        raise ValueError(f"{field} must not contain line breaks")
+    return value
+
+
+def _address(field, value):
+    """One mailbox for From/To, validated and formatted (a non-ASCII display name is encoded)"""
+    display_name, address = parseaddr(_header_text(field, value))
+    if '@' not in address:
+        raise ValueError(f"Invalid {field} address: {value!r}")
+    return formataddr((display_name, address), charset='utf-8')
+
+
+class TemplateEngine:
+    """Compiles every template once and renders messages into MIME skeletons"""
+
+    def __init__(self, clinic=None):
+        self.clinic = dict(CLINIC, **(clinic or {}))
+        self._cache = {}
+        for name, languages in TEMPLATES.items():
+            for language, parts in languages.items():
+                self._cache[(name, language)] = self._compile(language, parts)
+        # The boundary only has to be absent from the bodies; base64/escaped parts never contain it
+        self._boundary = f"=_dental_crm_{uuid4().hex}"
+        self._msgid_domain = self.clinic['clinic_support_email'].split('@')[-1]
+
+    def _compile(self, language, parts):
+        partials = {
+            key: Template(value).safe_substitute(self.clinic)
+            for key, value in PARTIALS[language].items()
+        }
+        static = dict(self.clinic, **partials)
+        compiled = {
+            'subject': CompiledTemplate(Template(parts['subject']).safe_substitute(static)),
+            'text': CompiledTemplate(Template(parts['text']).safe_substitute(static)),
+        }
+        if parts.get('html'):
+            compiled['html'] = CompiledTemplate(Template(parts['html']).safe_substitute(static), escape=html.escape)
+        return compiled
+
+    def get(self, name, language=DEFAULT_LANGUAGE):
+        """Compiled template for a language, falling back to English"""
+        language = normalize_language(language)
+        compiled = self._cache.get((name, language)) or self._cache.get((name, DEFAULT_LANGUAGE))
+        if compiled is None:
+            raise KeyError(f"Unknown email template '{name}'")
+        return compiled
+
+    def render(self, name, context, language=DEFAULT_LANGUAGE):
+        """Render (subject, text, html or None)"""
+        compiled = self.get(name, language)
+        html_part = compiled.get('html')
+        return (
+            compiled['subject'].render(context),
+            compiled['text'].render(context),
+            html_part.render(context) if html_part else None
+        )
+
+    def build_message(self, sender, recipient, name, context, language=DEFAULT_LANGUAGE, include_html=True):
+        """Render a template into a complete RFC 5322 message (bytes) ready for sendmail.
+        
+        Raises ValueError if the sender, recipient or rendered subject contains a line break.
+        """
+        sender, recipient = _address('From', sender), _address('To', recipient)
+        subject, text, html_body = self.render(name, context, language)
+        headers = (
+            f"From: {sender}\r\n"
+            f"To: {recipient}\r\n"
+            f"Subject: {_encode_header(_header_text('Subject', subject))}\r\n"
+            f"Date: {formatdate(localtime=True)}\r\n"
+            f"Message-ID: {make_msgid(domain=self._msgid_domain)}\r\n"
+            "MIME-Version: 1.0\r\n"
+        )
+        if html_body is None or not include_html:
+            return (headers + _encode_body(text, 'plain')).encode('ascii')
+
+        boundary = self._boundary
+        return (
+            headers
+            + f'Content-Type: multipart/alternative; boundary="{boundary}"\r\n\r\n'
+            + f"--{boundary}\r\n" + _encode_body(text, 'plain') + "\r\n"
+            + f"--{boundary}\r\n" + _encode_body(html_body, 'html') + "\r\n"
+            + f"--{boundary}--\r\n"
+        ).encode('ascii')
+
+
+# Compiled once at import (service startup)
+template_engine = TemplateEngine()
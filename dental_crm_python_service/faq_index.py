@@ -0,0 +1,205 @@
+"""Local FAQ retrieval ahead of the LLM.
+
+faq_corpus.json holds curated questions and answers about services,
+prices, aftercare and opening hours, in English and Urdu. Every question
+variant is embedded once into a float32 matrix that is saved under
+FAQ_INDEX_DIR and memory-mapped when loaded, so worker processes share
+the pages instead of each holding a copy. A lookup embeds the patient's
+message and scores it against every row with one matrix-vector product
+(rows and query are unit length, so that is cosine similarity).
+
+The embedding is local and deterministic: word and character-trigram
+features hashed into FAQ_EMBEDDING_DIM signed buckets. It needs no
+model download or API call and works the same for Urdu script. The
+index is rebuilt automatically when the corpus or the dimension changes.
+
+    python faq_index.py build
+    python faq_index.py query "what time do you close on saturday"
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import zlib
+from typing import NamedTuple
+
+import numpy as np
+
+from config import config
+
+EMBEDDINGS_FILE = 'embeddings.npy'
+META_FILE = 'meta.json'
+
+STOPWORDS = frozenset((
+    'a', 'an', 'the', 'is', 'are', 'do', 'does', 'i', 'me', 'my', 'you', 'your',
+    'of', 'to', 'for', 'in', 'on', 'at', 'it', 'can', 'what', 'please', 'and'
+))
+URDU_SCRIPT = re.compile(r'[\u0600-\u06FF]')
+WORDS = re.compile(r'\w+')
+
+
+class FaqHit(NamedTuple):
+    score: float
+    id: str
+    lang: str
+    question: str
+    answer: str
+
+
+def message_language(text):
+    """'ur' for Urdu script, 'en' otherwise"""
+    return 'ur' if URDU_SCRIPT.search(text) else 'en'
+
+
+class HashingEmbedder:
+    """Unit-length vectors of hashed word and character-trigram counts"""
+
+    def __init__(self, dim):
+        self.dim = dim
+
+    def _features(self, text):
+        words = [w for w in WORDS.findall(text.casefold()) if w not in STOPWORDS]
+        for word in words:
+            yield word, 1.0
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3], 0.5
+
+    def embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(text):
+            h = zlib.crc32(feature.encode('utf-8'))
+            # The top bit picks the sign so colliding features tend to cancel rather than add up
+            vector[h % self.dim] += weight if h & 0x80000000 else -weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_many(self, texts):
+        return np.vstack([self.embed(text) for text in texts]) if texts else np.zeros((0, self.dim), np.float32)
+
+
+def _corpus_digest(raw, dim):
+    return hashlib.sha256(raw + f"\x00{dim}".encode()).hexdigest()
+
+
+class FaqIndex:
+    def __init__(self, embeddings, row_entries, entries, embedder):
+        self.embeddings = embeddings  # (rows, dim) float32, usually a read-only memmap
+        self.row_entries = row_entries  # row -> index into entries
+        self.entries = entries
+        self.embedder = embedder
+
+    @classmethod
+    def build(cls, corpus_path=None, index_dir=None, dim=None):
+        """Embed every question variant of the corpus and write the index files"""
+        corpus_path = corpus_path or config.FAQ_CORPUS_PATH
+        index_dir = index_dir or config.FAQ_INDEX_DIR
+        dim = dim or config.FAQ_EMBEDDING_DIM
+        with open(corpus_path, 'rb') as f:
+            raw = f.read()
+        entries = json.loads(raw)
+        embedder = HashingEmbedder(dim)
+        questions, row_entries = [], []
+        for i, entry in enumerate(entries):
+            for question in entry['questions']:
+                questions.append(question)
+                row_entries.append(i)
+
+        os.makedirs(index_dir, exist_ok=True)
+        # Written under per-process temporary names and renamed, so a worker never maps a
+        # half-written file and workers building at the same time don't write into each other's
+        suffix = f".{os.getpid()}.tmp"
+        embeddings_path = os.path.join(index_dir, EMBEDDINGS_FILE)
+        embeddings = embedder.embed_many(questions)
+        np.save(embeddings_path + suffix + '.npy', embeddings)
+        os.replace(embeddings_path + suffix + '.npy', embeddings_path)
+        meta_path = os.path.join(index_dir, META_FILE)
+        with open(meta_path + suffix, 'w', encoding='utf-8') as f:
+            json.dump({
+                'corpus_sha256': _corpus_digest(raw, dim),
+                'dim': dim,
+                'row_entries': row_entries,
+                'entries': entries
+            }, f, ensure_ascii=False)
+        os.replace(meta_path + suffix, meta_path)
+        print(f"📚 FAQ index built: {len(entries)} answers, {len(questions)} questions, dim {dim}")
+        try:
+            return cls._open(index_dir)
+        except ValueError:
+            # Another worker is mid-rebuild; use this build's matrix from memory
+            index = cls(embeddings, np.asarray(row_entries, dtype=np.int32), entries, embedder)
+            index.digest = _corpus_digest(raw, dim)
+            return index
+
+    @classmethod
+    def load(cls, corpus_path=None, index_dir=None, dim=None):
+        """Map the saved index, rebuilding it first if it's missing or out of date"""
+        corpus_path = corpus_path or config.FAQ_CORPUS_PATH
+        index_dir = index_dir or config.FAQ_INDEX_DIR
+        dim = dim or config.FAQ_EMBEDDING_DIM
+        with open(corpus_path, 'rb') as f:
+            digest = _corpus_digest(f.read(), dim)
+        try:
+            index = cls._open(index_dir)
+            if index.digest == digest:
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+        return cls.build(corpus_path, index_dir, dim)
+
+    @classmethod
+    def _open(cls, index_dir):
+        with open(os.path.join(index_dir, META_FILE), encoding='utf-8') as f:
+            meta = json.load(f)
+        embeddings = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode='r')
+        if embeddings.shape != (len(meta['row_entries']), meta['dim']):
+            # Caught between another worker's two renames; load() rebuilds
+            raise ValueError("FAQ embeddings don't match the index metadata")
+        index = cls(embeddings, np.asarray(meta['row_entries'], dtype=np.int32), meta['entries'],
+                    HashingEmbedder(meta['dim']))
+        index.digest = meta['corpus_sha256']
+        return index
+
+    def search(self, text, k=None):
+        """Best `k` answers for `text` (one hit per answer), highest cosine score first"""
+        k = k or config.FAQ_TOP_K
+        if not len(self.embeddings):
+            return []
+        scores = self.embeddings @ self.embedder.embed(text)
+        # Several question variants can point at one answer, so take extra rows before de-duplicating
+        top = min(len(scores), k * 4)
+        rows = np.argpartition(-scores, top - 1)[:top]
+        rows = rows[np.argsort(-scores[rows])]
+        hits, seen = [], set()
+        for row in rows:
+            entry_index = int(self.row_entries[row])
+            if entry_index in seen:
+                continue
+            seen.add(entry_index)
+            entry = self.entries[entry_index]
+            hits.append(FaqHit(float(scores[row]), entry['id'], entry['lang'],
+                               entry['questions'][0], entry['answer']))
+            if len(hits) == k:
+                break
+        return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the local FAQ index")
+    parser.add_argument('command', choices=('build', 'query'))
+    parser.add_argument('text', nargs='?', help="Message to look up (query)")
+    parser.add_argument('-k', type=int, default=None, help="Answers to show")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        FaqIndex.build()
+        return
+    if not args.text:
+        parser.error("query needs the message text")
+    for hit in FaqIndex.load().search(args.text, args.k):
+        print(f"{hit.score:.3f}  [{hit.id}/{hit.lang}] {hit.question}\n       {hit.answer[:100]}")
+
+
+if __name__ == "__main__":
+    main()
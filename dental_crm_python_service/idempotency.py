@@ -0,0 +1,105 @@
+"""Idempotency keys for retried requests.
+
+A client that sends `Idempotency-Key: <uuid>` gets the stored response
+back when it retries with the same key, instead of a second LLM call or
+a second appointment. A duplicate that arrives while the first request
+is still running waits for it and receives the same result. Failures
+are not stored, so a retry after an error runs again.
+
+Entries live in memory for IDEMPOTENCY_TTL_SECONDS and at most
+IDEMPOTENCY_MAX_ENTRIES finished ones are kept, oldest evicted first.
+Requests still running are never evicted, so a duplicate always joins
+them rather than starting a second run.
+
+The guarantee is per worker process: a retry that lands on another
+worker, or arrives after a restart, runs again. Run a single worker or
+route a client's retries to the same worker (sticky sessions) when that
+matters.
+"""
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+from time import monotonic
+
+from config import config
+
+
+class IdempotencyKeyReused(ValueError):
+    """The key was already used for a request with a different body"""
+
+
+class _Entry:
+    __slots__ = ('future', 'fingerprint', 'created')
+
+    def __init__(self, future, fingerprint, created):
+        self.future = future
+        self.fingerprint = fingerprint
+        self.created = created
+
+
+def fingerprint(payload):
+    """Stable hash of a request body"""
+    encoded = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class IdempotencyStore:
+    """Bounded TTL map of key -> (in-flight or finished) result"""
+
+    def __init__(self, max_entries=None, ttl_seconds=None):
+        self.max_entries = max_entries or config.IDEMPOTENCY_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds or config.IDEMPOTENCY_TTL_SECONDS
+        self._entries = OrderedDict()
+        self.stats = {'executed': 0, 'replayed': 0, 'joined_in_flight': 0, 'conflicts': 0}
+
+    def _evict(self, now):
+        """Drop expired entries and make room for one more, skipping in-flight ones"""
+        stale, size = [], len(self._entries)
+        for key, entry in self._entries.items():
+            if size < self.max_entries and now - entry.created < self.ttl_seconds:
+                break
+            if entry.future.done():
+                stale.append(key)
+                size -= 1
+        for key in stale:
+            del self._entries[key]
+
+    async def run(self, key, request_fingerprint, handler):
+        """Run handler() once per key; returns (result, replayed)"""
+        now = monotonic()
+        self._evict(now)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.fingerprint != request_fingerprint:
+                self.stats['conflicts'] += 1
+                raise IdempotencyKeyReused("Idempotency-Key was already used with a different request")
+            self.stats['replayed' if entry.future.done() else 'joined_in_flight'] += 1
+            # shield: a cancelled duplicate must not cancel the original's result
+            return await asyncio.shield(entry.future), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._entries[key] = _Entry(future, request_fingerprint, now)
+        self.stats['executed'] += 1
+        try:
+            result = await handler()
+        except BaseException as e:
+            # Don't remember failures: waiters get the error, later retries run again
+            if self._entries.get(key) is not None and self._entries[key].future is future:
+                del self._entries[key]
+            if isinstance(e, Exception):
+                future.set_exception(e)
+                future.exception()  # mark retrieved so an unawaited future doesn't warn
+            else:
+                future.cancel()
+            raise
+        future.set_result(result)
+        return result, False
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Singleton instance
+idempotency_store = IdempotencyStore()
@@ -1,30 +1,33 @@
-from fastapi import FastAPI, HTTPException, Header
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Header, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, List
 import uvicorn
+import asyncio
+import json
+from time import perf_counter
 from datetime import datetime
 
 from config import config
-from database import db
-from chatbot import chatbot
-from email_service import email_service
-
-# Initialize FastAPI app
-app = FastAPI(
-    title="Dental CRM Chatbot Service",
-    description="AI-powered chatbot for dental appointment scheduling",
-    version="1.0.0"
-)
-
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Allow all origins for debugging
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+from database import Database
+from records import Message, User
+from chatbot import DentalChatbot
+from email_service import EmailService
+from resources import get_db, get_chatbot, get_email_service, warm_up
+from idempotency import idempotency_store, fingerprint, IdempotencyKeyReused
+from rate_limit import rate_limiter, llm_gate, client_ip
+from turn_writer import turn_writer
+from scheduling import slot_start, parse_appointment_date
+from bulk_io import FORMATS, aimport_lines, aiter_lines, export_lines
+from session_archiver import SessionArchiver
+from reminders import REMINDER_LOCK, ReminderScheduler
+from slot_reconciler import SlotReconciler
+from email_campaigns import CampaignSender
+from analytics import utilisation_report
+
+# Endpoints are registered on a router; create_app() mounts it
+router = APIRouter()
 
 # Pydantic models
 class ChatMessage(BaseModel):
@@ -32,6 +35,9 @@ class ChatMessage(BaseModel):
     user_id: int
     session_id: Optional[int] = None
 
+class ChatBatch(BaseModel):
+    messages: List[ChatMessage]
+
 class ChatResponse(BaseModel):
     response: str
     session_id: int
@@ -43,18 +49,26 @@ class AppointmentCreate(BaseModel):
     date: str
     time: str
     reason: str
+    provider_id: Optional[int] = None
 
 class PasswordResetRequest(BaseModel):
     email: str
     user_name: str
     reset_token: str
 
+class EmailCampaign(BaseModel):
+    campaign_id: str
+    template: str = "recall_notice"
+    language: str = "en"
+    recipients: Optional[List[dict]] = None
+    audience: Optional[str] = None
+
 class HealthCheck(BaseModel):
     status: str
     service: str
     timestamp: str
 
-@app.get("/", response_model=HealthCheck)
+@router.get("/", response_model=HealthCheck)
 async def root():
     """Health check endpoint"""
     return {
@@ -63,8 +77,8 @@ async def root():
         "timestamp": datetime.now().isoformat()
     }
 
-@app.get("/health", response_model=HealthCheck)
-async def health_check():
+@router.get("/health", response_model=HealthCheck)
+async def health_check(db: Database = Depends(get_db)):
     """Detailed health check"""
     try:
         # Check database connection
@@ -77,30 +91,60 @@ async def health_check():
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"Service unhealthy: {str(e)}")
 
-@app.post("/api/chat", response_model=ChatResponse)
-async def chat(message: ChatMessage):
-    """Main chat endpoint"""
+@router.get("/health/replicas")
+async def replica_health(db: Database = Depends(get_db)):
+    """Read-replica lag and how many reads each side served"""
+    return db.replicas.status()
+
+@router.get("/health/limits")
+async def limits_health(chatbot: DentalChatbot = Depends(get_chatbot)):
+    """Rate-limit rejections, LLM queue state, coalesced LLM calls, prompt-cache hits and FAQ answers"""
+    return {
+        "rate_limits": dict(rate_limiter.stats),
+        "llm": llm_gate.status(),
+        "llm_coalescing": chatbot.llm_flights.status(),
+        "llm_prompt_cache": chatbot.prompt_cache_status(),
+        "faq": chatbot.faq_status()
+    }
+
+@router.get("/health/idempotency")
+async def idempotency_health():
+    """Idempotency store size and replay counters"""
+    return {"entries": len(idempotency_store), **idempotency_store.stats}
+
+async def run_idempotent(response: Response, scope: str, key: Optional[str], payload: BaseModel, handler):
+    """Run handler once per Idempotency-Key; retries get the stored response"""
+    if not key:
+        return await handler()
     try:
-        user_id = message.user_id
-        session_id = message.session_id
-        
-        # Get user info
-        user_info = db.get_user_info(user_id)
-        if not user_info:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Create new session if not provided
-        if not session_id:
-            session_id = db.create_chat_session(user_id)
-            if not session_id:
-                print(" Warning: Failed to create chat session, using mock session")
-                session_id = 999999  # Mock session ID for testing
-        
-        # Get conversation history
-        history = db.get_session_history(session_id, limit=10)
-        print(f"Conversation history for session {session_id}: {len(history)} messages")
-        for i, msg in enumerate(history):
-            print(f"  {i+1}. {msg['sender']}: {msg['message'][:50]}...")
+        result, replayed = await idempotency_store.run(f"{scope}:{key}", fingerprint(payload.model_dump()), handler)
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+@router.post("/api/chat", response_model=ChatResponse)
+async def chat(
+    message: ChatMessage,
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    db: Database = Depends(get_db),
+    chatbot: DentalChatbot = Depends(get_chatbot),
+    email_service: EmailService = Depends(get_email_service)
+):
+    """Main chat endpoint (send an Idempotency-Key header to make retries safe)"""
+    rate_limiter.check('chat', client_ip(request), message.user_id)
+    return await run_idempotent(
+        response, "chat", idempotency_key, message,
+        lambda: handle_chat(message, db, chatbot, email_service)
+    )
+
+async def handle_chat(message: ChatMessage, db: Database, chatbot: DentalChatbot, email_service: EmailService):
+    """One chat turn: history, LLM reply, booking/rescheduling and emails"""
+    try:
+        user_info, session_id, history = load_chat_session(message.user_id, message.session_id, db)
         
         # Save user message (with error handling)
         try:
@@ -108,231 +152,645 @@ async def chat(message: ChatMessage):
         except Exception as e:
             print(f" Warning: Failed to save user message: {e}")
         
-        # Generate bot response
-        bot_result = chatbot.generate_response(message.message, history, user_info['name'])
-        bot_response = bot_result['response']
-        appointment_data = bot_result['appointment_data']
-        is_reschedule = bot_result.get('is_reschedule', False)
-        old_appointment_data = bot_result.get('old_appointment_data', None)
+        bot_response, appointment_data = await chat_turn(
+            message, user_info, history, db, chatbot, email_service, session_id
+        )
         
-        # Handle reschedule request
-        if is_reschedule and appointment_data and old_appointment_data:
-            print(f" Reschedule request detected")
-            print(f"  Old: {old_appointment_data['date']} {old_appointment_data['time']}")
-            print(f"  New: {appointment_data['date']} {appointment_data['time']}")
-            
-            # Find the existing appointment
-            existing_appointment = db.find_appointment_by_date_time(
-                user_id,
-                old_appointment_data['date'],
-                old_appointment_data['time']
-            )
-            
-            if existing_appointment:
-                # Reschedule the appointment
-                new_appointment_datetime = f"{appointment_data['date']} {appointment_data['time']}"
-                notes = f"Rescheduled - Reason: {appointment_data.get('reason', 'Not specified')}"
-                
-                success = db.reschedule_appointment(
-                    existing_appointment['id'],
-                    new_appointment_datetime,
-                    notes
-                )
-                
-                if success:
-                    appointment_data['appointment_id'] = existing_appointment['id']
-                    appointment_data['action'] = 'rescheduled'
-                    print(f" Appointment rescheduled successfully")
-                    
-                    # Send reschedule confirmation email
+        # Save bot response (with error handling)
+        try:
+            db.save_message(session_id, 'bot', bot_response)
+        except Exception as e:
+            print(f"⚠️ Warning: Failed to save bot response: {e}")
+        
+        return {
+            "response": bot_response,
+            "session_id": session_id,
+            "appointment_data": appointment_data,
+            "timestamp": datetime.now().isoformat()
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in chat endpoint: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.post("/api/chat/batch")
+async def chat_batch(
+    batch: ChatBatch,
+    request: Request,
+    db: Database = Depends(get_db),
+    chatbot: DentalChatbot = Depends(get_chatbot),
+    email_service: EmailService = Depends(get_email_service)
+):
+    """Run many chat messages, streaming one NDJSON result per message as it finishes.
+    
+    Messages of one session (or, without a session_id, of one user) run in order;
+    different sessions run concurrently, CHAT_BATCH_CONCURRENCY at a time. Results
+    carry the message's `index` in the batch and end with a summary line. Each
+    message is also charged to the same per-IP and per-user 'chat' limits as
+    /api/chat; one over the limit gets a 429 result line and is not run.
+    """
+    ip = client_ip(request)
+    rate_limiter.check('chat_batch', ip)
+    if len(batch.messages) > config.CHAT_BATCH_MAX_MESSAGES:
+        raise HTTPException(status_code=413, detail=f"At most {config.CHAT_BATCH_MAX_MESSAGES} messages per batch")
+    
+    conversations = {}
+    for index, message in enumerate(batch.messages):
+        key = ('session', message.session_id) if message.session_id else ('user', message.user_id)
+        conversations.setdefault(key, []).append((index, message))
+    
+    # One query each for every user, the sessions' state and every history in the batch
+    users = db.get_users_info(sorted({message.user_id for message in batch.messages}))
+    session_ids = sorted(ident for kind, ident in conversations if kind == 'session')
+    SessionArchiver(db).reopen(session_ids)
+    histories = db.get_sessions_history(session_ids, limit=10)
+    
+    results = asyncio.Queue()
+    slots = asyncio.Semaphore(config.CHAT_BATCH_CONCURRENCY)
+    
+    async def run_conversation(kind, ident, items):
+        session_id = ident if kind == 'session' else None
+        history = histories.get(session_id, [])
+        unsaved = []
+        async with slots:
+            try:
+                for index, message in items:
                     try:
-                        email_sent = email_service.send_reschedule_confirmation(
-                            user_info['email'],
-                            user_info['name'],
-                            old_appointment_data['date'],
-                            old_appointment_data['time'],
-                            appointment_data['date'],
-                            appointment_data['time'],
-                            appointment_data.get('reason', 'General Checkup')
+                        rate_limiter.check('chat', ip, message.user_id)
+                        user_info = users.get(message.user_id)
+                        if not user_info:
+                            raise HTTPException(status_code=404, detail="User not found")
+                        if session_id is None:
+                            session_id = db.create_chat_session(message.user_id) or 999999  # mock session, as /api/chat
+                        unsaved.append((session_id, 'user', message.message))
+                        bot_response, appointment_data = await chat_turn(
+                            message, user_info, history, db, chatbot, email_service, session_id
                         )
-                        if email_sent:
-                            print(f" Reschedule confirmation email sent to {user_info['email']}")
-                        else:
-                            print(f" Failed to send reschedule email to {user_info['email']}")
+                    except HTTPException as e:
+                        await results.put({"index": index, "status": e.status_code, "detail": e.detail})
+                        continue
                     except Exception as e:
-                        print(f" Reschedule email service error: {e}")
-                else:
-                    print(f" Failed to reschedule appointment")
-            else:
-                print(f" No existing appointment found to reschedule")
+                        print(f"Error in chat batch: {e}")
+                        await results.put({"index": index, "status": 500, "detail": f"Internal server error: {str(e)}"})
+                        continue
+                    
+                    now = datetime.now()
+                    unsaved.append((session_id, 'bot', bot_response))
+                    history = (history + [
+                        Message(None, 'user', message.message, now),
+                        Message(None, 'bot', bot_response, now)
+                    ])[-10:]
+                    await results.put({
+                        "index": index,
+                        "status": 200,
+                        "response": bot_response,
+                        "session_id": session_id,
+                        "appointment_data": appointment_data,
+                        "timestamp": now.isoformat()
+                    })
+            finally:
+                # One multi-row INSERT per conversation instead of two per message
+                db.save_messages(unsaved)
+    
+    async def stream():
+        started = perf_counter()
+        tasks = [asyncio.create_task(run_conversation(kind, ident, items))
+                 for (kind, ident), items in conversations.items()]
+        succeeded = 0
+        try:
+            for _ in range(len(batch.messages)):
+                result = await results.get()
+                succeeded += result['status'] == 200
+                yield json.dumps(result, default=str, ensure_ascii=False) + "\n"
+            yield json.dumps({
+                "summary": {
+                    "messages": len(batch.messages),
+                    "conversations": len(conversations),
+                    "succeeded": succeeded,
+                    "failed": len(batch.messages) - succeeded,
+                    "seconds": round(perf_counter() - started, 3)
+                }
+            }) + "\n"
+        finally:
+            # Client went away: stop starting new turns (finished ones are still saved)
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+def load_chat_session(user_id: int, session_id: Optional[int], db: Database):
+    """User, session (created or reopened) and recent history for a chat"""
+    # Get user info
+    user_info = db.get_user_info(user_id)
+    if not user_info:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    # Create new session if not provided
+    if not session_id:
+        session_id = db.create_chat_session(user_id)
+        if not session_id:
+            print(" Warning: Failed to create chat session, using mock session")
+            session_id = 999999  # Mock session ID for testing
+        history = db.get_session_history(session_id, limit=10)
+    else:
+        # The history read also says whether the patient is coming back to a session
+        # the idle closer ended (or the archiver archived); only then is there a write
+        history, state = db.get_session_history_and_state(session_id, limit=10)
+        if state and (state[0] == 'ended' or state[1] is not None):
+            SessionArchiver(db).reopen([session_id])
+            if state[1] is not None:
+                # Archived messages were just moved back; the primary has them
+                history = db.get_session_history(session_id, limit=10, primary=True)
+    
+    print(f"Conversation history for session {session_id}: {len(history)} messages")
+    for i, msg in enumerate(history):
+        print(f"  {i+1}. {msg.sender}: {msg.message[:50]}...")
+    return user_info, session_id, history
+
+async def chat_turn(message: ChatMessage, user_info: User, history: List[Message], db: Database,
+                    chatbot: DentalChatbot, email_service: EmailService, session_id: Optional[int] = None):
+    """Bot reply to one message plus any booking/rescheduling it triggers; returns (response, appointment_data)"""
+    user_id = message.user_id
+    
+    # Generate bot response; real LLM calls are awaited on the shared async client behind the concurrency cap
+    if chatbot.uses_llm:
+        bot_result = await llm_gate.run(lambda: chatbot.agenerate_response(
+            message.message, history, user_info.name, session_id
+        ))
+    else:
+        bot_result = chatbot.generate_response(message.message, history, user_info.name, session_id)
+    bot_response = bot_result['response']
+    appointment_data = bot_result['appointment_data']
+    is_reschedule = bot_result.get('is_reschedule', False)
+    old_appointment_data = bot_result.get('old_appointment_data', None)
+    
+    # Handle reschedule request
+    if is_reschedule and appointment_data and old_appointment_data:
+        print(f" Reschedule request detected")
+        print(f"  Old: {old_appointment_data['date']} {old_appointment_data['time']}")
+        print(f"  New: {appointment_data['date']} {appointment_data['time']}")
         
-        # If appointment data is extracted and it's NOT a reschedule, validate first
-        elif appointment_data and not is_reschedule:
-            # First validate working hours and days
-            is_valid_time, validation_message = db.validate_working_hours_and_days(
-                appointment_data['date'], 
-                appointment_data['time']
+        # Find the existing appointment
+        existing_appointment = db.find_appointment_by_date_time(
+            user_id,
+            old_appointment_data['date'],
+            old_appointment_data['time']
+        )
+        
+        if existing_appointment:
+            # Reschedule the appointment onto a provider who is free at the new time
+            new_appointment_datetime = f"{appointment_data['date']} {appointment_data['time']}"
+            notes = f"Rescheduled - Reason: {appointment_data.get('reason', 'Not specified')}"
+            provider = db.find_available_provider(appointment_data['date'], appointment_data['time'])
+            
+            success = db.reschedule_appointment(
+                existing_appointment.id,
+                new_appointment_datetime,
+                notes,
+                provider['id'] if provider else None
             )
             
-            if not is_valid_time:
-                # Time is outside working hours or on weekend
-                user_language = chatbot.detect_language(message.message)
+            if success:
+                appointment_data['appointment_id'] = existing_appointment.id
+                appointment_data['action'] = 'rescheduled'
+                print(f" Appointment rescheduled successfully")
                 
-                if user_language == 'urdu':
-                    if "weekends" in validation_message:
-                        bot_response = f"""معذرت! ہم ہفتے کے آخر میں بند رہتے ہیں۔
+                # Send reschedule confirmation email
+                try:
+                    email_sent = email_service.send_reschedule_confirmation(
+                        user_info.email,
+                        user_info.name,
+                        old_appointment_data['date'],
+                        old_appointment_data['time'],
+                        appointment_data['date'],
+                        appointment_data['time'],
+                        appointment_data.get('reason', 'General Checkup'),
+                        chatbot.detect_language(message.message)
+                    )
+                    if email_sent:
+                        print(f" Reschedule confirmation email sent to {user_info.email}")
+                    else:
+                        print(f" Failed to send reschedule email to {user_info.email}")
+                except Exception as e:
+                    print(f" Reschedule email service error: {e}")
+            else:
+                # The new slot filled up (or the update failed): don't let the reply confirm the move
+                print(f" Failed to reschedule appointment")
+                if chatbot.detect_language(message.message) == 'urdu':
+                    bot_response = "معذرت! آپ کی اپائنٹمنٹ تبدیل نہیں ہو سکی، یہ وقت دستیاب نہیں ہے۔ براہ کرم کوئی اور وقت منتخب کریں۔"
+                else:
+                    bot_response = "Sorry, I couldn't reschedule your appointment because that time is no longer available. Please choose a different time."
+                appointment_data = None
+        else:
+            print(f" No existing appointment found to reschedule")
+    
+    # If appointment data is extracted and it's NOT a reschedule, validate first
+    elif appointment_data and not is_reschedule:
+        # First validate working hours and days
+        is_valid_time, validation_message = db.validate_working_hours_and_days(
+            appointment_data['date'], 
+            appointment_data['time']
+        )
+        
+        if not is_valid_time:
+            # Time is outside working hours or on weekend
+            user_language = chatbot.detect_language(message.message)
+            
+            if user_language == 'urdu':
+                if "weekends" in validation_message:
+                    bot_response = f"""معذرت! ہم ہفتے کے آخر میں بند رہتے ہیں۔
 
 📅 ہمارے کام کے دن: پیر سے جمعہ
 🕐 کام کے اوقات: صبح 9 بجے سے شام 5 بجے تک
 
 براہ کرم کوئی اور تاریخ منتخب کریں۔"""
-                    else:
-                        bot_response = f"""معذرت! یہ وقت ہمارے کام کے اوقات سے باہر ہے۔
+                else:
+                    bot_response = f"""معذرت! یہ وقت ہمارے کام کے اوقات سے باہر ہے۔
 
 🕐 ہمارے کام کے اوقات: صبح 9 بجے سے شام 5 بجے تک
 📅 کام کے دن: پیر سے جمعہ
 
 براہ کرم کوئی اور وقت منتخب کریں۔"""
-                else:
-                    bot_response = f"""Sorry! {validation_message}
+            else:
+                bot_response = f"""Sorry! {validation_message}
 
 📅 Our working days: Monday-Friday
 🕐 Our working hours: 9:00 AM to 5:00 PM
 
 Please select a different time."""
-                
-                appointment_data = None
+            
+            appointment_data = None
+        else:
+            # Time is valid, book atomically: a single INSERT either claims a
+            # free provider's seat at this slot or reports the slot as taken
+            notes = f"Reason: {appointment_data.get('reason', 'Not specified')}"
+            booking = db.book_slot(
+                user_id,
+                appointment_data['date'], 
+                appointment_data['time'],
+                notes
+            )
+            
+            if booking['status'] != 'taken':
+                if booking['status'] == 'booked':
+                    appointment_id = booking['appointment_id']
+                    if booking['provider_id'] is not None:
+                        appointment_data['provider_id'] = booking['provider_id']
+                        appointment_data['provider'] = booking['provider_name']
+                    # Generate confirmation message
+                    confirmation = chatbot.confirm_appointment(appointment_data, user_info.name)
+                    bot_response = confirmation
+                    appointment_data['appointment_id'] = appointment_id
+                    
+                    # Send confirmation email
+                    try:
+                        email_sent = email_service.send_appointment_confirmation(
+                            user_info.email,
+                            user_info.name,
+                            appointment_data['date'],
+                            appointment_data['time'],
+                            appointment_data.get('reason', 'General Checkup'),
+                            chatbot.detect_language(message.message)
+                        )
+                        if email_sent:
+                            print(f" Confirmation email sent to {user_info.email}")
+                        else:
+                            print(f" Failed to send confirmation email to {user_info.email}")
+                    except Exception as e:
+                        print(f" Email service error: {e}")
+                else:
+                    bot_response = "Sorry, I couldn't create your appointment. Please try again or contact our office directly."
             else:
-                # Time is valid, check slot availability
-                is_slot_available = db.check_time_slot_availability(
+                # Slot is not available, suggest alternatives
+                print(f" Time slot not available: {appointment_data['date']} {appointment_data['time']}")
+                
+                # Get alternative time slots
+                available_slots = db.get_available_time_slots(
                     appointment_data['date'], 
                     appointment_data['time']
                 )
                 
-                if is_slot_available:
-                    # Slot is available, create appointment
-                    appointment_datetime = f"{appointment_data['date']} {appointment_data['time']}"
-                    notes = f"Reason: {appointment_data.get('reason', 'Not specified')}"
+                if available_slots:
+                    # Format available slots for display
+                    slot_options = []
+                    for slot in available_slots[:5]:  # Show first 5 options
+                        formatted_time = slot.strftime('%I:%M %p')
+                        slot_options.append(formatted_time)
                     
-                    appointment_id = db.create_appointment_from_chat(
-                        user_id, 
-                        appointment_datetime, 
-                        notes
-                    )
+                    if len(available_slots) > 5:
+                        slot_options.append("...and more")
                     
-                    if appointment_id:
-                        # Generate confirmation message
-                        confirmation = chatbot.confirm_appointment(appointment_data, user_info['name'])
-                        bot_response = confirmation
-                        appointment_data['appointment_id'] = appointment_id
-                        
-                        # Send confirmation email
-                        try:
-                            email_sent = email_service.send_appointment_confirmation(
-                                user_info['email'],
-                                user_info['name'],
-                                appointment_data['date'],
-                                appointment_data['time'],
-                                appointment_data.get('reason', 'General Checkup')
-                            )
-                            if email_sent:
-                                print(f" Confirmation email sent to {user_info['email']}")
-                            else:
-                                print(f" Failed to send confirmation email to {user_info['email']}")
-                        except Exception as e:
-                            print(f" Email service error: {e}")
-                    else:
-                        bot_response = "Sorry, I couldn't create your appointment. Please try again or contact our office directly."
-                else:
-                    # Slot is not available, suggest alternatives
-                    print(f" Time slot not available: {appointment_data['date']} {appointment_data['time']}")
+                    # Detect user language for response
+                    user_language = chatbot.detect_language(message.message)
                     
-                    # Get alternative time slots
-                    available_slots = db.get_available_time_slots(
-                        appointment_data['date'], 
-                        appointment_data['time']
-                    )
-                    
-                    if available_slots:
-                        # Format available slots for display
-                        slot_options = []
-                        for slot in available_slots[:5]:  # Show first 5 options
-                            formatted_time = slot.strftime('%I:%M %p')
-                            slot_options.append(formatted_time)
-                        
-                        if len(available_slots) > 5:
-                            slot_options.append("...and more")
-                        
-                        # Detect user language for response
-                        user_language = chatbot.detect_language(message.message)
-                        
-                        if user_language == 'urdu':
-                            bot_response = f"""معذرت! یہ وقت پہلے سے بک ہے: {appointment_data['date']} کو {appointment_data['time']}
+                    if user_language == 'urdu':
+                        bot_response = f"""معذرت! یہ وقت پہلے سے بک ہے: {appointment_data['date']} کو {appointment_data['time']}
 
 📅 دستیاب وقت:
 {chr(10).join([f"• {slot}" for slot in slot_options])}
 
 براہ کرم کوئی اور وقت منتخب کریں۔ کیا میں آپ کے لیے کوئی اور وقت بک کر دوں؟"""
-                        else:
-                            bot_response = f"""Sorry! This time slot is already booked: {appointment_data['date']} at {appointment_data['time']}
+                    else:
+                        bot_response = f"""Sorry! This time slot is already booked: {appointment_data['date']} at {appointment_data['time']}
 
 📅 Available times:
 {chr(10).join([f"• {slot}" for slot in slot_options])}
 
 Please select an alternative time. Would you like me to book one of these slots for you?"""
-                        
-                        # Clear appointment_data since we couldn't book the requested slot
-                        appointment_data = None
-                    else:
-                        # No slots available for the day
-                        user_language = chatbot.detect_language(message.message)
-                        
-                        if user_language == 'urdu':
-                            bot_response = f"""معذرت! {appointment_data['date']} کو کوئی وقت دستیاب نہیں ہے۔
+                    
+                    # Clear appointment_data since we couldn't book the requested slot
+                    appointment_data = None
+                else:
+                    # No slots available for the day
+                    user_language = chatbot.detect_language(message.message)
+                    
+                    if user_language == 'urdu':
+                        bot_response = f"""معذرت! {appointment_data['date']} کو کوئی وقت دستیاب نہیں ہے۔
 
 📅 براہ کرم کوئی اور تاریخ منتخب کریں یا ہمارے دفتر سے رابطہ کریں۔"""
-                        else:
-                            bot_response = f"""Sorry! No time slots are available on {appointment_data['date']}.
+                    else:
+                        bot_response = f"""Sorry! No time slots are available on {appointment_data['date']}.
 
 📅 Please select a different date or contact our office directly."""
-                        
-                        appointment_data = None
-        
-        # Save bot response (with error handling)
+                    
+                    appointment_data = None
+    
+    return bot_response, appointment_data
+
+socket_stats = {'open': 0, 'opened': 0, 'idle_closed': 0, 'busy_rejected': 0}
+
+@router.websocket("/ws/chat")
+async def chat_socket(
+    websocket: WebSocket,
+    user_id: int,
+    session_id: Optional[int] = None,
+    db: Database = Depends(get_db),
+    chatbot: DentalChatbot = Depends(get_chatbot),
+    email_service: EmailService = Depends(get_email_service)
+):
+    """Chat over a WebSocket (/ws/chat?user_id=..&session_id=..).
+    
+    User, session and history are loaded once at connect and kept in memory;
+    messages are saved in the background, so a turn costs the bot reply only.
+    Send {"message": "..."} (or plain text); replies carry the /api/chat fields.
+    """
+    ip = client_ip(websocket)
+    try:
+        rate_limiter.check('chat', ip, user_id)
+        user_info, session_id, history = load_chat_session(user_id, session_id, db)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=str(e.detail))
+        return
+    
+    await websocket.accept()
+    socket_stats['open'] += 1
+    socket_stats['opened'] += 1
+    inbox = asyncio.Queue(config.WS_MAX_PENDING_MESSAGES)
+    send_lock = asyncio.Lock()
+    
+    async def send(payload):
+        async with send_lock:
+            try:
+                await websocket.send_json(payload)
+            except Exception:
+                pass  # client already gone
+    
+    async def receive():
+        """Read frames until disconnect or idle timeout; refuse what the inbox can't hold"""
         try:
-            db.save_message(session_id, 'bot', bot_response)
-        except Exception as e:
-            print(f"⚠️ Warning: Failed to save bot response: {e}")
-        
+            while True:
+                try:
+                    frame = await asyncio.wait_for(websocket.receive_text(), config.WS_IDLE_TIMEOUT_SECONDS)
+                except asyncio.TimeoutError:
+                    socket_stats['idle_closed'] += 1
+                    await websocket.close(code=1000, reason="Idle timeout")
+                    return
+                try:
+                    text = json.loads(frame).get('message', '') if frame.lstrip().startswith('{') else frame
+                except (ValueError, AttributeError):
+                    text = ''
+                if not isinstance(text, str) or not text.strip():
+                    await send({"type": "error", "status": 422, "detail": "Empty message"})
+                elif inbox.full():
+                    socket_stats['busy_rejected'] += 1
+                    await send({"type": "error", "status": 429, "detail": "Still answering your previous messages",
+                                "message": text})
+                else:
+                    inbox.put_nowait(text)
+        except WebSocketDisconnect:
+            return
+    
+    async def process():
+        while True:
+            text = await inbox.get()
+            if text is None:
+                return
+            started = perf_counter()
+            message = ChatMessage(message=text, user_id=user_id, session_id=session_id)
+            try:
+                rate_limiter.check('chat', ip, user_id)
+                await turn_writer.save(session_id, 'user', text)
+                bot_response, appointment_data = await chat_turn(
+                    message, user_info, history, db, chatbot, email_service, session_id
+                )
+                await turn_writer.save(session_id, 'bot', bot_response)
+            except HTTPException as e:
+                await send({"type": "error", "status": e.status_code, "detail": e.detail,
+                            "retry_after": (e.headers or {}).get("Retry-After")})
+                continue
+            except Exception as e:
+                print(f"Error in chat socket: {e}")
+                await send({"type": "error", "status": 500, "detail": f"Internal server error: {str(e)}"})
+                continue
+            
+            now = datetime.now()
+            history.append(Message(None, 'user', text, now))
+            history.append(Message(None, 'bot', bot_response, now))
+            del history[:-10]
+            await send({
+                "type": "reply",
+                "response": bot_response,
+                "session_id": session_id,
+                "appointment_data": appointment_data,
+                "timestamp": now.isoformat(),
+                "latency_ms": round((perf_counter() - started) * 1000, 1)
+            })
+    
+    await send({"type": "ready", "session_id": session_id, "history": len(history)})
+    processor = asyncio.create_task(process())
+    try:
+        await receive()
+        # Drop queued messages but let a turn that is already running finish its booking and saves
+        while not inbox.empty():
+            inbox.get_nowait()
+        inbox.put_nowait(None)
+        await processor
+    finally:
+        socket_stats['open'] -= 1
+        processor.cancel()
+
+@router.get("/health/websockets")
+async def websockets_health():
+    """Open chat sockets and the background message writer"""
+    return {**socket_stats, "writer": turn_writer.status()}
+
+@router.get("/api/chat/history/{session_id}")
+async def get_chat_history(session_id: int, limit: int = 20, before: Optional[int] = None,
+                           db: Database = Depends(get_db)):
+    """Get chat history for a session, one page at a time.
+    
+    Pass the returned next_cursor as `before` to fetch the next older page.
+    """
+    try:
+        limit = max(1, min(limit, config.HISTORY_PAGE_MAX))
+        history, next_cursor = db.get_session_history_page(session_id, before, limit)
         return {
-            "response": bot_response,
             "session_id": session_id,
-            "appointment_data": appointment_data,
-            "timestamp": datetime.now().isoformat()
+            "messages": [m._asdict() for m in history],
+            "count": len(history),
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None
         }
-        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching history: {str(e)}")
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, default=str, ensure_ascii=False) + "\n"
+
+@router.get("/api/chat/history/{session_id}/export")
+async def export_chat_history(session_id: int, db: Database = Depends(get_db)):
+    """Stream a session's full history as NDJSON"""
+    return StreamingResponse(
+        _ndjson_lines(db.stream_session_messages(session_id)),
+        media_type="application/x-ndjson"
+    )
+
+@router.get("/api/chat/export")
+async def export_user_chat_history(user_id: int, db: Database = Depends(get_db)):
+    """Stream all of a user's sessions as NDJSON"""
+    return StreamingResponse(
+        _ndjson_lines(db.stream_user_messages(user_id)),
+        media_type="application/x-ndjson"
+    )
+
+@router.post("/api/chat/session/{session_id}/end")
+async def end_chat_session(session_id: int, db: Database = Depends(get_db)):
+    """End a chat session"""
+    ended = db.end_chat_session(session_id)
+    return {"session_id": session_id, "ended": ended}
+
+@router.get("/api/chat/archive/{session_id}")
+async def get_archived_chat(session_id: int, db: Database = Depends(get_db)):
+    """Look up an archived session's messages without restoring it"""
+    try:
+        messages = SessionArchiver(db).get_archived_messages(session_id)
+        if messages is None:
+            raise HTTPException(status_code=404, detail="Session is not archived")
+        return {"session_id": session_id, "messages": [m._asdict() for m in messages], "count": len(messages)}
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in chat endpoint: {e}")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error reading archive: {str(e)}")
+
+@router.post("/api/chat/archive/{session_id}/restore")
+async def restore_archived_chat(session_id: int, db: Database = Depends(get_db)):
+    """Move an archived session's messages back into chat history"""
+    if not SessionArchiver(db).restore(session_id):
+        raise HTTPException(status_code=404, detail="Session is not archived or could not be restored")
+    return {"session_id": session_id, "restored": True}
 
-@app.get("/api/chat/history/{session_id}")
-async def get_chat_history(session_id: int, limit: int = 20):
-    """Get chat history for a session"""
+@router.get("/api/availability/next")
+async def get_next_available_slot(db: Database = Depends(get_db)):
+    """Next free slot for any provider"""
     try:
-        history = db.get_session_history(session_id, limit)
+        found = db.get_next_available_slot()
+        if not found:
+            return {"available": False}
+        start, provider = found
         return {
-            "session_id": session_id,
-            "messages": history,
-            "count": len(history)
+            "available": True,
+            "date": start.strftime('%Y-%m-%d'),
+            "time": start.strftime('%H:%M'),
+            "provider_id": provider['id'],
+            "provider": provider['name']
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching history: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error finding next slot: {str(e)}")
+
+@router.get("/api/availability/{date}")
+async def get_availability(date: str, time: str, db: Database = Depends(get_db)):
+    """Providers free at a given date and time"""
+    try:
+        index = db.get_slot_index(parse_appointment_date(date))
+        start = slot_start(date, time)
+        free = [index.providers[pid] for pid in index.free_providers(start)]
+        return {
+            "date": date,
+            "time": start.strftime('%H:%M'),
+            "available": bool(free),
+            "providers": free
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date or time: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error checking availability: {str(e)}")
 
-@app.post("/api/email/test")
-async def test_email(email: str):
+@router.post("/api/reminders/run")
+async def run_reminders(dry_run: bool = False, email_service: EmailService = Depends(get_email_service)):
+    """Run the reminder scheduler once and report its statistics.
+    
+    A sending run takes the background scheduler's lock, so it gets a 409
+    while the scheduler (on any worker) or another manual run holds it.
+    """
+    # Own connection: the run happens in a worker thread, and closing it releases the lock
+    reminder_db = Database()
+    try:
+        if not dry_run and not await asyncio.to_thread(reminder_db.hold_advisory_lock, REMINDER_LOCK):
+            raise HTTPException(status_code=409, detail="Reminders are already being sent")
+        return await asyncio.to_thread(ReminderScheduler(reminder_db, email_service).run_once, dry_run)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reminder run failed: {str(e)}")
+    finally:
+        reminder_db.close()
+
+@router.post("/api/email/campaign")
+async def send_email_campaign(campaign: EmailCampaign, request: Request,
+                              email_service: EmailService = Depends(get_email_service)):
+    """Send a template to many recipients, streaming NDJSON progress.
+    
+    Re-posting with the same campaign_id resumes: already-sent recipients are skipped.
+    """
+    rate_limiter.check('email', client_ip(request))
+    if campaign.recipients is None and campaign.audience != "patients":
+        raise HTTPException(status_code=400, detail="Provide recipients or audience='patients'")
+    try:
+        email_service.templates.get(campaign.template)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # The stream runs in a worker thread, so it gets its own connection
+    campaign_db = Database()
+    recipients = campaign.recipients if campaign.recipients is not None else campaign_db.stream_users('patient')
+    sender = CampaignSender(email_service, campaign_db)
+    
+    def progress():
+        try:
+            for event in sender.send(campaign.campaign_id, recipients, campaign.template, campaign.language):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        finally:
+            campaign_db.close()
+    
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+@router.post("/api/email/test")
+async def test_email(email: str, request: Request, email_service: EmailService = Depends(get_email_service)):
     """Test email functionality"""
+    rate_limiter.check('email', client_ip(request))
     try:
         success = email_service.send_test_email(email)
         if success:
@@ -342,9 +800,11 @@ async def test_email(email: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Email test failed: {str(e)}")
 
-@app.post("/api/email/password-reset")
-async def send_password_reset_email(request: PasswordResetRequest):
+@router.post("/api/email/password-reset")
+async def send_password_reset_email(request: PasswordResetRequest, http_request: Request,
+                                   email_service: EmailService = Depends(get_email_service)):
     """Send password reset email"""
+    rate_limiter.check('email', client_ip(http_request))
     try:
         success = email_service.send_password_reset_email(
             request.email, 
@@ -358,23 +818,40 @@ async def send_password_reset_email(request: PasswordResetRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Password reset email failed: {str(e)}")
 
-@app.post("/api/appointments/create")
-async def create_appointment(appointment: AppointmentCreate):
-    """Manually create an appointment"""
+@router.post("/api/appointments/create")
+async def create_appointment(appointment: AppointmentCreate, request: Request, response: Response,
+                             idempotency_key: Optional[str] = Header(None),
+                             db: Database = Depends(get_db)):
+    """Manually create an appointment (send an Idempotency-Key header to make retries safe)"""
+    rate_limiter.check('appointments', client_ip(request), appointment.user_id)
+    return await run_idempotent(
+        response, "appointments/create", idempotency_key, appointment,
+        lambda: book_appointment(appointment, db)
+    )
+
+async def book_appointment(appointment: AppointmentCreate, db: Database):
+    """Book a manually requested appointment"""
     try:
-        appointment_datetime = f"{appointment.date} {appointment.time}"
         notes = f"Reason: {appointment.reason}"
         
-        appointment_id = db.create_appointment_from_chat(
+        # Use the requested provider if given, otherwise any provider with spare capacity
+        booking = db.book_slot(
             appointment.user_id,
-            appointment_datetime,
-            notes
+            appointment.date,
+            appointment.time,
+            notes,
+            appointment.provider_id
         )
         
-        if appointment_id:
+        if booking['status'] == 'taken':
+            raise HTTPException(status_code=409, detail="Time slot not available")
+        if booking['status'] == 'invalid':
+            raise HTTPException(status_code=400, detail=booking['error'])
+        if booking['status'] == 'booked':
             return {
                 "success": True,
-                "appointment_id": appointment_id,
+                "appointment_id": booking['appointment_id'],
+                "provider_id": booking['provider_id'],
                 "message": "Appointment created successfully"
             }
         else:
@@ -385,30 +862,152 @@ async def create_appointment(appointment: AppointmentCreate):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating appointment: {str(e)}")
 
-@app.on_event("startup")
+@router.post("/api/appointments/{appointment_id}/cancel")
+async def cancel_appointment(appointment_id: int, db: Database = Depends(get_db)):
+    """Cancel an appointment and free its slot"""
+    cancelled = db.cancel_appointment(appointment_id)
+    if not cancelled:
+        raise HTTPException(status_code=404, detail="Appointment not found or already cancelled")
+    return {"appointment_id": appointment_id, "cancelled": True}
+
+@router.post("/api/appointments/slots/reconcile")
+async def reconcile_slots(start: Optional[str] = None, end: Optional[str] = None, dry_run: bool = False):
+    """Rebuild slot counts from appointments (default: yesterday to the booking horizon) and report drift"""
+    reconcile_db = Database()
+    try:
+        return await asyncio.to_thread(SlotReconciler(reconcile_db).run_once, start, end, dry_run)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Slot reconciliation failed: {str(e)}")
+    finally:
+        reconcile_db.close()
+
+@router.post("/api/appointments/import")
+async def import_appointments(request: Request, format: str = "csv", batch_size: Optional[int] = None):
+    """Bulk import appointments from a streamed CSV or NDJSON request body"""
+    rate_limiter.check('appointments_import', client_ip(request))
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{format}'")
+    
+    # Inserts run in a worker thread, so the import gets its own connection
+    import_db = Database()
+    try:
+        # Malformed rows (including CSV syntax errors) are reported per row in the summary
+        return await aimport_lines(import_db, aiter_lines(request.stream()), format, batch_size)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error importing appointments: {str(e)}")
+    finally:
+        import_db.close()
+
+@router.get("/api/appointments/export")
+async def export_appointments(format: str = "ndjson", start: Optional[str] = None, end: Optional[str] = None,
+                              db: Database = Depends(get_db)):
+    """Stream all appointments (optionally within [start, end)) as CSV or NDJSON"""
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{format}'")
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(export_lines(db, format, start, end), media_type=media_type)
+
+@router.get("/api/analytics/utilisation")
+async def get_utilisation(start: str, end: str, db: Database = Depends(get_db)):
+    """Bookings, fill rate and reschedule rate per day and hour for [start, end) from the hourly summary"""
+    try:
+        days = (parse_appointment_date(end) - parse_appointment_date(start)).days
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {str(e)}")
+    if not 0 < days <= config.ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"end must be after start and at most {config.ANALYTICS_MAX_DAYS} days later")
+    try:
+        return utilisation_report(db, start, end)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error building utilisation report: {str(e)}")
+
+# Strong references to long-running background tasks
+background_tasks = set()
+
+async def session_maintenance_loop():
+    """Periodically close idle sessions and archive old ones off the event loop"""
+    # The job gets its own connection: the shared one isn't safe across threads
+    archiver = SessionArchiver(Database())
+    while True:
+        await asyncio.sleep(config.SESSION_MAINTENANCE_INTERVAL_MINUTES * 60)
+        try:
+            # One worker does the maintenance; the others skip this round
+            if not await asyncio.to_thread(archiver.db.hold_advisory_lock, 'dental_crm_session_maintenance'):
+                continue
+            summary = await asyncio.to_thread(archiver.run)
+            print(f" Session maintenance: {summary}")
+        except Exception as e:
+            print(f" Session maintenance failed: {e}")
+
 async def startup_event():
     """Run on application startup"""
     print(" Starting Dental CRM Chatbot Service...")
     try:
         config.validate()
         print(" Configuration validated")
-        print(" Database connection established")
+        # Connect / build clients now (off the event loop) so the first request doesn't pay for it
+        started = perf_counter()
+        results = await asyncio.to_thread(warm_up)
+        for name, (ok, ms) in results.items():
+            print(f" {'✅' if ok else '⚠️'} {name} warm-up: {ms} ms")
+        print(f" Warm-up finished in {(perf_counter() - started) * 1000:.0f} ms")
+        if config.SESSION_MAINTENANCE_INTERVAL_MINUTES > 0:
+            background_tasks.add(asyncio.create_task(session_maintenance_loop()))
+            print(f" Session maintenance every {config.SESSION_MAINTENANCE_INTERVAL_MINUTES} min")
+        if config.REMINDER_INTERVAL_MINUTES > 0:
+            # Own connection: reminder runs happen in a worker thread
+            reminder_scheduler = ReminderScheduler(Database(), get_email_service())
+            background_tasks.add(asyncio.create_task(reminder_scheduler.run_forever()))
+            print(f" Appointment reminders every {config.REMINDER_INTERVAL_MINUTES} min")
+        if config.SLOT_RECONCILE_INTERVAL_MINUTES > 0:
+            background_tasks.add(asyncio.create_task(SlotReconciler(Database()).run_forever()))
+            print(f" Slot count reconciliation every {config.SLOT_RECONCILE_INTERVAL_MINUTES} min")
         print(f" Service running on {config.SERVICE_HOST}:{config.SERVICE_PORT}")
     except Exception as e:
         print(f"{e}")
         raise
 
-@app.on_event("shutdown")
 async def shutdown_event():
     """Run on application shutdown"""
     print("Shutting down Dental CRM Chatbot Service...")
-    db.close()
+    for task in background_tasks:
+        task.cancel()
+    await turn_writer.close()
+    await get_chatbot().aclose()
+    get_db().close()
+
+def create_app():
+    """Build the FastAPI app (uvicorn main:create_app --factory)"""
+    app = FastAPI(
+        title="Dental CRM Chatbot Service",
+        description="AI-powered chatbot for dental appointment scheduling",
+        version="1.0.0"
+    )
+    
+    # CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # Allow all origins for debugging
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    
+    app.include_router(router)
+    app.add_event_handler("startup", startup_event)
+    app.add_event_handler("shutdown", shutdown_event)
+    return app
+
+# Kept for `uvicorn main:app`; cheap now that resources are built lazily
+app = create_app()
 
 if __name__ == "__main__":
     uvicorn.run(
-        "main:app",
+        "main:create_app",
+        factory=True,
         host=config.SERVICE_HOST,
         port=config.SERVICE_PORT,
         reload=True
     )
-
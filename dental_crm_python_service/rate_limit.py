@@ -0,0 +1,130 @@
+"""Admission control: per-user / per-IP rate limits and an LLM concurrency cap.
+
+Each limited endpoint has a token bucket per user_id and per client IP
+(Config.RATE_LIMITS). A request that finds its bucket empty gets a 429
+with Retry-After. Separately, at most LLM_MAX_CONCURRENCY OpenAI calls run
+at once; further calls queue (up to LLM_MAX_QUEUE, for at most
+LLM_QUEUE_TIMEOUT_SECONDS) and are turned away with 429 + Retry-After
+when the queue is full or the wait runs out.
+
+State is in memory, per worker process.
+"""
+import asyncio
+import math
+from collections import OrderedDict, defaultdict
+from time import monotonic
+
+from fastapi import HTTPException
+
+from config import config
+from email_campaigns import TokenBucket
+
+
+def too_many_requests(detail, retry_after):
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+class RateLimiter:
+    """Token buckets keyed by (endpoint, 'user'|'ip', id), least recently used evicted"""
+
+    def __init__(self, limits=None, max_keys=None):
+        self.limits = limits or config.RATE_LIMITS
+        self.max_keys = max_keys or config.RATE_LIMIT_MAX_KEYS
+        self._buckets = OrderedDict()
+        self.stats = defaultdict(int)
+
+    def _bucket(self, key, per_minute, burst):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(per_minute / 60.0, burst)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def check(self, endpoint, ip=None, user_id=None):
+        """Take one token from each applicable bucket or raise a 429"""
+        if not config.RATE_LIMIT_ENABLED:
+            return
+        limits = self.limits.get(endpoint) or self.limits['default']
+        for scope, identity in (('ip', ip), ('user', user_id)):
+            if identity is None or scope not in limits:
+                continue
+            per_minute, burst = limits[scope]
+            wait = self._bucket((endpoint, scope, identity), per_minute, burst).try_acquire()
+            if wait > 0:
+                self.stats[f"{endpoint}:{scope}"] += 1
+                raise too_many_requests("Too many requests, please slow down.", wait)
+        self.stats[f"{endpoint}:admitted"] += 1
+
+
+class LLMGate:
+    """Caps concurrent LLM calls; extra callers wait in a bounded queue"""
+
+    def __init__(self, max_concurrency=None, max_queue=None, queue_timeout=None):
+        self.max_concurrency = max_concurrency or config.LLM_MAX_CONCURRENCY
+        self.max_queue = max_queue if max_queue is not None else config.LLM_MAX_QUEUE
+        self.queue_timeout = queue_timeout or config.LLM_QUEUE_TIMEOUT_SECONDS
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.avg_seconds = 2.0  # running estimate of one call, for Retry-After
+        self.stats = defaultdict(int)
+
+    def _retry_after(self):
+        # Roughly how long until the queue ahead of a new caller drains
+        return self.avg_seconds * (self.waiting + 1) / self.max_concurrency
+
+    async def run(self, call):
+        """Await call() once a slot is free; raises a 429 if the queue is full or too slow"""
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.stats['rejected_queue_full'] += 1
+            raise too_many_requests("The assistant is busy, please try again shortly.", self._retry_after())
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats['rejected_timeout'] += 1
+            raise too_many_requests("The assistant is busy, please try again shortly.", self._retry_after())
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        started = monotonic()
+        try:
+            return await call()
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+            self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * (monotonic() - started)
+            self.stats['completed'] += 1
+
+    def status(self):
+        return {
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'avg_seconds': round(self.avg_seconds, 3),
+            **self.stats
+        }
+
+
+def client_ip(request):
+    """Caller's IP; honours X-Forwarded-For only when configured to sit behind a proxy"""
+    if config.RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get('x-forwarded-for')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.client.host if request.client else None
+
+
+# Singleton instances
+rate_limiter = RateLimiter()
+llm_gate = LLMGate()
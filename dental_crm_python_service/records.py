@@ -0,0 +1,42 @@
+"""Typed records for the rows the service passes around.
+
+Database reads used to return one dict per row (cursor(dictionary=True)),
+which then travelled through main.py and chatbot.py as msg['sender'].
+These NamedTuples are built straight from plain cursor rows with
+Record._make: each row is one compact tuple, fields are attributes
+(msg.sender), and ._asdict() gives the JSON object for API responses.
+
+The SELECTs that fill a record list its columns in field order.
+bench_records.py compares size and build speed against dicts.
+"""
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+
+class Message(NamedTuple):
+    id: Optional[int]  # None for a turn not saved yet
+    sender: str
+    message: str
+    timestamp: datetime
+
+
+class User(NamedTuple):
+    id: int
+    name: str
+    email: str
+    role: str
+
+
+class Appointment(NamedTuple):
+    id: int
+    user_id: int
+    provider_id: Optional[int]
+    appointment_date: datetime
+    notes: Optional[str]
+    status: str
+    created_at: Optional[datetime]
+
+
+def fetch_records(cursor, record):
+    """All remaining rows of a plain (tuple) cursor as `record`s"""
+    return list(map(record._make, cursor.fetchall()))
@@ -0,0 +1,126 @@
+"""Batch appointment-reminder scheduler.
+
+Each run does one range scan over the next 24 hours of appointments,
+works out which reminders are due (24 h and 2 h ahead), sends them
+through EmailService with a bounded thread pool, and records every
+sent reminder so it goes out exactly once.
+
+CLI:
+    python reminders.py            # one run
+    python reminders.py --dry-run  # list due reminders without sending
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from config import config
+
+# (kind, hours ahead) - checked nearest first so a late booking only gets the 2h reminder
+REMINDER_KINDS = (('2h', 2), ('24h', 24))
+# MySQL named lock held by whichever worker sends reminders
+REMINDER_LOCK = 'dental_crm_reminders'
+
+
+def reason_from_notes(notes):
+    """Appointments store 'Reason: X' in notes"""
+    if notes and notes.startswith('Reason:'):
+        return notes[len('Reason:'):].strip() or 'General Checkup'
+    return 'General Checkup'
+
+
+def due_reminders(candidates, now):
+    """Pick the one reminder (if any) due for each candidate appointment"""
+    due = []
+    for row in candidates:
+        until = row['appointment_date'] - now
+        for kind, hours in REMINDER_KINDS:
+            if until <= timedelta(hours=hours):
+                if not row[f'sent_{kind}']:
+                    due.append((kind, hours, row))
+                break
+    return due
+
+
+class ReminderScheduler:
+    """Finds due reminders in one query and fans them out in batches"""
+
+    def __init__(self, database, email_service, batch_size=None, concurrency=None):
+        self.db = database
+        self.email_service = email_service
+        self.batch_size = batch_size or config.REMINDER_BATCH_SIZE
+        self.concurrency = concurrency or config.REMINDER_CONCURRENCY
+
+    def _send(self, reminder):
+        kind, hours, row = reminder
+        sent = self.email_service.send_appointment_reminder(
+            row['email'],
+            row['name'],
+            row['appointment_date'].strftime('%Y-%m-%d'),
+            row['appointment_date'].strftime('%I:%M %p'),
+            reason_from_notes(row['notes']),
+            hours
+        )
+        return (row['id'], kind) if sent else None
+
+    def run_once(self, dry_run=False):
+        """One scheduler pass; returns run statistics"""
+        started = time.perf_counter()
+        now = datetime.now()
+        candidates = self.db.get_reminder_candidates(now, now + timedelta(hours=max(h for _, h in REMINDER_KINDS)))
+        due = due_reminders(candidates, now)
+
+        sent = 0
+        failed = 0
+        if dry_run:
+            for kind, _, row in due:
+                print(f"🔔 [{kind}] appointment {row['id']} at {row['appointment_date']} -> {row['email']}")
+        else:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                for i in range(0, len(due), self.batch_size):
+                    batch = due[i:i + self.batch_size]
+                    results = list(pool.map(self._send, batch))
+                    delivered = [r for r in results if r]
+                    # Record each batch as soon as it's out so a crash can't resend it
+                    self.db.record_reminders_sent(delivered)
+                    sent += len(delivered)
+                    failed += len(batch) - len(delivered)
+
+        elapsed = time.perf_counter() - started
+        stats = {
+            'candidates': len(candidates),
+            'due': len(due),
+            'sent': sent,
+            'failed': failed,
+            'seconds': round(elapsed, 3),
+            'per_second': round(sent / elapsed, 1) if elapsed > 0 else 0.0
+        }
+        print(f"🔔 Reminder run: {stats}")
+        return stats
+
+    async def run_forever(self, interval_minutes=None):
+        """Run on a fixed interval, off the event loop"""
+        interval = (interval_minutes or config.REMINDER_INTERVAL_MINUTES) * 60
+        while True:
+            try:
+                # With several workers only the lock holder sends, so nobody gets a reminder twice
+                if await asyncio.to_thread(self.db.hold_advisory_lock, REMINDER_LOCK):
+                    await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                print(f"❌ Reminder run failed: {e}")
+            await asyncio.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send due appointment reminders")
+    parser.add_argument('--dry-run', action='store_true', help="List due reminders without sending")
+    args = parser.parse_args()
+
+    from database import db
+    from email_service import email_service
+    ReminderScheduler(db, email_service).run_once(dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
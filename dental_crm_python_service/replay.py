@@ -0,0 +1,230 @@
+"""Replay recorded conversations through the current chatbot logic.
+
+Streams sessions from chat_messages (or from an NDJSON export made by
+/api/chat/export) and, for every patient message, re-runs
+analyze_conversation_context, extract_appointment_data and the
+rule-based generate_response with the history the patient actually had.
+Sessions are spread over a process pool. Reports throughput and
+per-function latency, and can save the extracted appointment data and
+diff it against an earlier run.
+
+Relative dates ("tomorrow", "next monday") are resolved against each
+message's original timestamp, so runs are comparable from day to day.
+
+    python replay.py --ndjson export.ndjson --save baseline.ndjson
+    python replay.py --ndjson export.ndjson --baseline baseline.ndjson
+    python replay.py --db --start 2025-01-01 --end 2025-04-01 --workers 8 --save run.ndjson
+    python replay.py --db --user-id 42 --baseline baseline.ndjson --show 20
+"""
+import argparse
+import datetime as datetime_module
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+import chatbot as chatbot_module
+from config import config
+from records import Message
+
+FUNCTIONS = ('analyze_conversation_context', 'extract_appointment_data', 'generate_response')
+CONTEXT_FIELDS = ('is_booking', 'is_confirmation', 'is_reschedule', 'appointment', 'old_appointment', 'new_appointment')
+COMPARED_FIELDS = ('extracted', 'context', 'appointment_data')
+
+
+class ReplayClock(datetime):
+    """datetime whose now()/today() is the timestamp of the message being replayed"""
+    at = None
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.at if cls.at is not None else super().now(tz)
+
+    @classmethod
+    def today(cls):
+        return cls.at if cls.at is not None else super().today()
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime) or value is None:
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+_bot = None
+
+
+def _init_worker(quiet):
+    global _bot
+    config.OPENAI_API_KEY = ''  # rule-based path only; nothing here may call OpenAI
+    # chatbot uses both its module-level import and `from datetime import datetime` inside functions
+    datetime_module.datetime = ReplayClock
+    chatbot_module.datetime = ReplayClock
+    if quiet:
+        sys.stdout = open(os.devnull, 'w')
+    _bot = chatbot_module.DentalChatbot()
+
+
+def _timed(timings, name, fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    timings[name].append(time.perf_counter() - started)
+    return result
+
+
+def replay_session(session):
+    """Replay one (session_id, messages) conversation; returns (records, timings)"""
+    session_id, rows = session
+    timings = {name: [] for name in FUNCTIONS}
+    records = []
+    history = []
+    for row in rows:
+        if row['sender'] == 'user':
+            ReplayClock.at = _as_datetime(row.get('timestamp'))
+            recent = history[-10:]
+            context = _timed(timings, 'analyze_conversation_context',
+                             _bot.analyze_conversation_context, recent, row['message'])
+            extracted = _timed(timings, 'extract_appointment_data', _bot.extract_appointment_data, row['message'])
+            reply = _timed(timings, 'generate_response', _bot.generate_response, row['message'], recent, "Patient")
+            records.append({
+                'id': row['id'],
+                'session_id': session_id,
+                'message': row['message'],
+                'extracted': list(extracted),
+                'context': {field: context[field] for field in CONTEXT_FIELDS},
+                'appointment_data': reply['appointment_data']
+            })
+        history.append(Message(row['id'], row['sender'], row['message'], row.get('timestamp')))
+    return records, timings
+
+
+def read_ndjson(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def sessions_of(rows):
+    """Group session-ordered message rows into (session_id, [rows])"""
+    for session_id, messages in itertools.groupby(rows, key=lambda row: row['session_id']):
+        yield session_id, list(messages)
+
+
+def run(sessions, workers, quiet=True, on_records=None):
+    """Replay sessions on a process pool; returns (sessions, messages, seconds, {function: latencies})"""
+    latencies = {name: array('d') for name in FUNCTIONS}
+    session_count = message_count = 0
+    started = time.perf_counter()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(quiet,)) as pool:
+        pending = set()
+        sessions = iter(sessions)
+        exhausted = False
+        while pending or not exhausted:
+            # Keep a bounded number of sessions in flight so a huge export streams through
+            while not exhausted and len(pending) < workers * 4:
+                session = next(sessions, None)
+                if session is None:
+                    exhausted = True
+                else:
+                    pending.add(pool.submit(replay_session, session))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                records, timings = future.result()
+                session_count += 1
+                message_count += len(records)
+                for name, values in timings.items():
+                    latencies[name].extend(values)
+                if on_records:
+                    on_records(records)
+    return session_count, message_count, time.perf_counter() - started, latencies
+
+
+def diff_against(baseline, current, show):
+    """Compare extracted data by message id; prints a summary and up to `show` examples"""
+    changed = {field: 0 for field in COMPARED_FIELDS}
+    examples = []
+    for message_id, record in current.items():
+        before = baseline.get(message_id)
+        if before is None:
+            continue
+        for field in COMPARED_FIELDS:
+            if before.get(field) != record.get(field):
+                changed[field] += 1
+                if len(examples) < show:
+                    examples.append((message_id, record['message'], field, before.get(field), record.get(field)))
+    compared = len(current.keys() & baseline.keys())
+    print(f"\nAgainst baseline: {compared:,} messages compared, "
+          f"{len(current.keys() - baseline.keys()):,} new, {len(baseline.keys() - current.keys()):,} missing")
+    for field in COMPARED_FIELDS:
+        print(f"  {field:<18} {changed[field]:>8,} changed")
+    for message_id, message, field, before, after in examples:
+        print(f"\n  #{message_id} {message[:70]!r}\n    {field}: {json.dumps(before, default=str)}"
+              f"\n    {' ' * len(field)}  -> {json.dumps(after, default=str)}")
+    return sum(changed.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded conversations through the chatbot")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--ndjson', help="Message export (session_id, id, sender, message, timestamp per line)")
+    source.add_argument('--db', action='store_true', help="Stream from chat_messages")
+    parser.add_argument('--user-id', type=int, help="With --db: only this user's sessions")
+    parser.add_argument('--start', help="With --db: sessions started on/after this date")
+    parser.add_argument('--end', help="With --db: sessions started before this date")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--save', help="Write per-message results as NDJSON (use as a later --baseline)")
+    parser.add_argument('--baseline', help="Earlier --save output to diff against")
+    parser.add_argument('--show', type=int, default=10, help="Changed messages to print")
+    parser.add_argument('--verbose', action='store_true', help="Keep the chatbot's own logging")
+    args = parser.parse_args()
+
+    if args.ndjson:
+        rows = read_ndjson(args.ndjson)
+    else:
+        from database import Database
+        db = Database()
+        rows = db.stream_user_messages(args.user_id) if args.user_id else db.stream_chat_messages(args.start, args.end)
+
+    current = {}
+    save_file = open(args.save, 'w', encoding='utf-8') if args.save else None
+
+    def on_records(records):
+        for record in records:
+            if args.baseline:
+                current[record['id']] = record
+            if save_file:
+                save_file.write(json.dumps(record, default=str, ensure_ascii=False) + "\n")
+
+    try:
+        sessions, messages, seconds, latencies = run(sessions_of(rows), args.workers, not args.verbose, on_records)
+    finally:
+        if save_file:
+            save_file.close()
+
+    print(f"Replayed {sessions:,} sessions / {messages:,} patient messages in {seconds:.2f}s "
+          f"with {args.workers} workers: {messages / seconds if seconds else 0:,.0f} messages/s")
+    print(f"\n{'function':<30} {'calls':>9} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, values in latencies.items():
+        if not values:
+            continue
+        ordered = sorted(values)
+        pick = lambda q: ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000
+        print(f"{name:<30} {len(values):>9,} {statistics.fmean(values) * 1000:>9.3f} "
+              f"{pick(0.5):>9.3f} {pick(0.95):>9.3f} {pick(0.99):>9.3f}")
+
+    if args.baseline:
+        baseline = {record['id']: record for record in read_ndjson(args.baseline)}
+        if diff_against(baseline, current, args.show):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Read replicas with replication-lag monitoring.
+
+Database sends lag-tolerant reads (chat history, user lookups, slot
+indexes, appointment lists) to a replica from DB_REPLICAS and everything
+else to the primary. Each replica's lag is read from SHOW REPLICA STATUS
+at most every DB_REPLICA_CHECK_SECONDS; a replica that is behind by more
+than DB_REPLICA_MAX_LAG_SECONDS, not replicating, or unreachable is
+skipped until a later check finds it healthy, and with no healthy
+replica reads fall back to the primary.
+
+Trying it locally with two MySQL instances:
+
+    docker run -d --name crm-primary -p 3306:3306 -e MYSQL_ROOT_PASSWORD=pw mysql:8 --server-id=1 --log-bin
+    docker run -d --name crm-replica -p 3307:3306 -e MYSQL_ROOT_PASSWORD=pw mysql:8 --server-id=2
+    # on the replica: CHANGE REPLICATION SOURCE TO SOURCE_HOST=..., then START REPLICA
+    DB_REPLICAS=127.0.0.1:3307 python replicas.py status
+    DB_REPLICAS=127.0.0.1:3307 python replicas.py route    # which server each kind of query uses
+
+The DB user needs the REPLICATION CLIENT privilege on the replicas.
+"""
+import argparse
+import itertools
+from time import monotonic
+
+import mysql.connector
+from mysql.connector import Error
+
+from config import config
+
+
+def parse_hosts(spec):
+    """'db2:3307, db3' -> [('db2', 3307), ('db3', 3306)]"""
+    hosts = []
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.partition(':')
+        hosts.append((host, int(port) if port else config.DB_PORT))
+    return hosts
+
+
+class Replica:
+    """One replica connection plus its last known lag"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.connection = None
+        self.lag = None
+        self.healthy = False
+        self.error = None
+        self.checked_at = None
+
+    @property
+    def name(self):
+        return f"{self.host}:{self.port}"
+
+    def _ensure_connection(self):
+        if self.connection is None or not self.connection.is_connected():
+            self.connection = mysql.connector.connect(
+                host=self.host,
+                port=self.port,
+                user=config.DB_USER,
+                password=config.DB_PASSWORD,
+                database=config.DB_NAME,
+                # Reads only: without autocommit the first SELECT pins a snapshot forever
+                autocommit=True
+            )
+        return self.connection
+
+    def check(self, max_lag):
+        """Refresh lag/health; returns whether reads may use this replica"""
+        self.checked_at = monotonic()
+        try:
+            cursor = self._ensure_connection().cursor(dictionary=True)
+            try:
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                except Error:
+                    cursor.execute("SHOW SLAVE STATUS")  # MySQL < 8.0.22 / MariaDB
+                status = cursor.fetchone()
+            finally:
+                cursor.close()
+        except Error as e:
+            self.healthy, self.lag, self.error = False, None, str(e)
+            return False
+
+        if not status:
+            self.healthy, self.lag, self.error = False, None, "not configured as a replica"
+            return False
+        lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+        if lag is None:
+            # NULL while the SQL or IO thread is stopped
+            self.healthy, self.lag, self.error = False, None, status.get('Last_Error') or "replication stopped"
+            return False
+        self.lag = int(lag)
+        self.healthy = self.lag <= max_lag
+        self.error = None if self.healthy else f"lag {self.lag}s > {max_lag}s"
+        return self.healthy
+
+    def status(self):
+        return {'replica': self.name, 'healthy': self.healthy, 'lag_seconds': self.lag, 'error': self.error}
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Error:
+                pass
+            self.connection = None
+
+
+class ReplicaSet:
+    """Round-robin over replicas whose lag is within bounds"""
+
+    def __init__(self, hosts=None, max_lag=None, check_seconds=None):
+        hosts = parse_hosts(config.DB_REPLICAS) if hosts is None else hosts
+        self.replicas = [Replica(host, port) for host, port in hosts]
+        self.max_lag = config.DB_REPLICA_MAX_LAG_SECONDS if max_lag is None else max_lag
+        self.check_seconds = config.DB_REPLICA_CHECK_SECONDS if check_seconds is None else check_seconds
+        self._order = itertools.cycle(range(len(self.replicas))) if self.replicas else None
+        self.reads = {'replica': 0, 'primary': 0}
+
+    def __bool__(self):
+        return bool(self.replicas)
+
+    def connection(self):
+        """A connection to a healthy replica, or None if reads should use the primary"""
+        if not self.replicas:
+            return None
+        now = monotonic()
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._order)]
+            was_healthy = replica.healthy
+            first_check = replica.checked_at is None
+            if first_check or now - replica.checked_at >= self.check_seconds:
+                if replica.check(self.max_lag) != was_healthy or (first_check and not replica.healthy):
+                    print(f"{'✅' if replica.healthy else '⚠️'} Replica {replica.name} "
+                          f"{'back in rotation' if replica.healthy else 'skipped: ' + replica.error}")
+            if replica.healthy:
+                try:
+                    connection = replica._ensure_connection()
+                    self.reads['replica'] += 1
+                    return connection
+                except Error as e:
+                    replica.healthy, replica.error = False, str(e)
+        self.reads['primary'] += 1
+        return None
+
+    def status(self):
+        return {
+            'replicas': [r.status() for r in self.replicas],
+            'max_lag_seconds': self.max_lag,
+            'reads': dict(self.reads)
+        }
+
+    def close(self):
+        for replica in self.replicas:
+            replica.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect read-replica routing")
+    parser.add_argument('command', choices=('status', 'route'))
+    args = parser.parse_args()
+
+    from database import Database
+    db = Database()
+    if args.command == 'status':
+        for replica in db.replicas.replicas:
+            replica.check(db.replicas.max_lag)
+            print(replica.status())
+        if not db.replicas:
+            print("No replicas configured (set DB_REPLICAS=host[:port],...)")
+        return
+
+    def server_of(connection):
+        cursor = connection.cursor()
+        cursor.execute("SELECT @@hostname, @@port, @@server_id")
+        row = cursor.fetchone()
+        cursor.close()
+        return f"{row[0]}:{row[1]} (server_id {row[2]})"
+
+    db.ensure_connection()
+    print(f"writes / read-your-writes -> {server_of(db.connection)}")
+    print(f"lag-tolerant reads       -> {server_of(db._read_connection())}")
+
+
+if __name__ == "__main__":
+    main()
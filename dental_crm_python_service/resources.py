@@ -0,0 +1,98 @@
+"""Shared service resources, handed to endpoints through FastAPI Depends.
+
+Importing this is cheap: the database connects, the OpenAI client is
+built and SMTP settings are resolved on first use. warm_up() does all of
+that eagerly from the startup event so the first request doesn't pay
+for it, and a dependency that is down (e.g. MySQL) is logged instead of
+stopping the service from starting.
+
+Each worker process owns its resources. Workers started by serve.py are
+fresh interpreters; if a server forks after importing (gunicorn
+--preload), the child drops whatever the parent had opened and builds
+its own on first use.
+"""
+import os
+import threading
+import time
+
+from database import db, Database
+from chatbot import chatbot, DentalChatbot
+from email_service import email_service, EmailService
+from single_flight import SingleFlight
+
+
+def get_db() -> Database:
+    return db
+
+
+def get_chatbot() -> DentalChatbot:
+    return chatbot
+
+
+def get_email_service() -> EmailService:
+    return email_service
+
+
+# Parent-process connections a forked child must neither use nor close
+_inherited = []
+
+
+def _reset_after_fork():
+    """Give a freshly forked worker its own DB connection, LLM client and TLS context"""
+    if db.connection is not None:
+        # Closing it here would send QUIT on the parent's socket; just let go of it
+        _inherited.append(db.connection)
+        db.connection = None
+    for replica in db.replicas.replicas:
+        if replica.connection is not None:
+            _inherited.append(replica.connection)
+            replica.connection = None
+    db._slot_indexes.clear()
+    # The pooled HTTP connections belong to the parent too
+    chatbot._llm = None
+    chatbot._http_async_client = None
+    chatbot.llm_flights = SingleFlight()
+    chatbot._prefix_lock = threading.Lock()
+    email_service.__dict__.pop('tls_context', None)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _warm_llm():
+    if chatbot.uses_llm:
+        chatbot.llm
+
+
+def _warm_faq():
+    if chatbot.uses_llm:
+        chatbot.faq
+
+
+def _warm_smtp():
+    email_service.smtp_settings
+    email_service.tls_context
+
+
+WARM_UP_STEPS = (
+    ('database', db.ensure_connection),
+    ('llm', _warm_llm),
+    ('faq', _warm_faq),
+    ('smtp', _warm_smtp),
+)
+
+
+def warm_up():
+    """Build every lazy resource now; returns {step: (ok, milliseconds)}"""
+    results = {}
+    for name, step in WARM_UP_STEPS:
+        started = time.perf_counter()
+        try:
+            step()
+            ok = True
+        except Exception as e:
+            print(f"⚠️ Warm-up of {name} failed: {e}")
+            ok = False
+        results[name] = (ok, round((time.perf_counter() - started) * 1000, 1))
+    return results
@@ -0,0 +1,179 @@
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, date, time, timedelta
+
+# Clinic schedule (Monday-Friday, 9 AM to 5 PM, hourly slots)
+CLINIC_OPEN = time(9, 0)
+CLINIC_CLOSE = time(17, 0)
+SLOT_MINUTES = 60
+WORKING_DAYS = (0, 1, 2, 3, 4)
+
+# Used when no providers are configured: the whole clinic is one resource
+# that can see one patient per slot, which matches the original behaviour.
+DEFAULT_PROVIDER = {'id': None, 'name': 'Clinic', 'kind': 'chair', 'capacity': 1}
+
+
+def parse_appointment_time(value):
+    """Parse '14:30', '2:30 PM', '2:30PM', '2pm' or a time object into a time"""
+    if isinstance(value, time):
+        return value
+    if isinstance(value, timedelta):
+        # mysql-connector returns TIME columns as timedelta
+        seconds = int(value.total_seconds())
+        return time(seconds // 3600, (seconds % 3600) // 60)
+
+    text = value.strip()
+    text_lower = text.lower()
+
+    if ':' in text:
+        for fmt in ('%H:%M', '%H:%M:%S', '%I:%M %p', '%I:%M%p'):
+            try:
+                return datetime.strptime(text, fmt).time()
+            except ValueError:
+                continue
+
+    digits = ''.join(filter(str.isdigit, text.split(':')[0]))
+    if not digits:
+        raise ValueError(f"Unrecognised time format: '{value}'")
+
+    hour = int(digits)
+    if 'pm' in text_lower and hour != 12:
+        hour += 12
+    elif 'am' in text_lower and hour == 12:
+        hour = 0
+    return time(hour, 0)
+
+
+def parse_appointment_date(value):
+    """Parse 'YYYY-MM-DD' or a date/datetime into a date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value.strip(), '%Y-%m-%d').date()
+
+
+def slot_start(appointment_date, appointment_time):
+    """Combine a date and a time (any supported format) into the slot's start"""
+    return datetime.combine(parse_appointment_date(appointment_date), parse_appointment_time(appointment_time))
+
+
+def parse_appointment_datetime(value):
+    """Parse a datetime or 'YYYY-MM-DD <time>' text (any supported time format)"""
+    if isinstance(value, datetime):
+        return value
+    day, _, time_text = value.strip().partition(' ')
+    return slot_start(day, time_text)
+
+
+def is_working_slot(start):
+    """Check if a datetime is a valid slot start inside clinic hours"""
+    return (
+        start.weekday() in WORKING_DAYS
+        and CLINIC_OPEN <= start.time() < CLINIC_CLOSE
+    )
+
+
+def day_slots(day):
+    """All slot starts for a working day (empty list on weekends)"""
+    if day.weekday() not in WORKING_DAYS:
+        return []
+    slots = []
+    current = datetime.combine(day, CLINIC_OPEN)
+    end = datetime.combine(day, CLINIC_CLOSE)
+    while current < end:
+        slots.append(current)
+        current += timedelta(minutes=SLOT_MINUTES)
+    return slots
+
+
+def iter_working_slots(after, horizon_days=30):
+    """Yield slot starts at or after `after`, up to `horizon_days` ahead"""
+    first_day = after.date()
+    for offset in range(horizon_days + 1):
+        for start in day_slots(first_day + timedelta(days=offset)):
+            if start >= after:
+                yield start
+
+
+class SlotIndex:
+    """Interval index of booked slots per provider/chair resource.
+
+    Each provider keeps a sorted list of booked slot starts (a slot appears
+    once per booking, so capacity > 1 is supported). Slots where every
+    provider is at capacity are kept in a separate sorted list, so both
+    "who is free at T?" and "next free slot" are answered with bisection
+    instead of scanning appointments.
+    """
+
+    def __init__(self, providers=None):
+        providers = list(providers or []) or [DEFAULT_PROVIDER]
+        self.providers = {p['id']: p for p in providers}
+        self._order = [p['id'] for p in providers]
+        self._booked = {pid: [] for pid in self._order}
+        self._load = {}
+        self._full = []
+        self.total_capacity = sum(max(int(p.get('capacity') or 1), 1) for p in providers)
+
+    def capacity(self, provider_id):
+        return max(int(self.providers[provider_id].get('capacity') or 1), 1)
+
+    def booked_count(self, provider_id, start):
+        """Number of bookings a provider holds at a slot - O(log n)"""
+        booked = self._booked.get(provider_id, [])
+        return bisect_right(booked, start) - bisect_left(booked, start)
+
+    def add(self, provider_id, start):
+        """Record a booking; unassigned bookings take the first provider with room"""
+        if provider_id not in self._booked:
+            provider_id = next(
+                (pid for pid in self._order if self.booked_count(pid, start) < self.capacity(pid)),
+                self._order[0]
+            )
+        insort(self._booked[provider_id], start)
+        self._load[start] = self._load.get(start, 0) + 1
+        if self._load[start] >= self.total_capacity and not self._is_full(start):
+            insort(self._full, start)
+        return provider_id
+
+    def remove(self, provider_id, start):
+        """Drop a booking (cancel / reschedule away)"""
+        if provider_id not in self._booked:
+            provider_id = next((pid for pid in self._order if self.booked_count(pid, start) > 0), None)
+            if provider_id is None:
+                return
+        booked = self._booked[provider_id]
+        i = bisect_left(booked, start)
+        if i < len(booked) and booked[i] == start:
+            booked.pop(i)
+            self._load[start] -= 1
+            if self._is_full(start) and self._load[start] < self.total_capacity:
+                self._full.pop(bisect_left(self._full, start))
+
+    def _is_full(self, start):
+        i = bisect_left(self._full, start)
+        return i < len(self._full) and self._full[i] == start
+
+    def free_providers(self, start):
+        """Providers with spare capacity at a slot, in preference order"""
+        if self._is_full(start):
+            return []
+        return [pid for pid in self._order if self.booked_count(pid, start) < self.capacity(pid)]
+
+    def is_free(self, start, provider_id=None):
+        if provider_id is None or provider_id not in self.providers:
+            return not self._is_full(start)
+        return self.booked_count(provider_id, start) < self.capacity(provider_id)
+
+    def next_free_slot(self, after, horizon_days=30):
+        """First (slot_start, provider_id) at or after `after` with spare capacity"""
+        for start in iter_working_slots(after, horizon_days):
+            if self._is_full(start):
+                continue
+            free = self.free_providers(start)
+            if free:
+                return start, free[0]
+        return None
+
+    def free_slots(self, day):
+        """Slot starts on a day where at least one provider is free"""
+        return [start for start in day_slots(day) if not self._is_full(start)]
@@ -0,0 +1,50 @@
+"""Production launcher: several uvicorn worker processes on one port.
+
+    python serve.py                  # SERVICE_WORKERS, or one per CPU core
+    python serve.py --workers 4 --port 8000
+
+Workers are separate interpreters that import main.create_app() and
+build their own database connection, LLM client and SMTP sessions.
+Availability caches are kept coherent between them through cache_bus,
+and the background jobs (reminders, session maintenance) are guarded by
+a MySQL named lock so only one worker runs each.
+
+`python main.py` is still the single-process development server with
+auto-reload.
+"""
+import argparse
+import os
+
+import uvicorn
+
+from cache_bus import cache_bus
+from config import config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the chatbot service with several workers")
+    parser.add_argument('--workers', type=int, default=config.SERVICE_WORKERS or os.cpu_count() or 1)
+    parser.add_argument('--host', default=config.SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=config.SERVICE_PORT)
+    parser.add_argument('--log-level', default='info')
+    args = parser.parse_args()
+
+    # Workers find the shared file through the environment; start from clean versions
+    bus_path = config.CACHE_BUS_PATH or cache_bus.path
+    os.environ['CACHE_BUS_PATH'] = bus_path
+    cache_bus.path = bus_path
+    cache_bus.reset()
+
+    print(f"🚀 Starting {args.workers} workers on {args.host}:{args.port} (cache bus: {bus_path})")
+    uvicorn.run(
+        "main:create_app",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level=args.log_level
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Chat session lifecycle and chat_messages archival.
+
+Idle sessions are ended, and sessions that have been ended for a while
+have their messages moved out of chat_messages into one zlib-compressed
+row per session in chat_message_archives. Work runs in small batches
+with a pause in between so it never competes with live chat traffic.
+
+CLI:
+    python session_archiver.py run            # close idle + archive until done
+    python session_archiver.py show 42        # print an archived session
+    python session_archiver.py restore 42     # move it back into chat_messages
+"""
+import argparse
+import json
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from mysql.connector import Error
+
+from config import config
+from records import Message
+
+CODEC = 'zlib-json'
+
+
+def compress_messages(messages):
+    """Pack message rows into a compact zlib-compressed JSON payload"""
+    packed = [
+        [m.id, m.sender, m.message, m.timestamp.isoformat()]
+        for m in messages
+    ]
+    return zlib.compress(json.dumps(packed, ensure_ascii=False).encode('utf-8'), 6)
+
+
+def decompress_messages(payload, codec=CODEC):
+    """Inverse of compress_messages"""
+    if codec != CODEC:
+        raise ValueError(f"Unknown archive codec '{codec}'")
+    return [
+        Message(message_id, sender, message, datetime.fromisoformat(timestamp))
+        for message_id, sender, message, timestamp in json.loads(zlib.decompress(payload))
+    ]
+
+
+class SessionArchiver:
+    """Ends idle sessions and archives ended ones in throttled batches"""
+
+    def __init__(self, database, batch_size=None, pause_seconds=None,
+                 idle_minutes=None, archive_after_days=None):
+        self.db = database
+        self.batch_size = batch_size or config.ARCHIVE_BATCH_SIZE
+        self.pause_seconds = pause_seconds if pause_seconds is not None else config.ARCHIVE_PAUSE_SECONDS
+        self.idle_minutes = idle_minutes or config.SESSION_IDLE_MINUTES
+        self.archive_after_days = archive_after_days or config.ARCHIVE_AFTER_DAYS
+
+    def close_idle_sessions(self, max_batches=None):
+        """End idle sessions batch by batch; returns how many were closed"""
+        closed = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            count = self.db.close_idle_sessions(self.idle_minutes, self.batch_size)
+            closed += count
+            batches += 1
+            if count < self.batch_size:
+                break
+            time.sleep(self.pause_seconds)
+        if closed:
+            print(f"💤 Closed {closed} idle chat sessions")
+        return closed
+
+    def archive_batch(self):
+        """Archive one batch of ended sessions; returns (sessions, messages) archived"""
+        cutoff = datetime.now() - timedelta(days=self.archive_after_days)
+        sessions = self.db.get_sessions_to_archive(cutoff, self.batch_size)
+        if not sessions:
+            return 0, 0
+
+        session_ids = [s['id'] for s in sessions]
+        messages_by_session = {sid: [] for sid in session_ids}
+        for session_id, message in self.db.get_messages_for_sessions(session_ids):
+            messages_by_session[session_id].append(message)
+
+        # A session reopened after archival already has an archive row: merge into it
+        existing = self.db.get_session_archives(session_ids)
+
+        archives = []
+        last_message_ids = {}
+        message_total = 0
+        for session in sessions:
+            messages = messages_by_session[session['id']]
+            message_total += len(messages)
+            if messages:
+                last_message_ids[session['id']] = max(m.id for m in messages)
+            if session['id'] in existing:
+                previous = existing[session['id']]
+                messages = decompress_messages(previous['payload'], previous['codec']) + messages
+            if not messages:
+                archives.append((session['id'], session['user_id'], 0, None, None, CODEC, compress_messages([])))
+                continue
+            archives.append((
+                session['id'],
+                session['user_id'],
+                len(messages),
+                messages[0].timestamp,
+                messages[-1].timestamp,
+                CODEC,
+                compress_messages(messages)
+            ))
+
+        self.db.store_session_archives(archives, last_message_ids)
+        return len(archives), message_total
+
+    def archive(self, max_batches=None):
+        """Archive in throttled batches until nothing is left (or max_batches)"""
+        sessions = 0
+        messages = 0
+        batches = 0
+        started = time.perf_counter()
+        while max_batches is None or batches < max_batches:
+            try:
+                archived_sessions, archived_messages = self.archive_batch()
+            except Error as e:
+                print(f"❌ Error archiving chat sessions: {e}")
+                break
+            if not archived_sessions:
+                break
+            sessions += archived_sessions
+            messages += archived_messages
+            batches += 1
+            time.sleep(self.pause_seconds)
+        elapsed = time.perf_counter() - started
+        if sessions:
+            print(f"📦 Archived {messages} messages from {sessions} sessions in {elapsed:.1f}s")
+        return {'sessions': sessions, 'messages': messages, 'batches': batches, 'seconds': round(elapsed, 3)}
+
+    def run(self, max_batches=None):
+        """One maintenance pass: close idle sessions, then archive old ended ones"""
+        closed = self.close_idle_sessions(max_batches)
+        summary = self.archive(max_batches)
+        summary['closed'] = closed
+        return summary
+
+    def get_archived_messages(self, session_id):
+        """Decode an archived session for support lookups (without restoring it)"""
+        archive = self.db.get_session_archives([session_id]).get(session_id)
+        if not archive:
+            return None
+        return decompress_messages(archive['payload'], archive['codec'])
+
+    def reopen(self, session_ids):
+        """Make sessions a patient came back to active again, restoring archived history first.
+        
+        A session that is still active costs one read and no write. Returns how many were reopened.
+        """
+        states = self.db.get_chat_session_states(session_ids)
+        for session_id, (status, archived_at) in states.items():
+            if archived_at is not None and not self.restore(session_id):
+                print(f"⚠️ Session {session_id} reopened without its archived history")
+        ended = [session_id for session_id, (status, _) in states.items() if status == 'ended']
+        return self.db.reopen_chat_sessions(ended) if ended else 0
+
+    def restore(self, session_id):
+        """Move an archived session's messages back into chat_messages"""
+        messages = self.get_archived_messages(session_id)
+        if messages is None:
+            return False
+        return self.db.restore_session_messages(session_id, messages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat session maintenance")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('run', help="Close idle sessions and archive ended ones")
+    run.add_argument('--max-batches', type=int, default=None)
+    show = sub.add_parser('show', help="Print an archived session")
+    show.add_argument('session_id', type=int)
+    restore = sub.add_parser('restore', help="Restore an archived session")
+    restore.add_argument('session_id', type=int)
+    args = parser.parse_args()
+
+    from database import db
+    archiver = SessionArchiver(db)
+
+    if args.command == 'run':
+        print(archiver.run(args.max_batches))
+    elif args.command == 'show':
+        messages = archiver.get_archived_messages(args.session_id)
+        if messages is None:
+            print(f"❌ Session {args.session_id} is not archived")
+            return
+        for m in messages:
+            print(f"[{m.timestamp}] {m.sender}: {m.message}")
+    else:
+        restored = archiver.restore(args.session_id)
+        print(f"✅ Session {args.session_id} restored" if restored else f"❌ Could not restore session {args.session_id}")
+
+
+if __name__ == "__main__":
+    main()
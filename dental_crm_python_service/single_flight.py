@@ -0,0 +1,95 @@
+"""Single-flight coalescing of identical concurrent LLM calls.
+
+When several chats open with the same first message at the same moment
+("hi", "what are your timings"), the first caller makes the OpenAI call
+and the others wait for it and get the same reply instead of each
+paying for their own. Only calls that are in flight are shared; nothing
+is cached once a call finishes.
+
+Only prompts that are fully determined by the system prompt and the
+message are merged: a conversation with history (or anything else
+personal) passes key=None and always gets its own call.
+
+do() is for callers on worker threads (the sync generate_response);
+do_async() is for the chat endpoints, which await the async OpenAI
+client on the event loop. The two don't share calls with each other.
+"""
+import asyncio
+import hashlib
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+
+
+def prompt_key(system_prompt, message):
+    """Key for a history-free prompt; case and whitespace differences don't matter"""
+    normalised = ' '.join(message.casefold().split())
+    return hashlib.sha256(f"{system_prompt}\x00{normalised}".encode('utf-8')).hexdigest()
+
+
+class SingleFlight:
+    """Runs fn() once per key among concurrent callers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}  # event-loop calls; only touched from the loop, so no lock
+        self.stats = defaultdict(int)
+
+    def do(self, key, fn):
+        """Returns (result, shared); key=None always calls fn() itself"""
+        if key is None:
+            self.stats['not_coalescable'] += 1
+            return fn(), False
+
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.stats['calls'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._calls.pop(key, None)
+                self.stats['errors'] += 1
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._calls.pop(key, None)
+        future.set_result(result)
+        return result, False
+
+    async def do_async(self, key, make_call):
+        """Awaitable do(): make_call() returns the coroutine to run; returns (result, shared)"""
+        if key is None:
+            self.stats['not_coalescable'] += 1
+            return await make_call(), False
+
+        task = self._tasks.get(key)
+        shared = task is not None
+        if shared:
+            self.stats['coalesced'] += 1
+        else:
+            task = self._tasks[key] = asyncio.ensure_future(make_call())
+            self.stats['calls'] += 1
+            task.add_done_callback(lambda done: self._finished(key, done))
+        # Shielded so a caller that goes away (client disconnect) doesn't cancel the call for the others
+        return await asyncio.shield(task), shared
+
+    def _finished(self, key, task):
+        self._tasks.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            self.stats['errors'] += 1
+
+    def status(self):
+        with self._lock:
+            in_flight = len(self._calls) + len(self._tasks)
+        return {'in_flight': in_flight, **self.stats}
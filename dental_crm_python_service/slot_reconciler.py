@@ -0,0 +1,75 @@
+"""Reconciliation of appointment_slots against appointments.
+
+appointment_slots holds the live booking count per (slot start,
+provider). The Python service keeps it current in the same transaction
+as every create, reschedule and cancel, and availability is read from
+it. The Node backend writes appointments directly, so this job
+recomputes the counts from appointments one day at a time, fixes any
+slot that differs and reports the drift it found.
+
+CLI:
+    python slot_reconciler.py                                   # yesterday .. availability horizon
+    python slot_reconciler.py --start 2024-01-01 --end 2027-01-01  # initial fill / full check
+    python slot_reconciler.py --dry-run                         # report drift only
+"""
+import argparse
+import asyncio
+from datetime import date, datetime, timedelta
+
+from config import config
+from scheduling import parse_appointment_date
+
+
+class SlotReconciler:
+    def __init__(self, database):
+        self.db = database
+
+    def run_once(self, start=None, end=None, dry_run=False):
+        """Reconcile [start, end) a day per transaction; defaults to yesterday through the booking horizon"""
+        start = parse_appointment_date(start) if start else date.today() - timedelta(days=1)
+        end = parse_appointment_date(end) if end else date.today() + timedelta(days=config.AVAILABILITY_HORIZON_DAYS + 1)
+        summary = {'days': 0, 'drifted_slots': 0, 'failed_days': 0, 'drift': []}
+        day = start
+        while day < end:
+            window_start = datetime.combine(day, datetime.min.time())
+            drift = self.db.reconcile_slot_counts(window_start, window_start + timedelta(days=1), dry_run=dry_run)
+            summary['days'] += 1
+            if drift is None:
+                summary['failed_days'] += 1
+            elif drift:
+                summary['drifted_slots'] += len(drift)
+                summary['drift'].extend(drift)
+            day += timedelta(days=1)
+        if summary['drifted_slots']:
+            print(f"⚠️ Slot counts: {summary['drifted_slots']} slots drifted from appointments"
+                  f"{' (not fixed, dry run)' if dry_run else ', fixed'}")
+        return summary
+
+    async def run_forever(self, interval_minutes=None):
+        """Run on a fixed interval, off the event loop"""
+        interval = (interval_minutes or config.SLOT_RECONCILE_INTERVAL_MINUTES) * 60
+        while True:
+            try:
+                if await asyncio.to_thread(self.db.hold_advisory_lock, 'dental_crm_slot_reconcile'):
+                    await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                print(f"❌ Slot reconciliation failed: {e}")
+            await asyncio.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild appointment_slots from appointments and report drift")
+    parser.add_argument('--start', help="YYYY-MM-DD (inclusive, default yesterday)")
+    parser.add_argument('--end', help="YYYY-MM-DD (exclusive, default end of the availability horizon)")
+    parser.add_argument('--dry-run', action='store_true', help="Report drift without fixing it")
+    args = parser.parse_args()
+
+    from database import db
+    summary = SlotReconciler(db).run_once(args.start, args.end, dry_run=args.dry_run)
+    for row in summary.pop('drift'):
+        print(f"  {row['slot_start']}  provider {row['provider_id']}: recorded {row['recorded']}, actual {row['actual']}")
+    print(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""Local SMTP sink for offline email testing and benchmarks.
+
+Speaks enough ESMTP for smtplib (EHLO/HELO, STARTTLS, AUTH PLAIN/LOGIN,
+MAIL/RCPT/DATA/RSET/NOOP/QUIT) and throws the mail away, counting it.
+Latency and failures can be injected to exercise the send path's error
+handling. Run it in-process (SMTPSink(...).start()) or from the CLI and
+point the service at it:
+
+    python smtp_sink.py --port 2525 --user sink --password sink --latency 0.05
+    SMTP_SERVER=127.0.0.1 SMTP_PORT=2525 SMTP_STARTTLS=false \\
+        EMAIL_SENDER=clinic@example.com EMAIL_PASSWORD=sink python main.py
+
+STARTTLS is only offered when --cert/--key are given.
+"""
+import argparse
+import base64
+import random
+import socketserver
+import ssl
+import threading
+import time
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """One SMTP session"""
+
+    def setup(self):
+        super().setup()
+        self.sink = self.server.sink
+        self.tls = False
+        self.authenticated = not self.sink.username
+        self.mail_from = None
+        self.recipients = []
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+        self.wfile.flush()
+
+    def read_line(self):
+        line = self.rfile.readline(65536)
+        if not line:
+            raise ConnectionError("client went away")
+        return line.decode('utf-8', 'replace').rstrip('\r\n')
+
+    def handle(self):
+        self.sink._count('connections')
+        try:
+            self.reply("220 dental-crm-sink ESMTP ready")
+            while True:
+                line = self.read_line()
+                verb, _, arg = line.partition(' ')
+                handler = getattr(self, 'smtp_' + verb.upper(), None)
+                if handler is None:
+                    self.reply("502 5.5.2 Command not recognised")
+                elif handler(arg.strip()) is False:
+                    return
+        except (ConnectionError, OSError, ssl.SSLError):
+            pass
+
+    def smtp_EHLO(self, arg):
+        features = ["dental-crm-sink", "8BITMIME", "SIZE 10485760"]
+        if self.sink.tls_context and not self.tls:
+            features.append("STARTTLS")
+        if self.sink.username:
+            features.append("AUTH PLAIN LOGIN")
+        for feature in features[:-1]:
+            self.reply("250-" + feature)
+        self.reply("250 " + features[-1])
+
+    def smtp_HELO(self, arg):
+        self.reply("250 dental-crm-sink")
+
+    def smtp_STARTTLS(self, arg):
+        if not self.sink.tls_context or self.tls:
+            self.reply("454 4.7.0 TLS not available")
+            return
+        self.reply("220 2.0.0 Ready to start TLS")
+        self.connection = self.sink.tls_context.wrap_socket(self.connection, server_side=True)
+        self.rfile = self.connection.makefile('rb')
+        self.wfile = self.connection.makefile('wb')
+        self.tls = True
+        # RFC 3207: forget everything learned before the handshake
+        self.authenticated = not self.sink.username
+        self.mail_from = None
+        self.recipients = []
+
+    def smtp_AUTH(self, arg):
+        mechanism, _, initial = arg.partition(' ')
+        mechanism = mechanism.upper()
+        try:
+            if mechanism == 'PLAIN':
+                if not initial:
+                    self.reply("334 ")
+                    initial = self.read_line()
+                _, username, password = base64.b64decode(initial).decode('utf-8').split('\0')
+            elif mechanism == 'LOGIN':
+                if initial:
+                    username = base64.b64decode(initial).decode('utf-8')
+                else:
+                    self.reply("334 VXNlcm5hbWU6")
+                    username = base64.b64decode(self.read_line()).decode('utf-8')
+                self.reply("334 UGFzc3dvcmQ6")
+                password = base64.b64decode(self.read_line()).decode('utf-8')
+            else:
+                self.reply("504 5.5.4 Unrecognised authentication mechanism")
+                return
+        except (ValueError, UnicodeDecodeError):
+            self.reply("501 5.5.2 Malformed authentication data")
+            return
+
+        if (username, password) == (self.sink.username, self.sink.password):
+            self.authenticated = True
+            self.reply("235 2.7.0 Authentication successful")
+        else:
+            self.sink._count('auth_failures')
+            self.reply("535 5.7.8 Authentication credentials invalid")
+
+    def smtp_MAIL(self, arg):
+        if not self.authenticated:
+            self.reply("530 5.7.0 Authentication required")
+            return
+        self.mail_from = arg
+        self.recipients = []
+        self.reply("250 2.1.0 OK")
+
+    def smtp_RCPT(self, arg):
+        if self.mail_from is None:
+            self.reply("503 5.5.1 MAIL first")
+            return
+        self.recipients.append(arg)
+        self.reply("250 2.1.5 OK")
+
+    def smtp_DATA(self, arg):
+        if not self.recipients:
+            self.reply("503 5.5.1 RCPT first")
+            return
+        self.reply("354 End data with <CR><LF>.<CR><LF>")
+        size = 0
+        lines = [] if self.sink.keep_messages else None
+        while True:
+            line = self.rfile.readline(1 << 20)
+            if not line:
+                raise ConnectionError("client went away during DATA")
+            if line in (b'.\r\n', b'.\n'):
+                break
+            if line.startswith(b'..'):
+                line = line[1:]
+            size += len(line)
+            if lines is not None:
+                lines.append(line)
+
+        recipients, self.mail_from, self.recipients = self.recipients, None, []
+        outcome = self.sink._outcome()
+        if self.sink.latency:
+            time.sleep(self.sink.latency)
+        if outcome == 'disconnect':
+            self.sink._count('disconnects')
+            return False
+        if outcome == 'fail':
+            self.sink._count('rejected')
+            self.reply("451 4.3.0 Injected temporary failure")
+            return
+        self.sink._accept(recipients, size, b''.join(lines) if lines is not None else None)
+        self.reply("250 2.0.0 Queued")
+
+    def smtp_RSET(self, arg):
+        self.mail_from = None
+        self.recipients = []
+        self.reply("250 2.0.0 OK")
+
+    def smtp_NOOP(self, arg):
+        self.reply("250 2.0.0 OK")
+
+    def smtp_QUIT(self, arg):
+        self.reply("221 2.0.0 Bye")
+        return False
+
+
+class _ThreadingSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """A throwaway SMTP server with counters, latency and failure injection"""
+
+    def __init__(self, host='127.0.0.1', port=0, username=None, password=None,
+                 certfile=None, keyfile=None, latency=0.0, fail_rate=0.0,
+                 disconnect_rate=0.0, keep_messages=False, seed=None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.disconnect_rate = disconnect_rate
+        self.keep_messages = keep_messages
+        self.tls_context = None
+        if certfile:
+            self.tls_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self.tls_context.load_cert_chain(certfile, keyfile)
+        self.messages = []
+        self.stats = {'connections': 0, 'messages': 0, 'recipients': 0, 'bytes': 0,
+                      'rejected': 0, 'disconnects': 0, 'auth_failures': 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _outcome(self):
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.disconnect_rate:
+            return 'disconnect'
+        if roll < self.disconnect_rate + self.fail_rate:
+            return 'fail'
+        return 'ok'
+
+    def _accept(self, recipients, size, message):
+        with self._lock:
+            self.stats['messages'] += 1
+            self.stats['recipients'] += len(recipients)
+            self.stats['bytes'] += size
+            if message is not None:
+                self.messages.append((recipients, message))
+
+    def reset_stats(self):
+        with self._lock:
+            for key in self.stats:
+                self.stats[key] = 0
+            self.messages.clear()
+
+    def start(self):
+        """Serve in a background thread; returns self (port 0 picks a free port)"""
+        self._server = _ThreadingSMTPServer((self.host, self.port), _SMTPHandler)
+        self._server.sink = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='smtp-sink', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SMTP sink for testing")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2525)
+    parser.add_argument('--user', help="Require AUTH with this username")
+    parser.add_argument('--password')
+    parser.add_argument('--cert', help="PEM certificate; enables STARTTLS")
+    parser.add_argument('--key', help="PEM private key for --cert")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds to wait before answering DATA")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Fraction of messages answered with 451")
+    parser.add_argument('--disconnect-rate', type=float, default=0.0, help="Fraction of messages that drop the connection")
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.host, args.port, args.user, args.password, args.cert, args.key,
+                    args.latency, args.fail_rate, args.disconnect_rate).start()
+    print(f"📭 SMTP sink listening on {sink.host}:{sink.port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"📭 {sink.stats}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.stop()
+        print(f"📭 Final: {sink.stats}")
+
+
+if __name__ == "__main__":
+    main()
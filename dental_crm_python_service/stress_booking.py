@@ -0,0 +1,80 @@
+"""Hammer a single slot from many threads and check book_slot never overbooks.
+
+Needs a live MySQL database (same .env as the service):
+
+    python stress_booking.py --user-id 1 --date 2030-01-07 --time 10:00 --threads 50
+
+Unless --keep is given, the booked rows are deleted afterwards and that
+day's appointment_slots and hourly stats are rebuilt from appointments,
+so the next run starts from the same free seats.
+"""
+import argparse
+import sys
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+from database import Database
+from scheduling import slot_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent booking stress check")
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("--date", required=True, help="YYYY-MM-DD (a working day)")
+    parser.add_argument("--time", default="10:00")
+    parser.add_argument("--threads", type=int, default=50)
+    parser.add_argument("--keep", action="store_true", help="Keep the booked rows")
+    args = parser.parse_args()
+
+    # One connection per thread, all opened before the race starts
+    connections = [Database() for _ in range(args.threads)]
+    start = slot_start(args.date, args.time)
+    index = connections[0].get_slot_index(start.date())
+    remaining = sum(index.capacity(pid) - index.booked_count(pid, start) for pid in index.providers)
+    expected = min(max(remaining, 0), args.threads)
+
+    barrier = threading.Barrier(args.threads)
+    results = [None] * args.threads
+
+    def worker(i):
+        barrier.wait()
+        results[i] = connections[i].book_slot(args.user_id, args.date, args.time, "Reason: stress test")
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    statuses = Counter(r['status'] for r in results)
+    winners = [r for r in results if r['status'] == 'booked']
+
+    print(f"📊 {args.threads} threads: {dict(statuses)}")
+    print(f"📊 Winners per provider: {dict(Counter(r['provider_id'] for r in winners))}")
+
+    if not args.keep and winners:
+        db = connections[0]
+        cursor = db.connection.cursor()
+        ids = [r['appointment_id'] for r in winners]
+        cursor.execute(f"DELETE FROM appointments WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+        db.connection.commit()
+        cursor.close()
+        # The slot and hourly counters still count the deleted rows; rebuild them for the day
+        day_start = datetime.combine(start.date(), datetime.min.time())
+        if db.reconcile_slot_counts(day_start, day_start + timedelta(days=1)) is None:
+            print("⚠️ Could not reconcile appointment_slots; run slot_reconciler.py for this day")
+        if db.backfill_hourly_stats(start.date(), start.date() + timedelta(days=1)) is None:
+            print("⚠️ Could not rebuild appointment_stats_hourly; run analytics.py backfill for this day")
+
+    for db in connections:
+        db.close()
+
+    if statuses.get('error', 0) or len(winners) != expected:
+        print(f"❌ Expected exactly {expected} winner(s) and no errors")
+        sys.exit(1)
+    print(f"✅ Exactly {expected} winner(s) for {remaining} free seat(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Background persistence of chat messages for the WebSocket transport.
+
+/ws/chat keeps a conversation's history in memory, so saving each turn
+doesn't have to hold up the reply. Messages are queued here and written
+in order by one task with its own database connection. Once
+WS_PERSIST_QUEUE_SIZE messages are waiting, save() blocks until the
+writer catches up, which slows replies instead of growing memory.
+Whatever is still queued is flushed on shutdown.
+"""
+import asyncio
+from collections import defaultdict
+
+from config import config
+from database import Database
+
+
+class TurnWriter:
+    """Saves chat messages from a queue, one at a time, in arrival order"""
+
+    def __init__(self, database=None, max_pending=None):
+        self.database = database
+        self.max_pending = max_pending or config.WS_PERSIST_QUEUE_SIZE
+        self._queue = None
+        self._task = None
+        self.stats = defaultdict(int)
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.max_pending)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def save(self, session_id, sender, message):
+        """Queue a message; waits while the writer is max_pending behind"""
+        self._ensure_started()
+        if self._queue.full():
+            self.stats['waited_for_writer'] += 1
+        await self._queue.put((session_id, sender, message))
+
+    async def _run(self):
+        if self.database is None:
+            # Own connection: saves run in a worker thread alongside request handling
+            self.database = Database()
+        while True:
+            session_id, sender, message = await self._queue.get()
+            try:
+                saved = await asyncio.to_thread(self.database.save_message, session_id, sender, message)
+                self.stats['saved' if saved else 'failed'] += 1
+            except Exception as e:
+                print(f"⚠️ Failed to save {sender} message for session {session_id}: {e}")
+                self.stats['failed'] += 1
+            finally:
+                self._queue.task_done()
+
+    def status(self):
+        return {'pending': self._queue.qsize() if self._queue else 0, **self.stats}
+
+    async def close(self, timeout=10):
+        """Flush what is queued (up to timeout seconds) and stop"""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ {self._queue.qsize()} chat messages not saved before shutdown")
+        self._task.cancel()
+        self._task = None
+        if self.database is not None:
+            self.database.close()
+
+
+# Singleton instance
+turn_writer = TurnWriter()